@@ -0,0 +1,351 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Mapping
+import functools
+from http import HTTPStatus
+import os
+from typing import Any
+
+from slack_bolt import BoltResponse
+from slack_bolt.async_app import (
+    AsyncAck,
+    AsyncApp as AsyncSlackApp,
+    AsyncBoltRequest,
+    AsyncRespond,
+)
+from slack_bolt.oauth.async_oauth_settings import AsyncOAuthSettings
+from slack_sdk.http_retry.builtin_async_handlers import AsyncRateLimitErrorRetryHandler
+from slack_sdk.http_retry.request import HttpRequest
+from slack_sdk.http_retry.response import HttpResponse
+from slack_sdk.http_retry.state import RetryState
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.web.async_slack_response import AsyncSlackResponse
+import structlog
+
+from catalog import EmojiCatalog, RedisEmojiCatalog, catalog_for
+from config import BotTokenConfig, SlackOAuthConfig, app_config, app_credentials
+from digest import async_add_to_digest, async_flush_overdue_digests
+from emoji_search import normalize_query
+from event_queue import EmojiEventJob, async_enqueue
+from idemptotency import async_forget_seen_event, async_has_handled, async_has_seen_event, skipped_events
+from messages import EmojiSearchResultsMessage, EmojiUpdateMessage
+from metrics import ALIAS_SKIPS, POSTS, SKIPPED_EVENTS, SLACK_RATE_LIMIT_RETRIES, STAGE_SECONDS, api_method
+from outbound import async_outbound_scheduler
+from redis_utils import async_redis_client
+from routing import channels_for
+from slack_clients import AsyncWebClientPool
+from slack_enterprise.async_redis_installation_store import AsyncRedisInstallationStore
+from slack_enterprise.async_redis_oauth_state_store import AsyncRedisOAuthStateStore
+from slack_enterprise.installation_cache import InstallationCache
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+
+class AsyncCountingRateLimitErrorRetryHandler(AsyncRateLimitErrorRetryHandler):
+    """See metrics.CountingRateLimitErrorRetryHandler, kept here so that sync mode never imports the async handlers."""
+
+    async def prepare_for_next_attempt_async(
+        self,
+        *,
+        state: RetryState,
+        request: HttpRequest,
+        response: HttpResponse | None = None,
+        error: Exception | None = None,
+    ) -> None:
+        SLACK_RATE_LIMIT_RETRIES.labels(api_method(request)).inc()
+        await super().prepare_for_next_attempt_async(state=state, request=request, response=response, error=error)
+
+
+# See slack_app._slack_app_token
+_slack_app_token = os.environ.get("SLACK_BOT_TOKEN")
+if isinstance(app_credentials, SlackOAuthConfig):
+    _slack_app_token = None
+elif isinstance(app_credentials, BotTokenConfig):
+    _slack_app_token = app_credentials.token
+
+_client = AsyncWebClient(token=_slack_app_token, base_url=app_config.slack_api_url)
+_client.retry_handlers.append(
+    # Ensure we follow the backoff instructions
+    AsyncCountingRateLimitErrorRetryHandler(
+        # But strong prefer not to drop these, lol
+        max_retry_count=5,
+    ),
+)
+# See slack_app.web_clients
+async_web_clients = AsyncWebClientPool(
+    _client,
+    max_size=app_config.web_client_pool_max_size,
+    idle_timeout=app_config.web_client_idle_timeout,
+)
+# Keep references to the pending searches so they don't get garbage collected
+_background_tasks: set[asyncio.Task[None]] = set()
+
+
+def _oauth_settings(oauth: SlackOAuthConfig) -> AsyncOAuthSettings:
+    oauth_redis = async_redis_client(str(app_config.redis_host))
+    return AsyncOAuthSettings(
+        client_id=oauth.client_id.get_secret_value(),
+        client_secret=oauth.client_secret.get_secret_value(),
+        scopes=oauth.bot_scopes,
+        user_scopes=oauth.user_scopes,
+        installation_store=AsyncRedisInstallationStore(
+            redis_client=oauth_redis,
+            client_id=oauth.client_id.get_secret_value(),
+            history_max_entries=oauth.installation_history_max_entries,
+            cache=InstallationCache(
+                ttl=oauth.installation_cache_ttl,
+                max_entries=oauth.installation_cache_max_entries,
+            )
+            if oauth.installation_cache_ttl
+            else None,
+        ),
+        state_store=AsyncRedisOAuthStateStore(
+            redis_client=oauth_redis,
+            expiration_seconds=600,
+        ),
+    )
+
+
+async def skip_seen_events(
+    body: Mapping[str, Any],
+    req: AsyncBoltRequest,
+    next_: Callable[[], Awaitable[BoltResponse]],
+) -> BoltResponse:
+    """See slack_app.skip_seen_events."""
+    event_id = body.get("event_id")
+    if body.get("type") != "event_callback" or event_id is None:
+        return await next_()
+    if not await async_has_seen_event(event_id):
+        return await _unless_failed(event_id, next_)
+
+    retry_num = next(iter(req.headers.get("x-slack-retry-num", ())), None)
+    reason = "retry" if retry_num is not None else "duplicate"
+    skipped_events[reason] += 1
+    SKIPPED_EVENTS.labels(reason).inc()
+
+    logger.info(
+        "Skipping already seen event",
+        event_id=event_id,
+        retry_num=retry_num,
+        retry_reason=next(iter(req.headers.get("x-slack-retry-reason", ())), None),
+        skipped_events=dict(skipped_events),
+    )
+    return BoltResponse(status=200, body="")
+
+
+async def _unless_failed(event_id: str, next_: Callable[[], Awaitable[BoltResponse]]) -> BoltResponse:
+    """See slack_app._unless_failed."""
+    try:
+        response = await next_()
+    except Exception:
+        await async_forget_seen_event(event_id)
+        raise
+
+    if not HTTPStatus.OK <= response.status < HTTPStatus.MULTIPLE_CHOICES:
+        await async_forget_seen_event(event_id)
+    return response
+
+
+async def emoji_changed(
+    client: AsyncWebClient,
+    event: Mapping[str, Any],
+    context: Mapping[str, Any],
+) -> Mapping[str, Any]:
+    """See slack_app.emoji_changed."""
+    if app_config.queue_mode:
+        message_id = await async_enqueue(EmojiEventJob.from_context(event, context))
+        logger.info("Queued event", message_id=message_id, subtype=event.get("subtype"), name=event.get("name"))
+        return {"ok": True}
+
+    log = logger.bind(**{k: v for k, v in event.items() if k in ("name", "subtype", "type", "value")})
+    catalog = catalog_for(
+        context.get("enterprise_id"),
+        context.get("team_id"),
+        is_enterprise_tenant=context.get("is_enterprise_install", False),
+    )
+    await catalog.async_apply(event)
+
+    if event["subtype"] != "add":
+        log.info("Ignoring non-add event")
+        return {"ok": True}
+
+    log.info("New Emoji Added!")
+
+    user_client = async_web_clients.get(context.get("user_token") or client.token)
+    client = async_web_clients.get(client.token)
+    with STAGE_SECONDS.labels("get_emoji").time():
+        emoji = await catalog.async_get_emoji(user_client, event["name"], event["value"])
+
+    if emoji.is_alias and not app_config.should_report_alias_changes:
+        log.info("Skipping alias post")
+        ALIAS_SKIPS.inc()
+        return {"ok": True}
+
+    with STAGE_SECONDS.labels("has_handled").time():
+        handled = await async_has_handled(emoji.name, event["event_ts"])
+    if handled:
+        log.info("Already handled, skipping")
+        return {"ok": True}
+
+    channels = channels_for(
+        app_config.routes,
+        app_config.channel,
+        context.get("enterprise_id"),
+        context.get("team_id"),
+        emoji,
+    )
+
+    if app_config.digest_window:
+        for channel in channels:
+            await async_add_to_digest(
+                client,
+                channel,
+                emoji,
+                enterprise_id=context.get("enterprise_id"),
+                team_id=context.get("team_id"),
+            )
+        return {"ok": True}
+
+    update = EmojiUpdateMessage(emoji=emoji)
+
+    for channel in channels:
+        posted = async_outbound_scheduler.submit(
+            client,
+            "chat.postMessage",
+            channel=channel,
+            text=update.message(),
+            blocks=update.blocks(),
+        )
+        posted.add_done_callback(functools.partial(_log_post, log, channel))
+
+    return {"ok": True}
+
+
+async def emoji_search(
+    ack: AsyncAck,
+    respond: AsyncRespond,
+    command: Mapping[str, Any],
+    client: AsyncWebClient,
+    context: Mapping[str, Any],
+) -> None:
+    """See slack_app.emoji_search."""
+    query = normalize_query(command.get("text", ""))
+    if not query:
+        await ack(text="Search for emoji by name, e.g. `/emoji-search parrot`")
+        return
+
+    catalog = catalog_for(
+        context.get("enterprise_id"),
+        context.get("team_id"),
+        is_enterprise_tenant=context.get("is_enterprise_install", False),
+    )
+    names = await catalog.async_search_if_ready(query, app_config.emoji_search_max_results)
+    if names is not None:
+        await ack(**_emoji_search_results(query, names))
+        return
+
+    await ack()
+    # As a task of its own, as in queue mode Bolt only sends the ack once we return
+    _background_tasks.add(
+        task := asyncio.create_task(
+            _respond_to_emoji_search(
+                respond,
+                catalog,
+                async_web_clients.get(context.get("user_token") or client.token),
+                query,
+            ),
+        ),
+    )
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _respond_to_emoji_search(
+    respond: AsyncRespond,
+    catalog: EmojiCatalog | RedisEmojiCatalog,
+    client: AsyncWebClient,
+    query: str,
+) -> None:
+    """See slack_app._respond_to_emoji_search."""
+    try:
+        with STAGE_SECONDS.labels("emoji_search").time():
+            names = await catalog.async_search(client, query, app_config.emoji_search_max_results)
+        await respond(response_type="ephemeral", **_emoji_search_results(query, names))
+    except Exception:
+        logger.exception("Failed to search emoji", query=query)
+
+
+def _emoji_search_results(query: str, names: list[str]) -> dict[str, Any]:
+    """See slack_app._emoji_search_results."""
+    logger.info("Searched emoji", query=query, results=len(names))
+    results = EmojiSearchResultsMessage(query=query, names=names)
+    return {"text": results.message(), "blocks": results.blocks()}
+
+
+@functools.cache
+def get_async_slack_app() -> AsyncSlackApp:
+    """Same as slack_app.get_slack_app, but every listener runs as a coroutine on the event loop.
+
+    Only ever built from the event loop, so there's no need for a lock.
+    """
+    async_slack_app = AsyncSlackApp(
+        client=_client,
+        # In queue mode the listener only enqueues, so we make sure that's durable before acking
+        process_before_response=app_config.queue_mode,
+        before_authorize=skip_seen_events,
+        oauth_settings=_oauth_settings(app_credentials) if isinstance(app_credentials, SlackOAuthConfig) else None,
+    )
+    async_slack_app.event("emoji_changed")(emoji_changed)
+    async_slack_app.command("/emoji-search")(emoji_search)
+    return async_slack_app
+
+
+async def async_warm_up() -> None:
+    """See slack_app.warm_up."""
+    async_slack_app = get_async_slack_app()
+    if app_config.redis_host is not None:
+        await async_redis_client(str(app_config.redis_host)).ping()
+    if app_config.digest_window:
+        await async_flush_overdue_digests(async_tenant_client)
+
+    if async_slack_app.installation_store is not None:
+        return
+
+    client = async_web_clients.get(_client.token)
+    # Only for which workspace this is, AsyncApp still checks the token itself on the first event
+    auth = await client.auth_test()
+    await catalog_for(auth.get("enterprise_id"), auth.get("team_id")).async_prepare_search(client)
+
+
+async def async_tenant_client(enterprise_id: str | None, team_id: str | None) -> AsyncWebClient:
+    """See slack_app.tenant_clients, for just the bot client."""
+    bot_token = _client.token
+
+    installation_store = get_async_slack_app().installation_store
+    if installation_store is not None:
+        installation = await installation_store.async_find_installation(enterprise_id=enterprise_id, team_id=team_id)
+        if installation is None:
+            msg = f"No installation for {enterprise_id=} {team_id=}"
+            raise LookupError(msg)
+        bot_token = installation.bot_token
+
+    return async_web_clients.get(bot_token)
+
+
+def _log_post(
+    log: structlog.stdlib.BoundLogger,
+    channel: str,
+    posted: asyncio.Future[AsyncSlackResponse],
+) -> None:
+    """See slack_app._log_post."""
+    if (e := posted.exception()) is not None:
+        POSTS.labels(channel, "error").inc()
+        log.error("Failed to post to channel", channel=channel, exc_info=e)
+        return
+
+    POSTS.labels(channel, "ok").inc()
+    resp = posted.result()
+    log.info(
+        "Posted to channel",
+        channel=channel,
+        status_code=resp.status_code,
+        data=resp.data,
+    )
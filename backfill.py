@@ -0,0 +1,321 @@
+"""Posts about emoji added while we weren't listening, e.g. while down or mid-deploy, when Slack gave up on the events.
+
+    python backfill.py [--dry-run]
+
+Each run fetches every workspace's emoji list and compares it against the snapshot the last run left behind, going by a
+hash of each emoji's URL and uploader. Anything new (or replaced) since then that has_handled hasn't already recorded
+goes out as digests, routed like any other post, and the current list becomes the next run's snapshot. The first run
+for a workspace only takes a snapshot.
+
+With SLACK_APP_CATCH_UP_ON_STARTUP the web process does this itself when it starts, and again every
+SLACK_APP_CATCH_UP_INTERVAL. Snapshots live in Redis if there is one, otherwise in SLACK_APP_CATCH_UP_SNAPSHOT_DIR.
+"""
+
+import argparse
+from collections import Counter
+from collections.abc import Iterable, Mapping
+from concurrent.futures import wait
+from datetime import timedelta
+import hashlib
+from pathlib import Path
+import struct
+import threading
+import zlib
+
+import redis
+from slack_sdk import WebClient
+import structlog
+
+from config import app_config
+from emoji import CompactEmojiList, EmojiInfo, get_emoji_list
+from idemptotency import claim_unhandled, forget_handled
+from logging_config import configure_logging
+from messages import EmojiDigestMessage
+from outbound import outbound_scheduler
+from redis_utils import redis_client
+from routing import channels_for
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+# Workspace, as (enterprise_id, team_id)
+type _Workspace = tuple[str | None, str | None]
+
+
+class EmojiSnapshot:
+    """An 8 byte hash of each emoji's URL and uploader, by name."""
+
+    HASH_SIZE = 8
+
+    def __init__(self, hashes: Mapping[str, bytes]) -> None:
+        self.hashes = dict(hashes)
+
+    @classmethod
+    def from_emoji_list(cls: type["EmojiSnapshot"], emoji_list: CompactEmojiList) -> "EmojiSnapshot":
+        return cls(
+            {
+                name: hashlib.blake2b(f"{url}\0{uploaded_by or ''}".encode(), digest_size=cls.HASH_SIZE).digest()
+                for name, url, uploaded_by in emoji_list.rows()
+            },
+        )
+
+    def changed_since(self, previous: "EmojiSnapshot") -> list[str]:
+        """Emoji that are new, or have a different image or uploader, since `previous`.
+
+        A new name with the same image and uploader as one that's gone is the same emoji renamed, so isn't included.
+        """
+        before = previous.hashes
+        renamed_from = Counter(content for name, content in before.items() if name not in self.hashes)
+
+        changed = []
+        for name, content in self.hashes.items():
+            if before.get(name) == content:
+                continue
+            if name not in before and renamed_from[content] > 0:
+                renamed_from[content] -= 1
+                continue
+            changed.append(name)
+        return changed
+
+    def without(self, names: Iterable[str]) -> "EmojiSnapshot":
+        hashes = dict(self.hashes)
+        for name in names:
+            hashes.pop(name, None)
+        return EmojiSnapshot(hashes)
+
+    def dumps(self) -> bytes:
+        # Emoji names can't contain newlines, so: a count, every hash back to back, then the names one per line
+        names = "\n".join(self.hashes).encode()
+        return zlib.compress(struct.pack("<I", len(self.hashes)) + b"".join(self.hashes.values()) + names)
+
+    @classmethod
+    def loads(cls: type["EmojiSnapshot"], data: bytes) -> "EmojiSnapshot":
+        data = zlib.decompress(data)
+        (count,) = struct.unpack_from("<I", data)
+        hashes_end = 4 + count * cls.HASH_SIZE
+        names = data[hashes_end:].decode().split("\n") if count else []
+
+        return cls(
+            {name: data[4 + i * cls.HASH_SIZE : 4 + (i + 1) * cls.HASH_SIZE] for i, name in enumerate(names)},
+        )
+
+
+class LocalSnapshotStore:
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def _path(self, workspace: _Workspace) -> Path:
+        enterprise_id, team_id = workspace
+        return self.directory / f"snapshot-{enterprise_id or '-'}-{team_id or '-'}.bin"
+
+    def load(self, workspace: _Workspace) -> EmojiSnapshot | None:
+        path = self._path(workspace)
+        return EmojiSnapshot.loads(path.read_bytes()) if path.exists() else None
+
+    def save(self, workspace: _Workspace, snapshot: EmojiSnapshot) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Written aside and renamed into place, so a crash never leaves half a snapshot
+        scratch = self._path(workspace).with_suffix(".tmp")
+        scratch.write_bytes(snapshot.dumps())
+        scratch.replace(self._path(workspace))
+
+    def lock(self) -> threading.Lock:
+        return _local_lock
+
+
+_local_lock = threading.Lock()
+
+
+class RedisSnapshotStore:
+    # Long enough for a huge enterprise's emoji list, restarted before each workspace
+    LOCK_TIMEOUT = timedelta(minutes=10)
+
+    def __init__(self, redis_client: redis.Redis, key_prefix: str = "emoji-papertrail:snapshot") -> None:
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+
+    def _key(self, workspace: _Workspace) -> str:
+        enterprise_id, team_id = workspace
+        return f"{self.key_prefix}:{enterprise_id or '-'}:{team_id or '-'}"
+
+    def load(self, workspace: _Workspace) -> EmojiSnapshot | None:
+        data = self.redis_client.get(self._key(workspace))
+        return EmojiSnapshot.loads(data) if isinstance(data, bytes) else None
+
+    def save(self, workspace: _Workspace, snapshot: EmojiSnapshot) -> None:
+        self.redis_client.set(self._key(workspace), snapshot.dumps())
+
+    def lock(self) -> redis.lock.Lock:
+        """Held for a whole run, so every process starting at once doesn't fetch every emoji list."""
+        return self.redis_client.lock(f"{self.key_prefix}:lock", timeout=self.LOCK_TIMEOUT.total_seconds())
+
+
+def snapshot_store() -> RedisSnapshotStore | LocalSnapshotStore:
+    if app_config.redis_host is not None:
+        return RedisSnapshotStore(redis_client(str(app_config.redis_host)))
+    return LocalSnapshotStore(app_config.catch_up_snapshot_dir)
+
+
+def catch_up_workspace(  # noqa: PLR0913
+    client: WebClient,
+    user_client: WebClient,
+    workspace: _Workspace,
+    store: RedisSnapshotStore | LocalSnapshotStore,
+    *,
+    is_enterprise_tenant: bool = False,
+    dry_run: bool = False,
+) -> list[EmojiInfo]:
+    """Post about the workspace's emoji added since its last snapshot, returning them."""
+    enterprise_id, team_id = workspace
+    log = logger.bind(enterprise_id=enterprise_id, team_id=team_id)
+
+    emoji_list = get_emoji_list(user_client, is_enterprise_tenant=is_enterprise_tenant)
+    current = EmojiSnapshot.from_emoji_list(emoji_list)
+
+    previous = store.load(workspace)
+    if previous is None:
+        log.info("No emoji snapshot yet, taking one", emoji_count=len(emoji_list))
+        if not dry_run:
+            store.save(workspace, current)
+        return []
+
+    missed = []
+    for name in current.changed_since(previous):
+        try:
+            emoji = EmojiInfo.from_emoji_list(name, None, emoji_list)
+        except KeyError:
+            log.warning("Skipping alias of a missing emoji", emoji_name=name)
+            continue
+        if not emoji.is_alias or app_config.should_report_alias_changes:
+            missed.append(emoji)
+
+    if dry_run:
+        log.info("Would post missed emoji", emoji_names=[emoji.name for emoji in missed])
+        return missed
+
+    claimed = set(claim_unhandled([emoji.name for emoji in missed]))
+    missed = [emoji for emoji in missed if emoji.name in claimed]
+
+    failed = _post_digests(client, workspace, missed)
+    if failed:
+        # Leave them out of the snapshot (and unclaimed), so the next run tries again
+        forget_handled(failed)
+        current = current.without(failed)
+
+    store.save(workspace, current)
+    log.info("Caught up on missed emoji", posted=len(missed) - len(failed), failed=len(failed))
+    return missed
+
+
+def _post_digests(client: WebClient, workspace: _Workspace, emojis: list[EmojiInfo]) -> list[str]:
+    """Post the emoji as digests to wherever they're routed, returning the names of any that failed to go out."""
+    by_channel: dict[str, list[EmojiInfo]] = {}
+    for emoji in emojis:
+        for channel in channels_for(app_config.routes, app_config.channel, *workspace, emoji):
+            by_channel.setdefault(channel, []).append(emoji)
+
+    posts = {
+        outbound_scheduler.submit(
+            client,
+            "chat.postMessage",
+            channel=channel,
+            text=message.message(),
+            blocks=message.blocks(),
+        ): (channel, message)
+        for channel, channel_emojis in by_channel.items()
+        for message in EmojiDigestMessage.chunked(channel_emojis)
+    }
+    wait(posts)
+
+    failed: dict[str, None] = {}
+    for posted, (channel, message) in posts.items():
+        if (e := posted.exception()) is not None:
+            logger.error("Failed to post missed emoji", channel=channel, emoji_count=len(message.emojis), exc_info=e)
+            failed.update(dict.fromkeys(emoji.name for emoji in message.emojis))
+        else:
+            logger.info("Posted missed emoji", channel=channel, emoji_count=len(message.emojis))
+
+    return list(failed)
+
+
+def catch_up(*, dry_run: bool = False) -> None:
+    """Catch up every workspace we're installed in, unless another process already is."""
+    from slack_app import get_slack_app, tenant_clients
+
+    store = snapshot_store()
+    lock = store.lock()
+    if not lock.acquire(blocking=False):
+        logger.info("Another process is already catching up")
+        return
+
+    try:
+        installation_store = get_slack_app().installation_store
+        if installation_store is None:
+            client, user_client = tenant_clients(None, None)
+            auth = client.auth_test()
+            workspaces = [((auth.get("enterprise_id"), auth.get("team_id")), False)]
+        else:
+            workspaces = [
+                ((i.enterprise_id, i.team_id), i.is_enterprise_install)
+                for i in installation_store.installations()  # type: ignore[attr-defined]
+            ]
+
+        for workspace, is_enterprise_install in workspaces:
+            if not _keep_locked(lock):
+                logger.warning("Catch-up outlived its lock, leaving the rest to the next run")
+                return
+            try:
+                client, user_client = tenant_clients(*workspace, is_enterprise_install=is_enterprise_install)
+                catch_up_workspace(
+                    client,
+                    user_client,
+                    workspace,
+                    store,
+                    is_enterprise_tenant=is_enterprise_install,
+                    dry_run=dry_run,
+                )
+            except Exception:
+                logger.exception("Failed to catch up on missed emoji", enterprise_id=workspace[0], team_id=workspace[1])
+    finally:
+        try:
+            lock.release()
+        except redis.exceptions.LockNotOwnedError:
+            logger.warning("Catch-up outlived its lock")
+
+
+def _keep_locked(lock: "redis.lock.Lock | threading.Lock") -> bool:
+    """Restart the lock's timeout, so it lasts another workspace. False if it already ran out (another run may hold it)."""
+    if not isinstance(lock, redis.lock.Lock):
+        return True
+    try:
+        lock.reacquire()
+    except redis.exceptions.LockNotOwnedError:
+        return False
+    return True
+
+
+def start_catch_up(stop: threading.Event) -> threading.Thread:
+    """Catch up now, and then every catch_up_interval until `stop` is set."""
+
+    def run() -> None:
+        interval = app_config.catch_up_interval.total_seconds()
+        while True:
+            try:
+                catch_up()
+            except Exception:
+                logger.exception("Failed to catch up on missed emoji")
+
+            if not interval or stop.wait(interval):
+                return
+
+    thread = threading.Thread(target=run, name="catch-up", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Log what would be posted, without posting or saving")
+    args = parser.parse_args()
+
+    configure_logging()
+    catch_up(dry_run=args.dry_run)
@@ -0,0 +1,138 @@
+from pathlib import Path
+import secrets
+import threading
+from typing import Any
+
+import fakeredis
+import pytest
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.slack_response import SlackResponse
+
+import backfill
+from backfill import EmojiSnapshot, LocalSnapshotStore, RedisSnapshotStore, catch_up_workspace
+from emoji import CompactEmojiList
+from idemptotency import has_handled
+import slack_app
+
+
+def response(data: dict[str, Any], status_code: int = 200) -> SlackResponse:
+    return SlackResponse(
+        client=None,
+        http_verb="POST",
+        api_url="https://slack.com/api/",
+        req_args={},
+        data=data,
+        headers={},
+        status_code=status_code,
+    )
+
+
+class FakeClient:
+    """emoji.list from `emoji`, and records posts (failing them while `failing` is set)."""
+
+    def __init__(self) -> None:
+        self.token = "xoxb-test"  # noqa: S105
+        self.retry_handlers: list[Any] = []
+        self.emoji: dict[str, str] = {}
+        self.posts: list[dict[str, Any]] = []
+        self.failing = threading.Event()
+
+    def emoji_list(self) -> SlackResponse:
+        return response({"ok": True, "emoji": dict(self.emoji)})
+
+    def chat_postMessage(self, **kwargs: Any) -> SlackResponse:  # noqa: ANN401, N802
+        if self.failing.is_set():
+            msg = "fatal_error"
+            raise SlackApiError(msg, response({"ok": False}, 500))
+        self.posts.append(kwargs)
+        return response({"ok": True})
+
+
+def posted_emoji(post: dict[str, Any]) -> list[str]:
+    return [element.alt_text for block in post["blocks"][1:] for element in block.elements if element.type == "image"]
+
+
+def test_snapshot_round_trips_and_diffs():
+    emoji_list = CompactEmojiList(
+        (f"emoji-{i}", f"https://emoji.slack-edge.com/T0123/emoji-{i}/{i:016x}.png", f"U{i % 50}")
+        for i in range(100_000)
+    )
+    before = EmojiSnapshot.from_emoji_list(emoji_list)
+
+    emoji_list.add("emoji-1", "https://emoji.slack-edge.com/T0123/emoji-1/replaced.png", "U1")
+    emoji_list.add("brand-new", "alias:emoji-2")
+    after = EmojiSnapshot.loads(EmojiSnapshot.from_emoji_list(emoji_list).dumps())
+
+    assert after.changed_since(before) == ["emoji-1", "brand-new"]
+
+    del emoji_list["emoji-3"]
+    emoji_list.add("emoji-three", "https://emoji.slack-edge.com/T0123/emoji-3/0000000000000003.png", "U3")
+    assert EmojiSnapshot.from_emoji_list(emoji_list).changed_since(after) == [], "Renamed, not new"
+    assert after.changed_since(after) == []
+    assert EmojiSnapshot.loads(EmojiSnapshot({}).dumps()).hashes == {}
+
+
+def test_catch_up_posts_only_missed_emoji(tmp_path: Path):
+    client, store, workspace = FakeClient(), LocalSnapshotStore(tmp_path), (None, f"T{secrets.token_hex(4)}")
+    prefix = secrets.token_hex(4)
+    client.emoji = {f"{prefix}-old": "https://emoji.example.com/old.png"}
+
+    assert catch_up_workspace(client, client, workspace, store) == [], "The first run only takes a snapshot"  # type: ignore[arg-type]
+    assert client.posts == []
+
+    client.emoji |= {
+        f"{prefix}-missed": "https://emoji.example.com/missed.png",
+        f"{prefix}-seen": "https://emoji.example.com/seen.png",
+        f"{prefix}-alias": f"alias:{prefix}-old",
+    }
+    has_handled(f"{prefix}-seen", "1671070007.348400")
+
+    missed = catch_up_workspace(client, client, workspace, store)  # type: ignore[arg-type]
+
+    assert [emoji.name for emoji in missed] == [f"{prefix}-missed", f"{prefix}-alias"]
+    assert [posted_emoji(post) for post in client.posts] == [[f":{prefix}-missed:", f":{prefix}-alias:"]]
+    assert catch_up_workspace(client, client, workspace, store) == [], "Nothing new since the last run"  # type: ignore[arg-type]
+
+
+def test_catch_up_retries_emoji_it_failed_to_post(tmp_path: Path):
+    client, store, workspace = FakeClient(), LocalSnapshotStore(tmp_path), (None, f"T{secrets.token_hex(4)}")
+    name = f"{secrets.token_hex(4)}-missed"
+    catch_up_workspace(client, client, workspace, store)  # type: ignore[arg-type]
+
+    client.emoji[name] = "https://emoji.example.com/missed.png"
+    client.failing.set()
+    catch_up_workspace(client, client, workspace, store)  # type: ignore[arg-type]
+    assert client.posts == []
+
+    client.failing.clear()
+    catch_up_workspace(client, client, workspace, store)  # type: ignore[arg-type]
+    assert [posted_emoji(post) for post in client.posts] == [[f":{name}:"]]
+
+
+def test_catch_up_stops_once_it_outlives_its_lock(monkeypatch: pytest.MonkeyPatch):
+    store = RedisSnapshotStore(fakeredis.FakeRedis())
+    workspaces = [(None, "T1"), (None, "T2")]
+    caught_up = []
+
+    class FakeInstallationStore:
+        def installations(self) -> list[Any]:
+            return [
+                type("Installation", (), {"enterprise_id": e, "team_id": t, "is_enterprise_install": False})
+                for e, t in workspaces
+            ]
+
+    def slow_catch_up(*args: Any, **_kwargs: Any) -> list[Any]:  # noqa: ANN401
+        caught_up.append(args[2])
+        store.redis_client.delete(f"{store.key_prefix}:lock")  # As if it timed out
+        return []
+
+    monkeypatch.setattr(backfill, "snapshot_store", lambda: store)
+    monkeypatch.setattr(backfill, "catch_up_workspace", slow_catch_up)
+    monkeypatch.setattr(
+        slack_app, "get_slack_app", lambda: type("App", (), {"installation_store": FakeInstallationStore()})
+    )
+    monkeypatch.setattr(slack_app, "tenant_clients", lambda *_args, **_kwargs: (FakeClient(), FakeClient()))
+
+    backfill.catch_up()
+
+    assert caught_up == [(None, "T1")], "Another run may have the lock by now"
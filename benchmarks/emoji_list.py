@@ -0,0 +1,77 @@
+"""Build time, memory, and lookup time of emoji.CompactEmojiList, against the dict of EmojiListEntry it replaced.
+
+    python -m benchmarks.emoji_list --emoji 50000 --uploaders 2000
+
+Builds both from the same synthetic admin.emoji.list response, with Slack-shaped URLs and every tenth emoji an alias.
+Memory is what's still allocated once the response itself is excluded, so it's what each worker would hold on to.
+"""
+
+import argparse
+from collections.abc import Callable, Mapping
+import random
+import time
+import tracemalloc
+from typing import Any
+
+from emoji import CompactEmojiList, EmojiListEntry
+
+
+def admin_emoji_list(emoji: int, uploaders: int) -> dict[str, dict[str, Any]]:
+    rng = random.Random(0)  # noqa: S311
+    response: dict[str, dict[str, Any]] = {}
+    names: list[str] = []
+    for i in range(emoji):
+        name = f"emoji-{i}-{rng.randbytes(3).hex()}"
+        names.append(name)
+        url = (
+            f"alias:{rng.choice(names)}"
+            if i % 10 == 9  # noqa: PLR2004
+            else f"https://emoji.slack-edge.com/T0123ABCD/{name}/{rng.randbytes(8).hex()}.png"
+        )
+        response[name] = {"url": url, "uploaded_by": f"U{rng.randrange(uploaders):08d}", "date_created": 1671070007}
+    return response
+
+
+def measure(name: str, build: Callable[[], Mapping[str, EmojiListEntry]]) -> None:
+    # Timed separately, since tracing allocations slows everything down
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    emoji_list = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    names = list(emoji_list)
+    start = time.perf_counter()
+    for emoji_name in names:
+        emoji_list[emoji_name]
+    per_lookup = (time.perf_counter() - start) / len(names)
+
+    print(  # noqa: T201
+        f"{name:<20} build={elapsed * 1000:>8.1f}ms  retained={current / 2**20:>7.1f}MiB  "
+        f"peak={peak / 2**20:>7.1f}MiB  lookup={per_lookup * 1_000_000:>6.2f}us",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emoji", type=int, default=50_000)
+    parser.add_argument("--uploaders", type=int, default=2_000)
+    args = parser.parse_args()
+
+    response = admin_emoji_list(args.emoji, args.uploaders)
+
+    def models() -> dict[str, EmojiListEntry]:
+        return {name: EmojiListEntry.model_validate({"name": name, **info}) for name, info in response.items()}
+
+    def compact() -> CompactEmojiList:
+        return CompactEmojiList((name, info["url"], info["uploaded_by"]) for name, info in response.items())
+
+    measure("dict[EmojiListEntry]", models)
+    measure("CompactEmojiList", compact)
+
+
+if __name__ == "__main__":
+    main()
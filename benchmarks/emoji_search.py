@@ -0,0 +1,90 @@
+"""Build time, memory, and query time of emoji_search.EmojiSearchIndex, what /emoji-search answers from.
+
+    python -m benchmarks.emoji_search --emoji 100000
+
+Names are made of one to three words from a made up vocabulary, joined by `-` or `_` and sometimes numbered, so they
+share prefixes and substrings the way real ones do (`party-parrot`, `partyparrot2`, `blob-party`, ...). Queries are
+whole names, the start of a name, a word from the middle of one, a name with a typo, and nonsense, each timed on its
+own, along with adding and removing names.
+"""
+
+import argparse
+from collections.abc import Callable
+import random
+import statistics
+import time
+import tracemalloc
+
+from emoji_search import EmojiSearchIndex
+
+_SYLLABLES = [c + v for c in "bcdfghjklmnprstvwz" for v in "aeiou"] + ["ing", "er", "ly", "oo", "sh", "th"]
+
+
+def emoji_names(emoji: int, rng: random.Random) -> list[str]:
+    words = list({"".join(rng.choices(_SYLLABLES, k=rng.randint(1, 4))) for _ in range(emoji // 20)})
+    names: set[str] = set()
+    while len(names) < emoji:
+        name = rng.choice("-_").join(rng.choices(words, k=rng.choice((1, 2, 2, 3))))
+        if rng.random() < 0.2:  # noqa: PLR2004
+            name += str(rng.randint(1, 20))
+        names.add(name)
+    return list(names)
+
+
+def queries(names: list[str], count: int, rng: random.Random) -> dict[str, list[str]]:
+    def typo(name: str) -> str:
+        i = rng.randrange(len(name))
+        return name[:i] + name[i + 1 :]
+
+    picked = rng.sample(names, count)
+    return {
+        "exact": picked,
+        "prefix": [name[: rng.randint(1, 5)] for name in picked],
+        "substring": [max(name.replace("_", "-").split("-"), key=len) for name in picked],
+        "typo": [typo(name) for name in picked],
+        "miss": ["".join(rng.choices("qxjz", k=rng.randint(3, 8))) for _ in range(count)],
+    }
+
+
+def timed(action: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    action()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emoji", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=1_000, help="Queries of each kind")
+    parser.add_argument("--limit", type=int, default=20, help="Results per query")
+    args = parser.parse_args()
+
+    rng = random.Random(0)  # noqa: S311
+    names = emoji_names(args.emoji, rng)
+
+    elapsed = timed(lambda: EmojiSearchIndex(names))
+    # Measured separately, since tracing allocations slows everything down
+    tracemalloc.start()
+    index = EmojiSearchIndex(names)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"build={elapsed * 1000:.1f}ms  retained={retained / 2**20:.1f}MiB")  # noqa: T201
+
+    for kind, kind_queries in queries(names, args.queries, rng).items():
+        timings = [timed(lambda query=query: index.search(query, args.limit)) for query in kind_queries]  # type: ignore[misc]
+        quantiles = statistics.quantiles(timings, n=100)
+        print(  # noqa: T201
+            f"{kind:>10}: p50={quantiles[49] * 1000:.3f}ms  p99={quantiles[98] * 1000:.3f}ms  "
+            f"max={max(timings) * 1000:.3f}ms",
+        )
+
+    added = [f"{name}-new" for name in rng.sample(names, args.queries)]
+    adds = [timed(lambda name=name: index.add(name)) for name in added]  # type: ignore[misc]
+    removes = [timed(lambda name=name: index.remove(name)) for name in added]  # type: ignore[misc]
+    print(  # noqa: T201
+        f"add={statistics.median(adds) * 1e6:.1f}us  remove={statistics.median(removes) * 1e6:.1f}us",
+    )
+
+
+if __name__ == "__main__":
+    main()
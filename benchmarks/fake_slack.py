@@ -0,0 +1,179 @@
+"""A local stand-in for the bits of the Slack Web API we call, for load testing."""
+
+from collections import Counter
+from collections.abc import Iterator
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import sys
+import threading
+import time
+from typing import Any
+from urllib.parse import parse_qs
+
+# Emoji image URLs in the posts we get, which is how we tell which emoji a post was for
+_POSTED_EMOJI = re.compile(rb"https://emoji\.example\.com/([^\"/]+)\.png")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections under any real burst
+    request_queue_size = 1024
+    # Accepted so far, only ever updated from the serving thread
+    connections = 0
+
+    def process_request(self, request: Any, client_address: Any) -> None:  # noqa: ANN401
+        self.connections += 1
+        super().process_request(request, client_address)
+
+    def handle_error(self, request: object, client_address: object) -> None:
+        # Clients hanging up on us mid-response isn't interesting
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)  # type: ignore[arg-type]
+
+
+class FakeSlack:
+    def __init__(
+        self,
+        *,
+        latency: float = 0.05,
+        catalog_size: int = 1000,
+        rate_limit: float = 0.0,
+        retry_after: int = 1,
+        admin_page_size: int = 1000,
+    ) -> None:
+        self.latency = latency
+        self.catalog = {f"catalog-emoji-{i}": f"https://emoji.example.com/{i}.png" for i in range(catalog_size)}
+        # Fraction of calls answered with a 429 and `Retry-After: retry_after` instead
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.admin_page_size = admin_page_size
+
+        self.calls: Counter[str] = Counter()
+        self.rate_limited: Counter[str] = Counter()
+        # Emoji name -> when the first post mentioning it arrived, in time.perf_counter()
+        self.posted: dict[str, float] = {}
+        self._calls_changed = threading.Condition()
+        self._random = random.Random(0)  # noqa: S311
+
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+
+    @property
+    def connections(self) -> int:
+        return self._server.connections
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}/api/"
+
+    def wait_for(self, method: str, count: int, timeout: float = 60) -> None:
+        with self._calls_changed:
+            if not self._calls_changed.wait_for(lambda: self.calls[method] >= count, timeout=timeout):
+                msg = f"Only saw {self.calls[method]}/{count} calls to {method}"
+                raise TimeoutError(msg)
+
+    @contextlib.contextmanager
+    def running(self) -> Iterator["FakeSlack"]:
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def respond(self, method: str, params: dict[str, str]) -> dict[str, Any]:
+        match method:
+            case "auth.test":
+                return {"ok": True, "team_id": "T0BENCH", "user_id": "U0BENCH", "bot_id": "B0BENCH"}
+            case "emoji.list":
+                return {"ok": True, "emoji": self.catalog}
+            case "admin.emoji.list":
+                return self._admin_emoji_page(int(params.get("cursor") or 0))
+            case "chat.postMessage":
+                return {"ok": True, "channel": "C0BENCH", "ts": f"{time.time():.6f}"}
+            case _:
+                return {"ok": False, "error": "unknown_method"}
+
+    def _admin_emoji_page(self, offset: int) -> dict[str, Any]:
+        names = list(self.catalog)[offset : offset + self.admin_page_size]
+        next_offset = offset + len(names)
+        return {
+            "ok": True,
+            "emoji": {
+                name: {"url": self.catalog[name], "date_created": 1671070007, "uploaded_by": "U0BENCH"}
+                for name in names
+            },
+            "response_metadata": {"next_cursor": str(next_offset) if next_offset < len(self.catalog) else ""},
+        }
+
+    def should_rate_limit(self, method: str) -> bool:
+        with self._calls_changed:
+            if self._random.random() >= self.rate_limit:
+                return False
+
+            self.rate_limited[method] += 1
+            return True
+
+    def record(self, method: str, body: bytes) -> None:
+        now = time.perf_counter()
+        with self._calls_changed:
+            self.calls[method] += 1
+            if method == "chat.postMessage":
+                for name in _POSTED_EMOJI.findall(body):
+                    self.posted.setdefault(name.decode(), now)
+            self._calls_changed.notify_all()
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Otherwise the body waits on the client ACKing the headers, which only shows up once connections are reused
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                self._handle()
+
+            def do_POST(self) -> None:
+                self._handle()
+
+            def log_message(self, *_args: object) -> None:
+                pass
+
+            def _handle(self) -> None:
+                path, _, query = self.path.partition("?")
+                method = path.removeprefix("/api/")
+                request_body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+                time.sleep(fake.latency)
+                if fake.should_rate_limit(method):
+                    self._send(429, {"ok": False, "error": "ratelimited"}, {"Retry-After": str(fake.retry_after)})
+                    return
+
+                body = fake.respond(method, self._params(query, request_body))
+                fake.record(method, request_body)
+                self._send(200, body)
+
+            def _params(self, query: str, body: bytes) -> dict[str, str]:
+                params = {k: v[0] for k, v in parse_qs(query).items()}
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params.update({k: str(v) for k, v in json.loads(body or b"{}").items()})
+                else:
+                    params.update({k: v[0] for k, v in parse_qs(body.decode()).items()})
+                return params
+
+            def _send(self, status: int, body: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
@@ -0,0 +1,86 @@
+"""Checking a batch of emoji with has_handled_many, against calling has_handled for each.
+
+    python -m benchmarks.idempotency_batch --batch-sizes 1 10 100 1000 --redis-url redis://localhost:6379/15
+
+For each batch size, checks `--emoji` new emoji (and then the same ones again, which all come back handled) a batch at
+a time, both ways, and reports the median time per batch and per emoji. Against Redis every has_handled is a round trip,
+where has_handled_many is one per batch. LocalIdempotencyStore is there for comparison.
+
+Redis is fakeredis's TCP server unless --redis-url is given, which is much slower per command than a real Redis, so
+only use it to compare the two ways with each other. Keys are left to expire, so point --redis-url at a scratch
+database.
+"""
+
+import argparse
+from collections.abc import Callable
+import contextlib
+import itertools
+import statistics
+import time
+
+import redis
+
+from benchmarks.load import redis_url
+from idemptotency import LocalIdempotencyStore, has_handled, has_handled_many
+
+type _Store = redis.Redis | LocalIdempotencyStore
+
+_run = itertools.count()
+
+
+def one_at_a_time(batch: list[tuple[str, str]], store: _Store) -> list[bool]:
+    return [has_handled(name, event_ts, store) for name, event_ts in batch]
+
+
+def measure(
+    check: Callable[[list[tuple[str, str]], _Store], list[bool]],
+    store: _Store,
+    batch_size: int,
+    emoji: int,
+) -> list[float]:
+    """Seconds each batch took, first with new emoji and then with the same ones again."""
+    # Names nothing else has used, so the first pass is all misses
+    run = next(_run)
+    names = [f"benchmark-{time.time_ns()}-{run}-{i}" for i in range(emoji)]
+    batches = [[(name, "1671070007.348400") for name in names[i : i + batch_size]] for i in range(0, emoji, batch_size)]
+
+    timings = []
+    for expected in (False, True):
+        for batch in batches:
+            start = time.perf_counter()
+            handled = check(batch, store)
+            timings.append(time.perf_counter() - start)
+            assert handled == [expected] * len(batch)  # noqa: S101
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--emoji", type=int, default=5000, help="Emoji to check at each batch size, twice over")
+    parser.add_argument("--redis-url", default=None, help="Use this Redis instead of fakeredis")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        stores: dict[str, _Store] = {
+            "redis": redis.Redis.from_url(stack.enter_context(redis_url(args))),
+            "local": LocalIdempotencyStore(max_entries=4 * args.emoji * len(args.batch_sizes)),
+        }
+
+        for (store_name, store), batch_size in itertools.product(stores.items(), args.batch_sizes):
+            emoji = max(args.emoji, batch_size)
+            results = {
+                way: statistics.median(measure(check, store, batch_size, emoji))
+                for way, check in (("one_at_a_time", one_at_a_time), ("batched", has_handled_many))
+            }
+            print(  # noqa: T201
+                f"{store_name:>5} batch={batch_size:<5} "
+                + "  ".join(
+                    f"{way}={t * 1000:.3f}ms/batch ({t / batch_size * 1e6:.1f}us/emoji)" for way, t in results.items()
+                )
+                + f"  speedup={results['one_at_a_time'] / results['batched']:.1f}x",
+            )
+
+
+if __name__ == "__main__":
+    main()
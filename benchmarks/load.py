@@ -0,0 +1,293 @@
+"""End-to-end load test of main.app against a local stand-in for the Slack Web API.
+
+    python -m benchmarks.load --events 500 --concurrency 50 --latency 0.05
+    python -m benchmarks.load --modes async --stores redis --tenants standard enterprise --rate-limit 0.05
+
+Replays correctly signed emoji_changed events into main.app over ASGI, and waits for every one of them to be posted.
+Reports ack latency (how long Slack waits on us), end-to-end latency (event sent to chat.postMessage received),
+events/sec end-to-end, and how many connections were opened to the fake Slack API.
+
+Every combination of mode (sync/async), store (local/redis) and tenant (standard/enterprise) runs in its own
+interpreter, since they're all chosen from config at import time. Redis is fakeredis's TCP server unless --redis-url is
+given. Enterprise tenants authorize through an OAuth installation and list emoji with admin.emoji.list, so they always
+use Redis.
+
+Every event posts to the same channel, so posts go one at a time. They aren't paced at Slack's per-channel rate unless
+--post-rate says so.
+"""
+
+import argparse
+import asyncio
+from collections.abc import Iterator
+import contextlib
+import itertools
+import json
+import logging
+import os
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Any
+
+from fakeredis import TcpFakeServer
+import httpx
+from slack_sdk.signature import SignatureVerifier
+import structlog
+
+from benchmarks.fake_slack import FakeSlack
+
+SIGNING_SECRET = "benchmark-signing-secret"  # noqa: S105
+CLIENT_ID = "benchmark-client-id"
+ENTERPRISE_ID = "E0BENCH"
+TEAM_ID = "T0BENCH"
+
+
+class _FakeRedisServer(TcpFakeServer):
+    daemon_threads = True
+    block_on_close = False
+
+    def get_request(self) -> tuple[socket.socket, Any]:
+        request, client_address = super().get_request()
+        # It writes each reply to a pipeline separately, which would otherwise sit out the client's delayed ACKs
+        request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return request, client_address
+
+
+def emoji_url(name: str) -> str:
+    return f"https://emoji.example.com/{name}.png"
+
+
+def signed_emoji_changed(name: str, *, enterprise: bool = False) -> tuple[bytes, dict[str, str]]:
+    now = time.time()
+    tenant = (
+        {
+            "enterprise_id": ENTERPRISE_ID,
+            "authorizations": [
+                {
+                    "enterprise_id": ENTERPRISE_ID,
+                    "team_id": None,
+                    "user_id": "U0BENCH",
+                    "is_bot": True,
+                    "is_enterprise_install": True,
+                },
+            ],
+        }
+        if enterprise
+        else {}
+    )
+    body = json.dumps(
+        {
+            "token": "benchmark",
+            "team_id": TEAM_ID,
+            "api_app_id": "A0BENCH",
+            "type": "event_callback",
+            "event_id": f"Ev{secrets.token_hex(8)}",
+            "event_time": int(now),
+            "event": {
+                "type": "emoji_changed",
+                "subtype": "add",
+                "name": name,
+                "value": emoji_url(name),
+                "event_ts": f"{now:.6f}",
+            },
+            **tenant,
+        },
+    ).encode()
+
+    timestamp = str(int(now))
+    headers = {
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": SignatureVerifier(SIGNING_SECRET).generate_signature(timestamp=timestamp, body=body) or "",
+    }
+    return body, headers
+
+
+async def _burst(
+    fake: FakeSlack,
+    names: list[str],
+    concurrency: int,
+    *,
+    enterprise: bool,
+    post_timeout: float,
+) -> tuple[list[float], dict[str, float]]:
+    from main import app
+
+    ack_latencies: list[float] = []
+    sent_at: dict[str, float] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+
+        async def send(name: str) -> None:
+            body, headers = signed_emoji_changed(name, enterprise=enterprise)
+            async with semaphore:
+                sent_at[name] = start = time.perf_counter()
+                resp = await client.post("/slack/events", content=body, headers=headers)
+                ack_latencies.append(time.perf_counter() - start)
+            resp.raise_for_status()
+
+        await asyncio.gather(*(send(name) for name in names))
+        # Keep the loop running while async mode's listeners finish up in the background
+        await asyncio.to_thread(fake.wait_for, "chat.postMessage", len(names), post_timeout)
+
+    return ack_latencies, sent_at
+
+
+def _save_enterprise_installation() -> None:
+    from slack_sdk.oauth.installation_store.models.installation import Installation
+
+    from config import app_config
+    from redis_utils import redis_client
+    from slack_enterprise.redis_installation_store import RedisInstallationStore
+
+    RedisInstallationStore(redis_client=redis_client(str(app_config.redis_host)), client_id=CLIENT_ID).save(
+        Installation(
+            app_id="A0BENCH",
+            enterprise_id=ENTERPRISE_ID,
+            team_id=None,
+            user_id="U0BENCH",
+            bot_token="xoxb-benchmark",  # noqa: S106
+            bot_id="B0BENCH",
+            bot_user_id="U0BENCHBOT",
+            user_token="xoxp-benchmark",  # noqa: S106
+            is_enterprise_install=True,
+        ),
+    )
+
+
+def _ms_quantiles(seconds: list[float]) -> tuple[float, float]:
+    quantiles = statistics.quantiles(seconds, n=100)
+    return quantiles[49] * 1000, quantiles[98] * 1000
+
+
+def run_variant(args: argparse.Namespace) -> None:
+    logging.disable(logging.WARNING)
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+    enterprise = args.variant_tenant == "enterprise"
+    # Unique per run, so a reused --redis-url doesn't think they've all been posted already
+    names = [f"bench-{secrets.token_hex(4)}-{i}" for i in range(args.events)]
+
+    with FakeSlack(
+        latency=args.latency,
+        catalog_size=args.catalog_size,
+        rate_limit=args.rate_limit,
+        admin_page_size=args.admin_page_size,
+    ).running() as fake:
+        # Slack would already list the emoji by the time it tells us about them
+        fake.catalog.update({name: emoji_url(name) for name in names})
+        os.environ["SLACK_APP_SLACK_API_URL"] = fake.url
+        if enterprise:
+            _save_enterprise_installation()
+
+        start = time.perf_counter()
+        ack_latencies, sent_at = asyncio.run(
+            _burst(fake, names, args.concurrency, enterprise=enterprise, post_timeout=args.timeout),
+        )
+        elapsed = time.perf_counter() - start
+
+        ack_p50, ack_p99 = _ms_quantiles(ack_latencies)
+        e2e_p50, e2e_p99 = _ms_quantiles([fake.posted[name] - sent_at[name] for name in names if name in fake.posted])
+        result = {
+            "events_per_s": args.events / elapsed,
+            "ack_p50_ms": ack_p50,
+            "ack_p99_ms": ack_p99,
+            "e2e_p50_ms": e2e_p50,
+            "e2e_p99_ms": e2e_p99,
+            "emoji_list_calls": fake.calls["emoji.list"] + fake.calls["admin.emoji.list"],
+            "rate_limited": sum(fake.rate_limited.values()),
+            "connections": fake.connections,
+        }
+
+    print(json.dumps(result))  # noqa: T201
+
+
+@contextlib.contextmanager
+def redis_url(args: argparse.Namespace) -> Iterator[str]:
+    if args.redis_url is not None:
+        yield args.redis_url
+        return
+
+    server = _FakeRedisServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address[:2]
+        yield f"redis://{host!s}:{port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def variant_env(mode: str, tenant: str, url: str | None, post_rate: float) -> dict[str, str]:
+    env = {
+        **os.environ,
+        "SLACK_SIGNING_SECRET": SIGNING_SECRET,
+        "SLACK_APP_ASYNC_MODE": str(mode == "async"),
+        # Every post goes to the same channel, so by default don't pace them the way Slack would need us to
+        "SLACK_APP_OUTBOUND_CHANNEL_RATE": str(post_rate),
+        "SLACK_APP_OUTBOUND_CHANNEL_BURST": str(max(int(post_rate), 1)),
+        "SLACK_APP_OUTBOUND_METHOD_RATE": str(post_rate),
+        "SLACK_APP_OUTBOUND_METHOD_BURST": str(max(int(post_rate), 1)),
+    }
+    if url is not None:
+        env["SLACK_APP_REDIS_HOST"] = url
+
+    if tenant == "enterprise":
+        env.pop("SLACK_BOT_TOKEN", None)
+        env.pop("BOT_TOKEN", None)
+        env.update(OAUTH_CLIENT_ID=CLIENT_ID, OAUTH_CLIENT_SECRET="benchmark-client-secret")  # noqa: S106
+    else:
+        env["SLACK_BOT_TOKEN"] = "xoxb-benchmark"  # noqa: S105
+
+    return env
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds each fake Slack API call takes")
+    parser.add_argument("--catalog-size", type=int, default=1000)
+    parser.add_argument("--admin-page-size", type=int, default=1000, help="Emoji per admin.emoji.list page")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Fraction of Slack API calls answered with 429")
+    parser.add_argument("--post-rate", type=float, default=1e6, help="Posts/sec the outbound scheduler allows")
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    parser.add_argument("--stores", nargs="+", choices=["local", "redis"], default=["local", "redis"])
+    parser.add_argument("--tenants", nargs="+", choices=["standard", "enterprise"], default=["standard"])
+    parser.add_argument("--redis-url", default=None, help="Use this Redis instead of fakeredis")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--variant-tenant", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant_tenant is not None:
+        run_variant(args)
+        return
+
+    for mode, store, tenant in itertools.product(args.modes, args.stores, args.tenants):
+        if tenant == "enterprise" and store == "local":
+            continue
+
+        with contextlib.ExitStack() as stack:
+            url = stack.enter_context(redis_url(args)) if store == "redis" else None
+            out = subprocess.run(  # noqa: S603
+                [sys.executable, "-m", "benchmarks.load", *sys.argv[1:], "--variant-tenant", tenant],
+                env=variant_env(mode, tenant, url, args.post_rate),
+                capture_output=True,
+                check=True,
+                text=True,
+            )
+
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        print(  # noqa: T201
+            f"{mode:>5} {store:>5} {tenant:>10}: " + "  ".join(f"{k}={v:.2f}" for k, v in result.items()),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Throughput and memory of idemptotency.LocalIdempotencyStore at 1M keys.
+
+    python -m benchmarks.local_idempotency_store --keys 1000000
+
+Runs three workloads: filling the store with distinct keys, churning through many more keys than `max_entries`
+(memory should stay flat), and keys expiring as fast as they're set (memory should stay near zero).
+"""
+
+import argparse
+from collections.abc import Callable
+from datetime import timedelta
+import time
+import tracemalloc
+
+import time_machine
+
+from idemptotency import LocalIdempotencyStore
+
+
+def measure(name: str, keys: int, workload: Callable[[], LocalIdempotencyStore]) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = workload()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(  # noqa: T201
+        f"{name:<10} {keys / elapsed:>12,.0f} sets/s  entries={len(store):>9,}  "
+        f"retained={current / 2**20:>7.1f}MiB  peak={peak / 2**20:>7.1f}MiB",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=1_000_000)
+    parser.add_argument("--max-entries", type=int, default=100_000)
+    args = parser.parse_args()
+
+    def fill() -> LocalIdempotencyStore:
+        store = LocalIdempotencyStore(max_entries=args.keys)
+        for i in range(args.keys):
+            store.set(f"emoji-papertrail:idempotency:emoji-{i}", "1671070007.348400", ex=timedelta(days=7))
+        return store
+
+    def churn() -> LocalIdempotencyStore:
+        store = LocalIdempotencyStore(max_entries=args.max_entries)
+        for i in range(args.keys):
+            store.set(f"emoji-papertrail:idempotency:emoji-{i}", "1671070007.348400", ex=timedelta(days=7))
+        return store
+
+    def expire() -> LocalIdempotencyStore:
+        store = LocalIdempotencyStore(max_entries=args.keys)
+        with time_machine.travel(0, tick=False) as tm:
+            for i in range(args.keys):
+                store.set(f"emoji-papertrail:idempotency:emoji-{i}", "1671070007.348400", ex=timedelta(seconds=1))
+                tm.shift(timedelta(seconds=0.1))
+        return store
+
+    measure("fill", args.keys, fill)
+    measure("churn", args.keys, churn)
+    measure("expire", args.keys, expire)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""How long a log call holds up the code doing the logging, with logging_config's pipeline and with structlog's default.
+
+    python -m benchmarks.log_overhead --lines 20000
+
+Logs lines like the ones around each post: a short one, one with a whole Slack API response (`data=resp.data`, as in
+slack_app.py), and one with an exception. Output goes to /dev/null, so this is the cost of rendering and writing,
+not of a slow terminal or log collector, which would only make the inline variants worse.
+
+- default: structlog's out of the box ConsoleRenderer, rendered and printed inline
+- inline: logging_config, with EMOJI_PAPERTRAIL_LOG_BACKGROUND=false
+- background: logging_config as deployed, timed up to the writer's queue (the queue is drained between lines, so
+  this doesn't count dropped lines)
+"""
+
+import argparse
+from pathlib import Path
+import statistics
+import time
+from typing import Any, BinaryIO, TextIO
+
+import structlog
+
+from config import ServerConfig
+from logging_config import configure_logging
+
+_RESPONSE: dict[str, Any] = {
+    "ok": True,
+    "channel": "C0123456789",
+    "ts": "1671070007.348400",
+    "message": {
+        "type": "message",
+        "text": "New emoji :party-parrot:",
+        "blocks": [
+            {"type": "section", "text": {"type": "mrkdwn", "text": f"New emoji :party-parrot-{i}: " * 20}}
+            for i in range(40)
+        ],
+    },
+}
+
+
+def _log_lines(log: structlog.stdlib.BoundLogger) -> None:
+    log.info("Posted to channel", channel="#emoji-papertrail", name="party-parrot")
+    log.info("Slack response", data=_RESPONSE)
+    try:
+        raise ValueError  # noqa: TRY301
+    except ValueError:
+        log.exception("Failed to post", channel="#emoji-papertrail")
+
+
+def measure(variant: str, lines: int, devnull: BinaryIO, devnull_text: TextIO) -> list[float]:
+    structlog.reset_defaults()
+    writer = None
+    if variant == "default":
+        structlog.configure(logger_factory=structlog.PrintLoggerFactory(file=devnull_text))
+    else:
+        writer = configure_logging(
+            ServerConfig(log_format="json", log_background=variant == "background"),
+            file=devnull,
+        )
+
+    log = structlog.get_logger("benchmark")
+    timings = []
+    for _ in range(lines // 3):
+        start = time.perf_counter()
+        _log_lines(log)
+        timings.append((time.perf_counter() - start) / 3)
+        if writer is not None:
+            writer.flush()
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=20_000)
+    args = parser.parse_args()
+
+    with Path("/dev/null").open("wb") as devnull, Path("/dev/null").open("w") as devnull_text:
+        for variant in ("default", "inline", "background"):
+            timings = measure(variant, args.lines, devnull, devnull_text)
+            quantiles = statistics.quantiles(timings, n=100)
+            print(f"{variant:>10}: p50={quantiles[49] * 1e6:.1f}us p99={quantiles[98] * 1e6:.1f}us")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Per-request overhead of middleware.middleware_stack, against the BaseHTTPMiddleware stack it replaced.
+
+    python -m benchmarks.middleware --requests 20000
+
+Calls each app's ASGI callable directly (no server, no HTTP client) so the only thing being measured is routing and
+middleware. Logging is filtered out, so its cost isn't counted in either.
+"""
+
+import argparse
+import asyncio
+from collections.abc import Awaitable, Callable
+import logging
+import secrets
+import time
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import Message, Scope
+import structlog
+
+from config import server_config
+from middleware import middleware_stack
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+
+# The stack as it was before middleware.RequestMiddleware, kept here as the baseline
+async def _return_500_on_exception(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    try:
+        return await call_next(request)
+    except Exception as e:
+        raise HTTPException(status_code=500) from e
+
+
+async def _ready(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    if request.url.path == "/ready":
+        return Response(status_code=200)
+
+    return await call_next(request)
+
+
+async def _request_id(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    request.state.request_id = request.headers.get(
+        server_config.request_id_http_header,
+        f"local:{secrets.token_urlsafe()}",
+    )
+    return await call_next(request)
+
+
+async def _log_requests(request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+    log = logger.bind(
+        request_id=request.state.request_id,
+        source=(f"{request.client.host}" if request.client else "unknown"),
+        host=request.url.hostname,
+        path=request.url.path,
+        method=request.method,
+    )
+    log.info("Request: Start")
+    response = await call_next(request)
+    log.info("Request: Stop", status_code=response.status_code)
+    return response
+
+
+def base_http_middleware_stack() -> list[Middleware]:
+    return [
+        Middleware(BaseHTTPMiddleware, dispatch=f)
+        for f in (_return_500_on_exception, _ready, _request_id, _log_requests)
+    ]
+
+
+def build_app(middleware: list[Middleware]) -> FastAPI:
+    app = FastAPI(middleware=middleware)
+
+    @app.post("/slack/events")
+    async def handle_slack_event(request: Request) -> Response:
+        await request.body()
+        return Response(content=request.state.request_id, status_code=200)
+
+    return app
+
+
+async def call(app: FastAPI, path: str) -> None:
+    scope: Scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"localhost"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("localhost", 8080),
+    }
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b'{"type": "event_callback"}', "more_body": False}
+
+    async def send(_message: Message) -> None:
+        pass
+
+    await app(scope, receive, send)
+
+
+async def per_request_us(app: FastAPI, path: str, requests: int) -> float:
+    # Warm up, so one-off route compilation etc. doesn't count
+    for _ in range(100):
+        await call(app, path)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(app, path)
+    return (time.perf_counter() - start) / requests * 1_000_000
+
+
+async def run(requests: int) -> None:
+    apps = {
+        "BaseHTTPMiddleware": build_app(base_http_middleware_stack()),
+        "ASGI": build_app(middleware_stack()),
+    }
+
+    for path in ("/slack/events", "/ready"):
+        for name, app in apps.items():
+            print(f"{path:<14} {name:<20} {await per_request_us(app, path, requests):>8.1f}us/request")  # noqa: T201
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
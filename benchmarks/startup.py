@@ -0,0 +1,194 @@
+"""Cold start: how long a fresh interpreter takes from importing main.app to acking, and posting about, its first event.
+
+    python -m benchmarks.startup --runs 5 --latency 0.05
+
+This is what the first Slack event after scaling to zero waits on, and Slack only waits 3s for an ack. Each run is a new
+interpreter that imports main.app and then sends it one signed emoji_changed event over ASGI, with the Slack Web API
+faked out in this process. Reports the median of:
+
+- import_ms: `import main`
+- ack_ms: from before the import until the event is acked
+- post_ms: from before the import until its chat.postMessage reaches the fake Slack API
+
+`--warm-up` runs send GET /_ah/warmup first, the way App Engine does before routing traffic to a new instance, and also
+report warm_up_ms. ack_ms and post_ms are then from sending the event, which is what warming up is meant to cut.
+
+Runs don't import anything outside the standard library before main, so nothing the app needs is already loaded.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any
+
+SIGNING_SECRET = "benchmark-signing-secret"  # noqa: S105
+
+
+def signed_emoji_changed(name: str) -> tuple[bytes, list[tuple[bytes, bytes]]]:
+    now = time.time()
+    body = json.dumps(
+        {
+            "token": "benchmark",
+            "team_id": "T0BENCH",
+            "api_app_id": "A0BENCH",
+            "type": "event_callback",
+            "event_id": f"Ev{name}",
+            "event_time": int(now),
+            "event": {
+                "type": "emoji_changed",
+                "subtype": "add",
+                "name": name,
+                "value": f"https://emoji.example.com/{name}.png",
+                "event_ts": f"{now:.6f}",
+            },
+        },
+    ).encode()
+
+    # Signed by hand, rather than with slack_sdk, so that's not imported before main is
+    timestamp = str(int(now))
+    signature = hmac.new(SIGNING_SECRET.encode(), f"v0:{timestamp}:".encode() + body, hashlib.sha256).hexdigest()
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"x-slack-request-timestamp", timestamp.encode()),
+        (b"x-slack-signature", f"v0={signature}".encode()),
+    ]
+    return body, headers
+
+
+async def asgi_request(app: Any, method: str, path: str, body: bytes = b"", headers: list[Any] | None = None) -> int:  # noqa: ANN401
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": headers or [],
+        "client": ("127.0.0.1", 12345),
+        "server": ("bench", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status = 0
+
+    async def receive() -> dict[str, Any]:
+        if messages:
+            return messages.pop()
+        # Nothing more to send, and we never hang up
+        await asyncio.Event().wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict[str, Any]) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+def run_variant(args: argparse.Namespace) -> None:
+    start = time.perf_counter()
+    from main import app
+
+    imported = time.perf_counter()
+
+    async def first_event() -> None:
+        result = {"import_ms": (imported - start) * 1000}
+
+        sent_at = start
+        if args.warm_up:
+            warm_up_start = time.perf_counter()
+            await asgi_request(app, "GET", "/_ah/warmup")
+            sent_at = time.perf_counter()
+            result["warm_up_ms"] = (sent_at - warm_up_start) * 1000
+
+        body, headers = signed_emoji_changed(args.variant_name)
+        status = await asgi_request(app, "POST", "/slack/events", body, headers)
+        if status != 200:  # noqa: PLR2004
+            msg = f"Event got a {status}"
+            raise RuntimeError(msg)
+        result["ack_ms"] = (time.perf_counter() - sent_at) * 1000
+        result["sent_at"] = sent_at
+        # On stderr, since the app logs to stdout
+        print(json.dumps(result), file=sys.stderr, flush=True)  # noqa: T201
+
+        # Async mode posts in the background, so keep the loop running until the parent has seen it
+        await asyncio.to_thread(sys.stdin.readline)
+
+    asyncio.run(first_event())
+
+
+def run(args: argparse.Namespace, mode: str, index: int) -> dict[str, float]:
+    from benchmarks.fake_slack import FakeSlack
+
+    name = f"startup-{mode}-{index}"
+    with FakeSlack(latency=args.latency, catalog_size=args.catalog_size).running() as fake:
+        fake.catalog[name] = f"https://emoji.example.com/{name}.png"
+        env = {
+            **os.environ,
+            "SLACK_SIGNING_SECRET": SIGNING_SECRET,
+            "SLACK_BOT_TOKEN": "xoxb-benchmark",
+            "SLACK_APP_ASYNC_MODE": str(mode == "async"),
+            "SLACK_APP_SLACK_API_URL": fake.url,
+        }
+        env.pop("SLACK_APP_REDIS_HOST", None)
+
+        variant = [sys.executable, "-m", "benchmarks.startup", *sys.argv[1:], "--variant-name", name]
+        with subprocess.Popen(  # noqa: S603
+            variant,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        ) as proc:
+            # Skipping any warnings
+            line = ""
+            while not line.startswith("{"):
+                line = proc.stderr.readline()  # type: ignore[union-attr]
+                if not line:
+                    msg = "The run exited without a result"
+                    raise RuntimeError(msg)
+            result = json.loads(line)
+            fake.wait_for("chat.postMessage", 1, timeout=args.timeout)
+            proc.communicate("done\n")
+
+    sent_at = result.pop("sent_at")
+    # perf_counter is the system-wide monotonic clock, so this is comparable across processes
+    result["post_ms"] = (fake.posted[name] - sent_at) * 1000
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds each fake Slack API call takes")
+    parser.add_argument("--catalog-size", type=int, default=1000)
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    parser.add_argument("--warm-up", action="store_true", help="Warm up with GET /_ah/warmup before the event")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--variant-name", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant_name is not None:
+        run_variant(args)
+        return
+
+    for mode in args.modes:
+        results = [run(args, mode, i) for i in range(args.runs)]
+        medians = {key: statistics.median(r[key] for r in results) for key in results[0]}
+        print(f"{mode:>5}: " + "  ".join(f"{k}={v:.1f}" for k, v in medians.items()))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,652 @@
+import asyncio
+from collections.abc import Iterator, Mapping
+from datetime import timedelta
+import json
+import secrets
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+import redis
+import redis.asyncio
+import redis.exceptions
+from slack_sdk import WebClient
+import structlog
+
+from config import app_config
+from emoji import (
+    CompactEmojiList,
+    EmojiInfo,
+    EmojiListEntry,
+    alias_target,
+    async_find_admin_emoji,
+    async_get_emoji_list,
+    find_admin_emoji,
+    get_emoji_list,
+)
+from emoji_search import EmojiSearchIndex
+from redis_utils import async_redis_client, redis_client
+
+if TYPE_CHECKING:
+    # See emoji.py
+    from slack_sdk.web.async_client import AsyncWebClient
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+
+class EmojiCatalog(Mapping[str, EmojiListEntry]):
+    """In-process copy of a workspace's emoji list.
+
+    Loaded from Slack once, then kept current by applying `emoji_changed` events to it. A full resync happens
+    every `resync_interval` to catch anything we missed, and whenever a lookup misses. For enterprise tenants a miss
+    only reads admin.emoji.list as far as the missing emoji instead.
+
+    Lookups that need a resync at the same time share one fetch rather than each doing their own, and a miss within
+    `min_refresh_interval` of the last fetch makes do with it.
+
+    The first search (or prepare_search, at warm-up) builds an EmojiSearchIndex of the names, which is then kept current
+    alongside the list.
+    """
+
+    def __init__(
+        self,
+        *,
+        is_enterprise_tenant: bool = False,
+        resync_interval: timedelta,
+        min_refresh_interval: timedelta = timedelta(0),
+    ) -> None:
+        self.is_enterprise_tenant = is_enterprise_tenant
+        self.resync_interval = resync_interval
+        self.min_refresh_interval = min_refresh_interval
+
+        self._entries = CompactEmojiList()
+        self._loaded_at: float | None = None
+        self._lock = threading.Lock()
+        # Held for the whole of a fetch, so only one thread does one at a time
+        self._refresh_lock = threading.Lock()
+        self._async_refresh: asyncio.Future[None] | None = None
+        self._search_index: EmojiSearchIndex | None = None
+        # Events and merges applied since _loaded_at, so a search index built from the list can tell if it's behind
+        self._edits = 0
+
+    def __getitem__(self, name: str) -> EmojiListEntry:
+        return self._entries[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.resync_interval.total_seconds()
+
+    def refresh(self, client: WebClient) -> None:
+        logger.info("Refreshing emoji catalog", is_enterprise_tenant=self.is_enterprise_tenant)
+
+        entries = get_emoji_list(client, is_enterprise_tenant=self.is_enterprise_tenant)
+        # Rebuilt rather than patched, which also clears out what removes left behind in it
+        search_index = EmojiSearchIndex(entries) if self._search_index is not None else None
+
+        self._replace(entries, search_index)
+
+    async def async_refresh(self, client: "AsyncWebClient") -> None:
+        logger.info("Refreshing emoji catalog", is_enterprise_tenant=self.is_enterprise_tenant)
+
+        entries = await async_get_emoji_list(client, is_enterprise_tenant=self.is_enterprise_tenant)
+        # See async_prepare_search
+        search_index = await asyncio.to_thread(EmojiSearchIndex, entries) if self._search_index is not None else None
+
+        self._replace(entries, search_index)
+
+    def _can_reuse_load(self, seen: float | None) -> bool:
+        """Whether the list has been loaded since a lookup saw it loaded at `seen`, or recently enough anyway."""
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            return False
+
+        return loaded_at != seen or time.monotonic() - loaded_at < self.min_refresh_interval.total_seconds()
+
+    def _shared_refresh(self, client: WebClient, seen: float | None) -> None:
+        with self._refresh_lock:
+            # Whoever held the lock before us may well have just done what we were about to
+            if not self._can_reuse_load(seen):
+                self.refresh(client)
+
+    async def _async_shared_refresh(self, client: "AsyncWebClient", seen: float | None) -> None:
+        refresh = self._async_refresh
+        if refresh is None or refresh.done() or refresh.get_loop() is not asyncio.get_running_loop():
+            if self._can_reuse_load(seen):
+                return
+            refresh = self._async_refresh = asyncio.ensure_future(self.async_refresh(client))
+
+        # Shielded so one waiter being cancelled doesn't cancel it for the rest
+        await asyncio.shield(refresh)
+
+    def _replace(self, entries: CompactEmojiList, search_index: EmojiSearchIndex | None) -> None:
+        with self._lock:
+            self._entries, self._loaded_at = entries, time.monotonic()
+            self._search_index = search_index
+
+    def _merge(self, entries: Mapping[str, EmojiListEntry]) -> None:
+        with self._lock:
+            self._entries.update(entries)
+            self._edits += 1
+            if self._search_index is not None:
+                for name in entries:
+                    self._search_index.add(name)
+
+    def get_emoji(self, client: WebClient, name: str, url: str | None) -> EmojiInfo:
+        log = logger.bind(emoji_name=name, emoji_url=url)
+
+        seen = self._loaded_at
+        if self.is_stale:
+            self._shared_refresh(client, seen)
+
+        seen = self._loaded_at
+        try:
+            return EmojiInfo.from_emoji_list(name, url, self)
+        except KeyError:
+            log.info("Emoji catalog miss, falling back to a fetch")
+
+        if self.is_enterprise_tenant:
+            self._merge(find_admin_emoji(client, name, url))
+        else:
+            self._shared_refresh(client, seen)
+        return EmojiInfo.from_emoji_list(name, url, self)
+
+    async def async_get_emoji(self, client: "AsyncWebClient", name: str, url: str | None) -> EmojiInfo:
+        log = logger.bind(emoji_name=name, emoji_url=url)
+
+        seen = self._loaded_at
+        if self.is_stale:
+            await self._async_shared_refresh(client, seen)
+
+        seen = self._loaded_at
+        try:
+            return EmojiInfo.from_emoji_list(name, url, self)
+        except KeyError:
+            log.info("Emoji catalog miss, falling back to a fetch")
+
+        if self.is_enterprise_tenant:
+            self._merge(await async_find_admin_emoji(client, name, url))
+        else:
+            await self._async_shared_refresh(client, seen)
+        return EmojiInfo.from_emoji_list(name, url, self)
+
+    def _built_search_index(self) -> EmojiSearchIndex:
+        with self._lock:
+            if self._search_index is not None:
+                return self._search_index
+            version, names = (self._loaded_at, self._edits), list(self._entries)
+
+        # Built without the lock, so lookups and events aren't held up behind it
+        search_index = EmojiSearchIndex(names)
+
+        with self._lock:
+            if self._search_index is None and (self._loaded_at, self._edits) == version:
+                self._search_index = search_index
+            elif self._search_index is not None:
+                search_index = self._search_index
+            # Otherwise the list changed under us, so this answers from it as it was and the next search builds again
+            return search_index
+
+    def _search(self, index: EmojiSearchIndex, query: str, limit: int) -> list[str]:
+        with self._lock:
+            return index.search(query, limit)
+
+    def prepare_search(self, client: WebClient) -> EmojiSearchIndex:
+        """Resync the list if it needs it and build its search index, so searches can be answered straight away."""
+        if self.is_stale:
+            self._shared_refresh(client, self._loaded_at)
+        return self._built_search_index()
+
+    async def async_prepare_search(self, client: "AsyncWebClient") -> EmojiSearchIndex:
+        """See prepare_search."""
+        if self.is_stale:
+            await self._async_shared_refresh(client, self._loaded_at)
+        if (search_index := self._search_index) is not None:
+            return search_index
+        # Building one over a big list takes long enough to hold up everything else on the event loop
+        return await asyncio.to_thread(self._built_search_index)
+
+    def search(self, client: WebClient, query: str, limit: int) -> list[str]:
+        """Names of emoji matching `query`, best first, see EmojiSearchIndex.search. Only talks to Slack if the list
+        needs a resync.
+        """
+        return self._search(self.prepare_search(client), query, limit)
+
+    async def async_search(self, client: "AsyncWebClient", query: str, limit: int) -> list[str]:
+        """See search."""
+        return self._search(await self.async_prepare_search(client), query, limit)
+
+    def search_if_ready(self, query: str, limit: int) -> list[str] | None:
+        """search, but None instead if it'd have to resync the list or build the search index first."""
+        with self._lock:
+            if self.is_stale or self._search_index is None:
+                return None
+            return self._search_index.search(query, limit)
+
+    async def async_search_if_ready(self, query: str, limit: int) -> list[str] | None:
+        return self.search_if_ready(query, limit)
+
+    def apply(self, event: Mapping[str, Any]) -> None:
+        """Apply an `emoji_changed` event to the catalog.
+
+        {'subtype': 'add', 'name': 'foo', 'value': 'https://...'}
+        {'subtype': 'remove', 'names': ['foo', 'bar']}
+        {'subtype': 'rename', 'old_name': 'foo', 'new_name': 'bar', 'value': 'https://...'}
+        """
+        if self._loaded_at is None:
+            # Nothing to patch yet, the first lookup will load the full list
+            return
+
+        with self._lock:
+            match event.get("subtype"):
+                case "add":
+                    # Only admin.emoji.list knows who uploaded an emoji, so for enterprise tenants we let the
+                    # lookup miss and pick the new entry (and its author) up from a refresh instead.
+                    if not self.is_enterprise_tenant:
+                        self._entries[event["name"]] = EmojiListEntry(name=event["name"], url=event["value"])
+                case "remove":
+                    for name in event.get("names", ()):
+                        self._entries.pop(name, None)
+                case "rename":
+                    before = self._entries.pop(event["old_name"], None)
+                    url = event.get("value") or (before.url if before else None)
+                    if url is not None:
+                        self._entries[event["new_name"]] = EmojiListEntry(
+                            name=event["new_name"],
+                            url=url,
+                            uploaded_by=before.uploaded_by if before else None,
+                        )
+                case subtype:
+                    logger.info("Ignoring unknown emoji_changed subtype", subtype=subtype)
+
+            self._edits += 1
+            self._reindex(event)
+
+    def _reindex(self, event: Mapping[str, Any]) -> None:
+        """Whatever applying `event` did to the list, do to the search index too. Called with the lock held."""
+        if self._search_index is None:
+            return
+
+        for name in (event.get("name"), event.get("old_name"), event.get("new_name"), *event.get("names", ())):
+            if name in self._entries:
+                self._search_index.add(name)
+            elif name is not None:
+                self._search_index.remove(name)
+
+    async def async_apply(self, event: Mapping[str, Any]) -> None:
+        self.apply(event)
+
+
+class RedisEmojiCatalog:
+    """A workspace's emoji list shared by every process through Redis, rather than one copy per process.
+
+    The list is a hash of name to entry, stamped with when it was last loaded from Slack. Whichever process first finds
+    it missing or stale takes a lock and reloads it while the rest wait, so one process talks to Slack instead of all
+    of them. Lookups only HGET the emoji they need. Misses (and `min_refresh_interval`) and `emoji_changed` events are
+    handled the same way as EmojiCatalog does, just against the hash, going by when it was last loaded from Slack.
+
+    Searches need every name though, so each process keeps its own EmojiSearchIndex of them, loaded with HKEYS on the
+    first search (or prepare_search) and kept current with the events it applies itself. It's reloaded whenever the hash has been reloaded
+    from Slack, or has a different number of emoji in it (as it will once another process has applied an add or a
+    remove). Renames other processes apply only show up once the list is next reloaded.
+    """
+
+    # Long enough to load a huge admin.emoji.list, short enough to not hold everyone up for long if we die mid-load
+    LOCK_TIMEOUT = timedelta(minutes=5)
+
+    def __init__(  # noqa: PLR0913
+        self,
+        redis_client: redis.Redis,
+        async_redis_client: redis.asyncio.Redis,
+        *,
+        enterprise_id: str | None,
+        team_id: str | None,
+        is_enterprise_tenant: bool = False,
+        resync_interval: timedelta,
+        min_refresh_interval: timedelta = timedelta(0),
+    ) -> None:
+        self.redis = redis_client
+        self.async_redis = async_redis_client
+        self.is_enterprise_tenant = is_enterprise_tenant
+        self.resync_interval = resync_interval
+        self.min_refresh_interval = min_refresh_interval
+
+        self.key = f"emoji-papertrail:catalog:{enterprise_id or '-'}:{team_id or '-'}"
+        self.version_key = f"{self.key}:version"
+        self.lock_key = f"{self.key}:lock"
+
+        self._search_index: EmojiSearchIndex | None = None
+        # The version of the hash it was loaded from
+        self._search_index_version: bytes | None = None
+        self._search_lock = threading.Lock()
+
+    def _is_stale(self, version: bytes | None) -> bool:
+        return version is None or time.time() - float(version) > self.resync_interval.total_seconds()
+
+    def _can_reuse_load(self, version: bytes | None, seen: bytes | None) -> bool:
+        """Whether the hash has been loaded since a lookup saw it at version `seen`, or recently enough anyway."""
+        if self._is_stale(version):
+            return False
+
+        return version != seen or time.time() - float(version) < self.min_refresh_interval.total_seconds()  # type: ignore[arg-type]
+
+    def _hash_values(self, entries: Mapping[str, EmojiListEntry]) -> dict[str, str]:
+        return {
+            name: json.dumps({"url": entry.url, "uploaded_by": entry.uploaded_by}) for name, entry in entries.items()
+        }
+
+    def _write(self, pipe: redis.client.Pipeline | redis.asyncio.client.Pipeline, entries: CompactEmojiList) -> None:
+        """Queue replacing the hash with `entries`, built under a scratch key so readers only ever see a whole list."""
+        scratch = f"{self.key}:loading:{secrets.token_hex(8)}"
+        expires = self.resync_interval * 2
+
+        if entries:
+            pipe.hset(scratch, mapping=self._hash_values(entries))
+            pipe.rename(scratch, self.key)
+            pipe.expire(self.key, expires)
+        else:
+            pipe.delete(self.key)
+        pipe.set(self.version_key, repr(time.time()), ex=expires)
+
+    def _lookup_names(self, name: str, url: str | None) -> list[str]:
+        return [name] if (target := alias_target(url)) is None else [name, target]
+
+    def _parse(self, names: list[str], values: list[bytes | None]) -> dict[str, EmojiListEntry]:
+        return {
+            name: EmojiListEntry(name=name, **json.loads(value))
+            for name, value in zip(names, values, strict=True)
+            if value is not None
+        }
+
+    def _next_names(self, found: Mapping[str, EmojiListEntry], tried: set[str]) -> list[str]:
+        """Alias targets of what we've found that we haven't looked up yet."""
+        return [
+            target
+            for entry in found.values()
+            if (target := alias_target(entry.url)) is not None and target not in tried
+        ]
+
+    def refresh(self, client: WebClient, *, unless_newer_than: bytes | None = None) -> None:
+        """Reload the list from Slack, unless someone else did while we were waiting for the lock."""
+        try:
+            with self.redis.lock(
+                self.lock_key,
+                timeout=self.LOCK_TIMEOUT.total_seconds(),
+                blocking_timeout=self.LOCK_TIMEOUT.total_seconds(),
+            ):
+                if self._can_reuse_load(self.redis.get(self.version_key), unless_newer_than):
+                    return
+
+                logger.info("Refreshing shared emoji catalog", key=self.key)
+                entries = get_emoji_list(client, is_enterprise_tenant=self.is_enterprise_tenant)
+
+                with self.redis.pipeline() as pipe:
+                    self._write(pipe, entries)
+                    pipe.execute()
+        except redis.exceptions.LockError:
+            # Someone's taking a long time about it, go with what's there
+            logger.warning("Timed out waiting for the shared emoji catalog lock", key=self.key)
+
+    async def async_refresh(self, client: "AsyncWebClient", *, unless_newer_than: bytes | None = None) -> None:
+        """See refresh."""
+        try:
+            async with self.async_redis.lock(
+                self.lock_key,
+                timeout=self.LOCK_TIMEOUT.total_seconds(),
+                blocking_timeout=self.LOCK_TIMEOUT.total_seconds(),
+            ):
+                if self._can_reuse_load(await self.async_redis.get(self.version_key), unless_newer_than):
+                    return
+
+                logger.info("Refreshing shared emoji catalog", key=self.key)
+                entries = await async_get_emoji_list(client, is_enterprise_tenant=self.is_enterprise_tenant)
+
+                async with self.async_redis.pipeline() as pipe:
+                    self._write(pipe, entries)
+                    await pipe.execute()
+        except redis.exceptions.LockError:
+            logger.warning("Timed out waiting for the shared emoji catalog lock", key=self.key)
+
+    def _find(self, name: str, url: str | None) -> dict[str, EmojiListEntry]:
+        found: dict[str, EmojiListEntry] = {}
+        names = self._lookup_names(name, url)
+        tried = set(names)
+        while names:
+            found |= self._parse(names, self.redis.hmget(self.key, names))
+            names = self._next_names(found, tried)
+            tried.update(names)
+        return found
+
+    async def _async_find(self, name: str, url: str | None) -> dict[str, EmojiListEntry]:
+        found: dict[str, EmojiListEntry] = {}
+        names = self._lookup_names(name, url)
+        tried = set(names)
+        while names:
+            found |= self._parse(names, await self.async_redis.hmget(self.key, names))
+            names = self._next_names(found, tried)
+            tried.update(names)
+        return found
+
+    def get_emoji(self, client: WebClient, name: str, url: str | None) -> EmojiInfo:
+        log = logger.bind(emoji_name=name, emoji_url=url)
+
+        version = self.redis.get(self.version_key)
+        if self._is_stale(version):
+            self.refresh(client, unless_newer_than=version)
+
+        try:
+            return EmojiInfo.from_emoji_list(name, url, self._find(name, url))
+        except KeyError:
+            log.info("Shared emoji catalog miss, falling back to a fetch")
+
+        if self.is_enterprise_tenant:
+            found = find_admin_emoji(client, name, url)
+            if found:
+                self.redis.hset(self.key, mapping=self._hash_values(found))
+            return EmojiInfo.from_emoji_list(name, url, found)
+
+        self.refresh(client, unless_newer_than=self.redis.get(self.version_key))
+        return EmojiInfo.from_emoji_list(name, url, self._find(name, url))
+
+    async def async_get_emoji(self, client: "AsyncWebClient", name: str, url: str | None) -> EmojiInfo:
+        log = logger.bind(emoji_name=name, emoji_url=url)
+
+        version = await self.async_redis.get(self.version_key)
+        if self._is_stale(version):
+            await self.async_refresh(client, unless_newer_than=version)
+
+        try:
+            return EmojiInfo.from_emoji_list(name, url, await self._async_find(name, url))
+        except KeyError:
+            log.info("Shared emoji catalog miss, falling back to a fetch")
+
+        if self.is_enterprise_tenant:
+            found = await async_find_admin_emoji(client, name, url)
+            if found:
+                await self.async_redis.hset(self.key, mapping=self._hash_values(found))
+            return EmojiInfo.from_emoji_list(name, url, found)
+
+        await self.async_refresh(client, unless_newer_than=await self.async_redis.get(self.version_key))
+        return EmojiInfo.from_emoji_list(name, url, await self._async_find(name, url))
+
+    def _current_search_index(self, version: bytes | None, size: int) -> EmojiSearchIndex | None:
+        index = self._search_index
+        if index is None or version != self._search_index_version or len(index) != size:
+            return None
+        return index
+
+    def _load_search_index(self, version: bytes | None, names: list[bytes]) -> EmojiSearchIndex:
+        index = EmojiSearchIndex(name.decode() for name in names)
+        with self._search_lock:
+            self._search_index, self._search_index_version = index, version
+        return index
+
+    def _search(self, index: EmojiSearchIndex, query: str, limit: int) -> list[str]:
+        with self._search_lock:
+            return index.search(query, limit)
+
+    def _search_index_state(self) -> tuple[bytes | None, int]:
+        with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(self.version_key)
+            pipe.hlen(self.key)
+            version, size = pipe.execute()
+        return version, size
+
+    async def _async_search_index_state(self) -> tuple[bytes | None, int]:
+        async with self.async_redis.pipeline(transaction=False) as pipe:
+            pipe.get(self.version_key)
+            pipe.hlen(self.key)
+            version, size = await pipe.execute()
+        return version, size
+
+    def prepare_search(self, client: WebClient) -> EmojiSearchIndex:
+        """See EmojiCatalog.prepare_search."""
+        version, size = self._search_index_state()
+        if self._is_stale(version):
+            self.refresh(client, unless_newer_than=version)
+            version, size = self._search_index_state()
+
+        index = self._current_search_index(version, size)
+        if index is None:
+            index = self._load_search_index(version, self.redis.hkeys(self.key))
+        return index
+
+    async def async_prepare_search(self, client: "AsyncWebClient") -> EmojiSearchIndex:
+        """See EmojiCatalog.prepare_search."""
+        version, size = await self._async_search_index_state()
+        if self._is_stale(version):
+            await self.async_refresh(client, unless_newer_than=version)
+            version, size = await self._async_search_index_state()
+
+        index = self._current_search_index(version, size)
+        if index is None:
+            names = await self.async_redis.hkeys(self.key)
+            # See EmojiCatalog.async_prepare_search
+            index = await asyncio.to_thread(self._load_search_index, version, names)
+        return index
+
+    def search(self, client: WebClient, query: str, limit: int) -> list[str]:
+        """See EmojiCatalog.search."""
+        return self._search(self.prepare_search(client), query, limit)
+
+    async def async_search(self, client: "AsyncWebClient", query: str, limit: int) -> list[str]:
+        """See EmojiCatalog.search."""
+        return self._search(await self.async_prepare_search(client), query, limit)
+
+    def search_if_ready(self, query: str, limit: int) -> list[str] | None:
+        """See EmojiCatalog.search_if_ready."""
+        version, size = self._search_index_state()
+        if self._is_stale(version) or (index := self._current_search_index(version, size)) is None:
+            return None
+        return self._search(index, query, limit)
+
+    async def async_search_if_ready(self, query: str, limit: int) -> list[str] | None:
+        """See EmojiCatalog.search_if_ready."""
+        version, size = await self._async_search_index_state()
+        if self._is_stale(version) or (index := self._current_search_index(version, size)) is None:
+            return None
+        return self._search(index, query, limit)
+
+    def _reindex(self, removed: list[str], added: Mapping[str, str]) -> None:
+        """Do what an event did to the hash to the search index too, so it still matches."""
+        with self._search_lock:
+            if self._search_index is None:
+                return
+            for name in removed:
+                self._search_index.remove(name)
+            for name in added:
+                self._search_index.add(name)
+
+    def _changes(self, event: Mapping[str, Any], before: bytes | None) -> tuple[list[str], dict[str, str]]:
+        """The names to remove from and entries to set in the hash for an `emoji_changed` event."""
+        match event.get("subtype"):
+            case "add":
+                # Same as EmojiCatalog, only a refresh knows who uploaded it for enterprise tenants
+                if self.is_enterprise_tenant:
+                    return [], {}
+                return [], {event["name"]: json.dumps({"url": event["value"], "uploaded_by": None})}
+            case "remove":
+                return list(event.get("names", ())), {}
+            case "rename":
+                previous = json.loads(before) if before is not None else {"url": None, "uploaded_by": None}
+                url = event.get("value") or previous["url"]
+                if url is None:
+                    return [event["old_name"]], {}
+                return [event["old_name"]], {
+                    event["new_name"]: json.dumps({"url": url, "uploaded_by": previous["uploaded_by"]}),
+                }
+            case subtype:
+                logger.info("Ignoring unknown emoji_changed subtype", subtype=subtype)
+                return [], {}
+
+    def apply(self, event: Mapping[str, Any]) -> None:
+        """See EmojiCatalog.apply."""
+        if not self.redis.exists(self.key):
+            # Nothing to patch yet, the first lookup will load the full list
+            return
+
+        before = self.redis.hget(self.key, event["old_name"]) if event.get("subtype") == "rename" else None
+        removed, added = self._changes(event, before)
+
+        with self.redis.pipeline() as pipe:
+            if removed:
+                pipe.hdel(self.key, *removed)
+            if added:
+                pipe.hset(self.key, mapping=added)
+            pipe.execute()
+        self._reindex(removed, added)
+
+    async def async_apply(self, event: Mapping[str, Any]) -> None:
+        """See EmojiCatalog.apply."""
+        if not await self.async_redis.exists(self.key):
+            return
+
+        before = await self.async_redis.hget(self.key, event["old_name"]) if event.get("subtype") == "rename" else None
+        removed, added = self._changes(event, before)
+
+        async with self.async_redis.pipeline() as pipe:
+            if removed:
+                pipe.hdel(self.key, *removed)
+            if added:
+                pipe.hset(self.key, mapping=added)
+            await pipe.execute()
+        self._reindex(removed, added)
+
+
+_catalogs: dict[tuple[str | None, str | None], EmojiCatalog | RedisEmojiCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def catalog_for(
+    enterprise_id: str | None,
+    team_id: str | None,
+    *,
+    is_enterprise_tenant: bool = False,
+) -> EmojiCatalog | RedisEmojiCatalog:
+    key = (enterprise_id, team_id)
+
+    with _catalogs_lock:
+        if key not in _catalogs:
+            if app_config.shared_emoji_catalog and app_config.redis_host is not None:
+                _catalogs[key] = RedisEmojiCatalog(
+                    redis_client(str(app_config.redis_host)),
+                    async_redis_client(str(app_config.redis_host)),
+                    enterprise_id=enterprise_id,
+                    team_id=team_id,
+                    is_enterprise_tenant=is_enterprise_tenant,
+                    resync_interval=app_config.emoji_catalog_resync_interval,
+                    min_refresh_interval=app_config.emoji_catalog_min_refresh_interval,
+                )
+            else:
+                _catalogs[key] = EmojiCatalog(
+                    is_enterprise_tenant=is_enterprise_tenant,
+                    resync_interval=app_config.emoji_catalog_resync_interval,
+                    min_refresh_interval=app_config.emoji_catalog_min_refresh_interval,
+                )
+
+        return _catalogs[key]
@@ -0,0 +1,305 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import threading
+import time
+from typing import Any
+
+import fakeredis
+import pytest
+
+import catalog as catalog_module
+from catalog import EmojiCatalog, RedisEmojiCatalog
+from emoji_search import EmojiSearchIndex
+from emoji_test import INVALID, FakeAdminClient, entry
+
+
+class FakeEmojiListResponse:
+    status_code = 200
+
+    def __init__(self, emoji: dict[str, str]) -> None:
+        self.data: dict[str, Any] = {"ok": True, "emoji": emoji}
+
+
+class FakeClient:
+    def __init__(self, emoji: dict[str, str]) -> None:
+        self.emoji = emoji
+        self.calls = 0
+
+    def emoji_list(self) -> FakeEmojiListResponse:
+        self.calls += 1
+        return FakeEmojiListResponse(dict(self.emoji))
+
+
+def test_catalog_loads_once_and_applies_events():
+    client = FakeClient({"party": "https://example.com/party.png"})
+    catalog = EmojiCatalog(resync_interval=timedelta(hours=1))
+
+    assert catalog.get_emoji(client, "party", None).image_url == "https://example.com/party.png"  # type: ignore[arg-type]
+    assert client.calls == 1
+
+    catalog.apply({"subtype": "add", "name": "parrot", "value": "https://example.com/parrot.png"})
+    catalog.apply({"subtype": "add", "name": "partyy", "value": "alias:party"})
+
+    alias = catalog.get_emoji(client, "partyy", "alias:party")  # type: ignore[arg-type]
+    assert alias.is_alias
+    assert alias.image_url == "https://example.com/party.png"
+    assert client.calls == 1, "Adds from events should not trigger a fetch"
+
+    catalog.apply({"subtype": "rename", "old_name": "parrot", "new_name": "parrot2", "value": "https://x/p.png"})
+    catalog.apply({"subtype": "remove", "names": ["party"]})
+
+    assert set(catalog) == {"parrot2", "partyy"}
+
+
+def test_catalog_refreshes_on_miss_and_when_stale():
+    client = FakeClient({"party": "https://example.com/party.png"})
+    catalog = EmojiCatalog(resync_interval=timedelta(hours=1))
+    catalog.refresh(client)  # type: ignore[arg-type]
+
+    calls = client.calls
+    client.emoji["surprise"] = "https://example.com/surprise.png"
+    assert catalog.get_emoji(client, "surprise", None).name == "surprise"  # type: ignore[arg-type]
+    assert client.calls == calls + 1, "A miss should fall back to a full fetch"
+
+    calls = client.calls
+    catalog.resync_interval = timedelta(0)
+    catalog.get_emoji(client, "party", None)  # type: ignore[arg-type]
+    assert client.calls == calls + 1, "A stale catalog should resync"
+
+
+def test_catalog_search_follows_events_without_fetching():
+    client = FakeClient({"party": "https://example.com/party.png", "parrot": "https://example.com/parrot.png"})
+    catalog = EmojiCatalog(resync_interval=timedelta(hours=1))
+
+    assert catalog.search(client, "par", 10) == ["parrot", "party"]  # type: ignore[arg-type]
+    assert client.calls == 1
+
+    catalog.apply({"subtype": "add", "name": "party-parrot", "value": "https://example.com/party-parrot.png"})
+    catalog.apply({"subtype": "rename", "old_name": "parrot", "new_name": "sad-parrot", "value": None})
+    catalog.apply({"subtype": "remove", "names": ["party"]})
+
+    assert catalog.search(client, "parrot", 10) == ["sad-parrot", "party-parrot"]  # type: ignore[arg-type]
+    assert client.calls == 1, "Searches should come from the index, not Slack"
+
+    client.emoji["parrot-wave"] = "https://example.com/parrot-wave.png"
+    catalog.refresh(client)  # type: ignore[arg-type]
+    assert catalog.search(client, "parrot", 10) == ["parrot", "parrot-wave"]  # type: ignore[arg-type]
+
+
+def test_search_if_ready_only_answers_once_the_index_is_built():
+    client = FakeClient({"party": "https://example.com/party.png"})
+    catalog = EmojiCatalog(resync_interval=timedelta(hours=1))
+
+    assert catalog.search_if_ready("party", 10) is None
+    catalog.refresh(client)  # type: ignore[arg-type]
+    assert catalog.search_if_ready("party", 10) is None, "The index isn't built yet"
+
+    catalog.prepare_search(client)  # type: ignore[arg-type]
+    assert catalog.search_if_ready("party", 10) == ["party"]
+    assert client.calls == 1
+
+    catalog.resync_interval = timedelta(0)
+    assert catalog.search_if_ready("party", 10) is None, "The list needs a resync"
+
+
+def test_catalog_search_index_is_built_without_holding_up_events(monkeypatch: pytest.MonkeyPatch):
+    client = FakeClient({"party": "https://example.com/party.png"})
+    catalog = EmojiCatalog(resync_interval=timedelta(hours=1))
+    catalog.refresh(client)  # type: ignore[arg-type]
+
+    def build_while_an_event_arrives(names: list[str]) -> EmojiSearchIndex:
+        catalog.apply({"subtype": "add", "name": "party-parrot", "value": "https://example.com/party-parrot.png"})
+        return EmojiSearchIndex(names)
+
+    monkeypatch.setattr(catalog_module, "EmojiSearchIndex", build_while_an_event_arrives)
+    assert catalog.search(client, "party", 10) == ["party"], "Answered from the list as it was"
+
+    monkeypatch.undo()
+    assert catalog.search(client, "party", 10) == ["party", "party-parrot"], "Not left behind by the event"
+
+
+class SlowEmojiListClient(FakeClient):
+    """Takes long enough to answer that every lookup in a burst is waiting on the same fetch."""
+
+    def emoji_list(self) -> FakeEmojiListResponse:
+        time.sleep(0.1)
+        return super().emoji_list()
+
+    async def async_emoji_list(self) -> FakeEmojiListResponse:
+        await asyncio.sleep(0.1)
+        return super().emoji_list()
+
+
+BURST = 100
+
+
+def test_catalog_shares_one_fetch_across_a_burst_of_lookups():
+    client = SlowEmojiListClient({f"emoji-{i}": f"https://example.com/{i}.png" for i in range(BURST)})
+    catalog = EmojiCatalog(resync_interval=timedelta(hours=1))
+
+    with ThreadPoolExecutor(max_workers=BURST) as pool:
+        emoji = list(pool.map(lambda i: catalog.get_emoji(client, f"emoji-{i}", None), range(BURST)))  # type: ignore[arg-type]
+
+    assert [e.name for e in emoji] == [f"emoji-{i}" for i in range(BURST)]
+    assert client.calls == 1
+
+
+def test_async_catalog_shares_one_fetch_across_a_burst_of_lookups():
+    client = SlowEmojiListClient({f"emoji-{i}": f"https://example.com/{i}.png" for i in range(BURST)})
+    client.emoji_list = client.async_emoji_list  # type: ignore[method-assign]
+    catalog = EmojiCatalog(resync_interval=timedelta(hours=1))
+
+    async def burst() -> list[str]:
+        emoji = await asyncio.gather(*(catalog.async_get_emoji(client, f"emoji-{i}", None) for i in range(BURST)))  # type: ignore[arg-type]
+        return [e.name for e in emoji]
+
+    assert asyncio.run(burst()) == [f"emoji-{i}" for i in range(BURST)]
+    assert client.calls == 1
+
+
+def test_catalog_misses_reuse_a_recent_fetch():
+    client = FakeClient({"party": "https://example.com/party.png"})
+    catalog = EmojiCatalog(resync_interval=timedelta(hours=1), min_refresh_interval=timedelta(minutes=1))
+    catalog.refresh(client)  # type: ignore[arg-type]
+
+    with pytest.raises(KeyError):
+        catalog.get_emoji(client, "missing", None)  # type: ignore[arg-type]
+    assert client.calls == 1
+
+
+def test_enterprise_catalog_misses_only_look_up_the_missing_emoji():
+    client = FakeAdminClient({"party": entry("party")}, {"surprise": entry("surprise")}, {"later": INVALID})
+    catalog = EmojiCatalog(is_enterprise_tenant=True, resync_interval=timedelta(hours=1))
+    catalog.refresh(FakeAdminClient({"party": entry("party")}))  # type: ignore[arg-type]
+
+    emoji = catalog.get_emoji(client, "surprise", "https://example.com/surprise.png")  # type: ignore[arg-type]
+
+    assert emoji.author == "U123"
+    assert client.pages_read == len(client.pages) - 1
+    assert set(catalog) == {"party", "surprise"}
+
+
+def shared_catalog(
+    server: fakeredis.FakeServer,
+    *,
+    is_enterprise_tenant: bool = False,
+    min_refresh_interval: timedelta = timedelta(0),
+) -> RedisEmojiCatalog:
+    return RedisEmojiCatalog(
+        fakeredis.FakeRedis(server=server),
+        fakeredis.FakeAsyncRedis(server=server),
+        enterprise_id=None,
+        team_id="T123",
+        is_enterprise_tenant=is_enterprise_tenant,
+        resync_interval=timedelta(hours=1),
+        min_refresh_interval=min_refresh_interval,
+    )
+
+
+class SlowFakeClient(FakeClient):
+    def __init__(self, emoji: dict[str, str], started: threading.Event, release: threading.Event) -> None:
+        super().__init__(emoji)
+        self.started = started
+        self.release = release
+
+    def emoji_list(self) -> FakeEmojiListResponse:
+        self.started.set()
+        self.release.wait(timeout=10)
+        return super().emoji_list()
+
+
+def test_shared_catalog_is_loaded_by_one_process_for_all():
+    server = fakeredis.FakeServer()
+    emoji = {"party": "https://example.com/party.png", "partyy": "alias:party"}
+    started, release = threading.Event(), threading.Event()
+    first = SlowFakeClient(emoji, started, release)
+    others = [FakeClient(emoji) for _ in range(3)]
+
+    results = []
+    loading = threading.Thread(target=lambda: results.append(shared_catalog(server).get_emoji(first, "party", None)))  # type: ignore[arg-type]
+    loading.start()
+    started.wait(timeout=10)
+    waiting = [
+        threading.Thread(target=lambda c=c: results.append(shared_catalog(server).get_emoji(c, "partyy", None)))  # type: ignore[misc]
+        for c in others
+    ]
+    for t in waiting:
+        t.start()
+    release.set()
+    for t in (loading, *waiting):
+        t.join(timeout=10)
+
+    assert first.calls == 1
+    assert [c.calls for c in others] == [0, 0, 0], "Everyone else should wait for the first load, not do their own"
+    assert sorted(e.image_url for e in results) == ["https://example.com/party.png"] * (len(others) + 1)
+
+
+def test_shared_catalog_applies_events_and_refreshes_on_miss():
+    server = fakeredis.FakeServer()
+    client = FakeClient({"party": "https://example.com/party.png"})
+    catalog = shared_catalog(server)
+    catalog.get_emoji(client, "party", None)  # type: ignore[arg-type]
+
+    catalog.apply({"subtype": "add", "name": "partyy", "value": "alias:party"})
+    catalog.apply({"subtype": "rename", "old_name": "party", "new_name": "party2", "value": None})
+    assert shared_catalog(server).get_emoji(client, "party2", None).image_url == "https://example.com/party.png"  # type: ignore[arg-type]
+    assert client.calls == 1, "Events should be seen by every process without a fetch"
+
+    client.emoji["surprise"] = "https://example.com/surprise.png"
+    assert shared_catalog(server).get_emoji(client, "surprise", None).name == "surprise"  # type: ignore[arg-type]
+    assert client.calls == 1 + 1, "A miss should fall back to a full fetch"
+
+
+def test_shared_catalog_misses_reuse_a_recent_fetch():
+    server = fakeredis.FakeServer()
+    client = FakeClient({"party": "https://example.com/party.png"})
+    shared_catalog(server).refresh(client)  # type: ignore[arg-type]
+
+    catalog = shared_catalog(server, min_refresh_interval=timedelta(minutes=1))
+    with pytest.raises(KeyError):
+        catalog.get_emoji(client, "missing", None)  # type: ignore[arg-type]
+    with pytest.raises(KeyError):
+        asyncio.run(catalog.async_get_emoji(client, "missing", None))  # type: ignore[arg-type]
+    assert client.calls == 1
+
+    with pytest.raises(KeyError):
+        shared_catalog(server).get_emoji(client, "missing", None)  # type: ignore[arg-type]
+    assert client.calls == 1 + 1, "Without a min_refresh_interval every miss fetches"
+
+
+def test_shared_catalog_search_catches_up_with_other_processes():
+    server = fakeredis.FakeServer()
+    client = FakeClient({"party": "https://example.com/party.png"})
+    catalog, other = shared_catalog(server), shared_catalog(server)
+
+    assert catalog.search(client, "party", 10) == ["party"]  # type: ignore[arg-type]
+    catalog.apply({"subtype": "add", "name": "party-parrot", "value": "https://example.com/party-parrot.png"})
+    assert catalog.search(client, "party", 10) == ["party", "party-parrot"]  # type: ignore[arg-type]
+
+    other.apply({"subtype": "add", "name": "partyparrot", "value": "https://example.com/partyparrot.png"})
+    assert catalog.search(client, "party", 10) == ["party", "party-parrot", "partyparrot"]  # type: ignore[arg-type]
+    assert asyncio.run(other.async_search(client, "parrot", 10)) == ["partyparrot", "party-parrot"]  # type: ignore[arg-type]
+    assert client.calls == 1
+
+
+def test_shared_catalog_async_lookups_and_enterprise_misses():
+    server = fakeredis.FakeServer()
+    catalog = shared_catalog(server, is_enterprise_tenant=True)
+    catalog.refresh(FakeAdminClient({"party": entry("party")}))  # type: ignore[arg-type]
+
+    client = FakeAsyncAdminClient({"party": entry("party")}, {"partyy": {"url": "alias:party", "uploaded_by": "U456"}})
+    emoji = asyncio.run(catalog.async_get_emoji(client, "partyy", None))  # type: ignore[arg-type]
+
+    assert emoji.author == "U456"
+    assert emoji.image_url == "https://example.com/party.png"
+    assert "partyy" in {name.decode() for name in fakeredis.FakeRedis(server=server).hkeys(catalog.key)}
+
+
+class FakeAsyncAdminClient(FakeAdminClient):
+    async def admin_emoji_list(self) -> Any:  # type: ignore[override]  # noqa: ANN401
+        async def pages() -> Any:  # noqa: ANN401
+            for page in super(FakeAsyncAdminClient, self).admin_emoji_list():
+                yield page
+
+        return pages()
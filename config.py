@@ -1,6 +1,24 @@
-from pydantic import Field, RedisDsn, Secret, ValidationError
+from datetime import timedelta
+from pathlib import Path
+from typing import Annotated, Any, Literal
+
+from pydantic import BeforeValidator, Field, RedisDsn, Secret, ValidationError
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from routing import RouteRule
+
+
+def _seconds(value: Any) -> Any:  # noqa: ANN401
+    # Env vars are always strings, which pydantic won't read as a number of seconds on its own
+    try:
+        return float(value) if isinstance(value, str) else value
+    except ValueError:
+        return value
+
+
+# A duration given in seconds, or as an ISO 8601 duration ("PT30S")
+Seconds = Annotated[timedelta, BeforeValidator(_seconds)]
+
 
 class ServerConfig(BaseSettings):
     model_config = SettingsConfigDict(env_prefix="EMOJI_PAPERTRAIL_")
@@ -11,18 +29,106 @@ class ServerConfig(BaseSettings):
 
     request_id_http_header: str = "Fly-Request-Id"
 
+    # Logs are rendered and written from a background thread (see logging_config.py), as JSON lines or, with "auto",
+    # as colourful console output when stdout is a terminal
+    log_level: str = "INFO"
+    log_format: Literal["auto", "json", "console"] = "auto"
+    log_background: bool = True
+    # Lines are dropped, rather than holding up the app, if the writer thread falls this far behind
+    log_queue_max_size: int = 10_000
+    # Logged strings are cut to this many characters, and mappings and sequences to this many items
+    log_max_field_length: int = 1_000
+    log_max_field_items: int = 50
+    # Values under these keys are never logged, at any depth
+    log_redact_keys: frozenset[str] = frozenset(
+        {"token", "bot_token", "user_token", "app_token", "client_secret", "signing_secret", "authorization"},
+    )
+    # The fraction of debug and info lines to keep, by message, e.g. {"Request: Start": 0.01}. Others are all kept.
+    log_sample_rates: dict[str, float] = {}
+
 
 class SlackAppConfig(BaseSettings):
     model_config = SettingsConfigDict(env_prefix="SLACK_APP_")
 
     # Which channel should it post updates to?
     channel: str = "#emoji-papertrail"
+    # Post to other (or more) channels depending on the workspace and emoji, as a JSON list of rules, see routing.py.
+    # Emoji that match no rule go to `channel`.
+    routes: list[RouteRule] = []
 
     # Controls if we post about new aliases being created
     should_report_alias_changes: bool = True
 
     redis_host: RedisDsn | None = None
 
+    # Without Redis, how many emoji we remember having posted about (for up to a week) before forgetting the oldest
+    local_idempotency_max_entries: int = 100_000
+
+    # Run the event handlers as coroutines (AsyncApp, AsyncWebClient, redis.asyncio) rather than on a thread pool
+    async_mode: bool = False
+
+    # Collect the emoji and aliases added to a channel within this window into a single digest post, rather than
+    # posting about each one. Zero turns this off.
+    digest_window: Seconds = timedelta(0)
+
+    # Ack Slack as soon as an event is on a durable Redis Streams queue, and do the actual work from a consumer
+    # (either `worker.py` or threads inside the web process). Needs redis_host.
+    queue_mode: bool = False
+    queue_in_process_consumer: bool = True
+    queue_concurrency: int = 4
+    queue_max_attempts: int = 5
+    # How long a consumer waits on an event's posts before failing the delivery, leaving it to be redelivered
+    queue_post_timeout: Seconds = timedelta(minutes=5)
+
+    # Where to send Slack Web API calls, only worth changing for load testing against a stand-in
+    slack_api_url: str = "https://slack.com/api/"
+
+    # Outbound calls (posts) are paced to stay under Slack's rate limits, per channel and per method across all
+    # channels, as tokens a second and how many can be saved up for a burst
+    outbound_channel_rate: float = 1.0
+    outbound_channel_burst: int = 3
+    outbound_method_rate: float = 5.0
+    outbound_method_burst: int = 10
+    # Most outbound calls out to Slack at once, across every channel
+    outbound_max_in_flight: int = 8
+    # Tries at a call before giving up on it, if Slack keeps answering with a 429
+    outbound_max_attempts: int = 5
+
+    # Slack clients (and their open connections) are reused across events, one per token. At most this many are kept,
+    # and any unused for web_client_idle_timeout are dropped.
+    web_client_pool_max_size: int = 1_000
+    web_client_idle_timeout: Seconds = timedelta(minutes=10)
+
+    # How often the in-process emoji catalog does a full resync with Slack, on top of the incremental updates
+    # it gets from emoji_changed events
+    emoji_catalog_resync_interval: Seconds = timedelta(hours=1)
+    # Lookups that miss within this long of the last full fetch use it rather than fetching again
+    emoji_catalog_min_refresh_interval: Seconds = timedelta(0)
+
+    # Post about emoji added while we weren't listening (see backfill.py) when the web process starts, and then every
+    # catch_up_interval (zero for only at startup). Without Redis, emoji list snapshots are kept in catch_up_snapshot_dir.
+    catch_up_on_startup: bool = False
+    catch_up_interval: Seconds = timedelta(hours=1)
+    catch_up_snapshot_dir: Path = Path(".emoji-papertrail")
+
+    # Do the slow parts of the first event (building the Bolt app, fetching the emoji list, connecting to Slack and
+    # Redis) in the background as soon as the web process starts, rather than when the first event arrives. GET
+    # /_ah/warmup does the same on demand.
+    warm_up_on_startup: bool = False
+
+    # For socket_mode.py: how many envelopes from Slack to handle at once, how often to ping Slack (which is also how
+    # long a dead connection can go unnoticed), and the longest to wait between attempts to reconnect
+    socket_mode_concurrency: int = 10
+    socket_mode_ping_interval: Seconds = timedelta(seconds=5)
+    socket_mode_reconnect_max_delay: Seconds = timedelta(minutes=1)
+
+    # Keep one emoji catalog per workspace in Redis for every process to share, rather than one per process. Only the
+    # process holding the lock fetches the list from Slack. Needs redis_host.
+    shared_emoji_catalog: bool = False
+
+    # Most emoji /emoji-search answers with
+    emoji_search_max_results: int = 20
+
 
 class BotTokenConfig(BaseSettings):
     model_config = SettingsConfigDict(env_prefix="BOT_")
@@ -36,12 +142,19 @@ class SlackOAuthConfig(BaseSettings):
     client_id: Secret[str]
     client_secret: Secret[str]
 
-    bot_scopes: list[str] = Field(alias="_bot_scopes", default=["emoji:read", "chat:write"])
+    bot_scopes: list[str] = Field(alias="_bot_scopes", default=["emoji:read", "chat:write", "commands"])
     user_scopes: list[str] = Field(
         alias="_user_scopes",
         default=["admin.teams:read", "emoji:read", "users:read"],
     )
 
+    # How many past installations to keep per workspace, unset keeps them all
+    installation_history_max_entries: int | None = None
+
+    # How long this process caches installation/bot lookups for authorizing events, 0 turns the cache off
+    installation_cache_ttl: Seconds = timedelta(minutes=5)
+    installation_cache_max_entries: int = 10_000
+
 
 def try_load_settings[T: BaseSettings](settings_class: type[T]) -> T | None:
     try:
@@ -0,0 +1,354 @@
+"""Coalesce bursts of new emoji into one digest post per workspace and channel.
+
+The first emoji to arrive for a workspace's channel opens a window of `app_config.digest_window` and schedules a flush
+for when it closes; everything arriving in the meantime is just appended. With Redis, the buffer and window live there
+so that every gunicorn worker and instance feeds the same digest, and only the process that opened the window posts it.
+If that process dies before flushing, whoever next adds to the digest once it's overdue flushes it instead, as do
+flush_overdue_digests and async_flush_overdue_digests (which starting up and the worker run). Digests nobody flushes
+for a day are dropped.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable, Sequence
+from datetime import timedelta
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import redis
+import redis.asyncio
+from slack_sdk import WebClient
+import structlog
+
+from config import app_config
+from emoji import EmojiInfo
+from messages import EmojiDigestMessage, EmojiUpdateMessage
+from outbound import async_outbound_scheduler, outbound_scheduler
+from redis_utils import async_redis_client, redis_client
+
+if TYPE_CHECKING:
+    # See emoji.py
+    from slack_sdk.web.async_client import AsyncWebClient
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+# Workspace, as (enterprise_id, team_id)
+type _Workspace = tuple[str | None, str | None]
+
+# How long past closing a window has to be before anyone but the process that opened it flushes it
+OVERDUE_AFTER = timedelta(minutes=1)
+
+
+class LocalDigestBuffer:
+    def __init__(self) -> None:
+        self._pending: dict[tuple[_Workspace, str], list[str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, workspace: _Workspace, channel: str, emoji: EmojiInfo, window: timedelta) -> timedelta | None:
+        """Buffer an emoji, returning how long until the caller should flush the digest, or None if that's someone
+        else's job (whoever opened the window).
+        """
+        with self._lock:
+            opened = (workspace, channel) not in self._pending
+            self._pending.setdefault((workspace, channel), []).append(emoji.model_dump_json())
+
+        return window if opened else None
+
+    def drain(self, workspace: _Workspace, channel: str) -> list[EmojiInfo]:
+        with self._lock:
+            pending = self._pending.pop((workspace, channel), [])
+
+        return [EmojiInfo.model_validate_json(e) for e in pending]
+
+
+class _RedisDigestKeys:
+    """The emoji buffered for a workspace's channel are a list, and its open window when it closes (so that something
+    other than the process that opened it can tell it's overdue).
+    """
+
+    # Long past any window, so that an abandoned digest is only dropped once nobody has flushed it for this long
+    KEY_TTL = timedelta(days=1)
+
+    key_prefix: str
+
+    def _key(self, workspace: _Workspace, channel: str) -> str:
+        # Channel last, since it's the only part that could have a colon in it
+        enterprise_id, team_id = workspace
+        return f"{self.key_prefix}:{enterprise_id or '-'}:{team_id or '-'}:{channel}"
+
+    def _pending_key(self, workspace: _Workspace, channel: str) -> str:
+        return f"{self._key(workspace, channel)}:pending"
+
+    def _window_key(self, workspace: _Workspace, channel: str) -> str:
+        return f"{self._key(workspace, channel)}:window"
+
+    def _flush_in(self, channel: str, window: timedelta, *, opened: bool, closes_at: bytes | None) -> timedelta | None:
+        if opened:
+            return window
+        if closes_at is not None and _is_overdue(closes_at):
+            logger.warning("Flushing overdue digest", channel=channel)
+            return timedelta(0)
+        return None
+
+    def _overdue(self, keys: list[bytes], closes_at: list[bytes | None]) -> list[tuple[_Workspace, str]]:
+        overdue = []
+        for key, closes in zip(keys, closes_at, strict=True):
+            # Gone since we listed it, if it's None: someone's just flushed it
+            if closes is not None and _is_overdue(closes):
+                parts = key.decode().removeprefix(f"{self.key_prefix}:").removesuffix(":window")
+                enterprise_id, team_id, channel = parts.split(":", 2)
+                overdue.append(((_unset(enterprise_id), _unset(team_id)), channel))
+        return overdue
+
+
+def _unset(key_part: str) -> str | None:
+    return None if key_part == "-" else key_part
+
+
+def _is_overdue(closes_at: bytes) -> bool:
+    return float(closes_at) + OVERDUE_AFTER.total_seconds() < time.time()
+
+
+class RedisDigestBuffer(_RedisDigestKeys):
+    def __init__(self, redis_client: redis.Redis, key_prefix: str = "emoji-papertrail:digest") -> None:
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+
+    def add(self, workspace: _Workspace, channel: str, emoji: EmojiInfo, window: timedelta) -> timedelta | None:
+        """See LocalDigestBuffer.add."""
+        pending_key, window_key = self._pending_key(workspace, channel), self._window_key(workspace, channel)
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.rpush(pending_key, emoji.model_dump_json())
+            pipe.pexpire(pending_key, window + self.KEY_TTL)
+            pipe.set(window_key, repr(time.time() + window.total_seconds()), nx=True, px=window + self.KEY_TTL)
+            pipe.get(window_key)
+            _, _, opened, closes_at = pipe.execute()
+
+        return self._flush_in(channel, window, opened=bool(opened), closes_at=closes_at)
+
+    def overdue(self) -> list[tuple[_Workspace, str]]:
+        """Workspaces' channels with a digest that should have been flushed by now but hasn't been."""
+        keys = list(self.redis_client.scan_iter(match=f"{self.key_prefix}:*:window"))
+        return self._overdue(keys, self.redis_client.mget(keys) if keys else [])
+
+    def drain(self, workspace: _Workspace, channel: str) -> list[EmojiInfo]:
+        pending_key = self._pending_key(workspace, channel)
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.lrange(pending_key, 0, -1)
+            pipe.delete(pending_key, self._window_key(workspace, channel))
+            pending, _ = pipe.execute()
+
+        return [EmojiInfo.model_validate_json(e) for e in pending]
+
+
+class AsyncRedisDigestBuffer(_RedisDigestKeys):
+    def __init__(self, redis_client: redis.asyncio.Redis, key_prefix: str = "emoji-papertrail:digest") -> None:
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+
+    async def async_add(
+        self,
+        workspace: _Workspace,
+        channel: str,
+        emoji: EmojiInfo,
+        window: timedelta,
+    ) -> timedelta | None:
+        pending_key, window_key = self._pending_key(workspace, channel), self._window_key(workspace, channel)
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.rpush(pending_key, emoji.model_dump_json())
+            pipe.pexpire(pending_key, window + self.KEY_TTL)
+            pipe.set(window_key, repr(time.time() + window.total_seconds()), nx=True, px=window + self.KEY_TTL)
+            pipe.get(window_key)
+            _, _, opened, closes_at = await pipe.execute()
+
+        return self._flush_in(channel, window, opened=bool(opened), closes_at=closes_at)
+
+    async def async_overdue(self) -> list[tuple[_Workspace, str]]:
+        keys = [key async for key in self.redis_client.scan_iter(match=f"{self.key_prefix}:*:window")]
+        return self._overdue(keys, await self.redis_client.mget(keys) if keys else [])
+
+    async def async_drain(self, workspace: _Workspace, channel: str) -> list[EmojiInfo]:
+        pending_key = self._pending_key(workspace, channel)
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.lrange(pending_key, 0, -1)
+            pipe.delete(pending_key, self._window_key(workspace, channel))
+            pending, _ = await pipe.execute()
+
+        return [EmojiInfo.model_validate_json(e) for e in pending]
+
+
+_local_digest_buffer = LocalDigestBuffer()
+_digest_buffer = (
+    RedisDigestBuffer(redis_client(str(app_config.redis_host)))
+    if app_config.redis_host is not None
+    else _local_digest_buffer
+)
+_async_digest_buffer = (
+    AsyncRedisDigestBuffer(async_redis_client(str(app_config.redis_host)))
+    if app_config.redis_host is not None
+    else _local_digest_buffer
+)
+
+# Keep references to the pending async flushes so they don't get garbage collected
+_background_tasks: set[asyncio.Task[None]] = set()
+
+
+def add_to_digest(
+    client: WebClient,
+    channel: str,
+    emoji: EmojiInfo,
+    *,
+    enterprise_id: str | None = None,
+    team_id: str | None = None,
+    _buffer: RedisDigestBuffer | LocalDigestBuffer | None = None,
+) -> None:
+    buffer = _buffer or _digest_buffer
+    window = app_config.digest_window
+    workspace = (enterprise_id, team_id)
+
+    if (flush_in := buffer.add(workspace, channel, emoji, window)) is None:
+        logger.info("Added emoji to open digest", channel=channel, emoji_name=emoji.name)
+        return
+
+    if flush_in:  # Otherwise it's an overdue one, to be flushed straight away
+        logger.info("Opened digest window", channel=channel, emoji_name=emoji.name, window=flush_in.total_seconds())
+    timer = threading.Timer(flush_in.total_seconds(), flush_digest, args=(client, workspace, channel, buffer))
+    timer.daemon = True
+    timer.start()
+
+
+def flush_overdue_digests(
+    clients: Callable[[str | None, str | None], WebClient],
+    _buffer: RedisDigestBuffer | LocalDigestBuffer | None = None,
+) -> None:
+    """Flush the digests whose window closed without anyone flushing them, e.g. because the process that opened it
+    died. `clients` gives the bot client for an (enterprise_id, team_id).
+    """
+    buffer = _buffer or _digest_buffer
+    if isinstance(buffer, LocalDigestBuffer):
+        # Only ever this process's, whose timers will see to them
+        return
+
+    for workspace, channel in buffer.overdue():
+        logger.warning("Flushing overdue digest", channel=channel, enterprise_id=workspace[0], team_id=workspace[1])
+        try:
+            client = clients(*workspace)
+        except Exception:
+            logger.exception("Failed to flush overdue digest", channel=channel)
+            continue
+        flush_digest(client, workspace, channel, buffer)
+
+
+def flush_digest(
+    client: WebClient,
+    workspace: _Workspace,
+    channel: str,
+    buffer: RedisDigestBuffer | LocalDigestBuffer,
+) -> None:
+    try:
+        emojis = buffer.drain(workspace, channel)
+        for message in _digest_messages(emojis):
+            resp = outbound_scheduler.submit(
+                client,
+                "chat.postMessage",
+                channel=channel,
+                text=message.message(),
+                blocks=message.blocks(),
+            ).result()
+            logger.info(
+                "Posted digest to channel",
+                channel=channel,
+                emoji_count=len(emojis),
+                status_code=resp.status_code,
+            )
+    except Exception:
+        logger.exception("Failed to post digest", channel=channel)
+
+
+async def async_add_to_digest(
+    client: "AsyncWebClient",
+    channel: str,
+    emoji: EmojiInfo,
+    *,
+    enterprise_id: str | None = None,
+    team_id: str | None = None,
+    _buffer: AsyncRedisDigestBuffer | LocalDigestBuffer | None = None,
+) -> None:
+    buffer = _buffer or _async_digest_buffer
+    window = app_config.digest_window
+    workspace = (enterprise_id, team_id)
+
+    if isinstance(buffer, LocalDigestBuffer):
+        flush_in = buffer.add(workspace, channel, emoji, window)
+    else:
+        flush_in = await buffer.async_add(workspace, channel, emoji, window)
+
+    if flush_in is None:
+        logger.info("Added emoji to open digest", channel=channel, emoji_name=emoji.name)
+        return
+
+    if flush_in:  # Otherwise it's an overdue one, to be flushed straight away
+        logger.info("Opened digest window", channel=channel, emoji_name=emoji.name, window=flush_in.total_seconds())
+    _background_tasks.add(
+        task := asyncio.create_task(_async_flush_digest_later(client, workspace, channel, buffer, flush_in)),
+    )
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def async_flush_overdue_digests(
+    clients: Callable[[str | None, str | None], Awaitable["AsyncWebClient"]],
+    _buffer: AsyncRedisDigestBuffer | LocalDigestBuffer | None = None,
+) -> None:
+    """See flush_overdue_digests."""
+    buffer = _buffer or _async_digest_buffer
+    if isinstance(buffer, LocalDigestBuffer):
+        return
+
+    for workspace, channel in await buffer.async_overdue():
+        logger.warning("Flushing overdue digest", channel=channel, enterprise_id=workspace[0], team_id=workspace[1])
+        try:
+            client = await clients(*workspace)
+        except Exception:
+            logger.exception("Failed to flush overdue digest", channel=channel)
+            continue
+        await _async_flush_digest_later(client, workspace, channel, buffer, timedelta(0))
+
+
+async def _async_flush_digest_later(
+    client: "AsyncWebClient",
+    workspace: _Workspace,
+    channel: str,
+    buffer: AsyncRedisDigestBuffer | LocalDigestBuffer,
+    flush_in: timedelta,
+) -> None:
+    await asyncio.sleep(flush_in.total_seconds())
+
+    try:
+        if isinstance(buffer, LocalDigestBuffer):
+            emojis = buffer.drain(workspace, channel)
+        else:
+            emojis = await buffer.async_drain(workspace, channel)
+        for message in _digest_messages(emojis):
+            resp = await async_outbound_scheduler.submit(
+                client,
+                "chat.postMessage",
+                channel=channel,
+                text=message.message(),
+                blocks=message.blocks(),
+            )
+            logger.info(
+                "Posted digest to channel",
+                channel=channel,
+                emoji_count=len(emojis),
+                status_code=resp.status_code,
+            )
+    except Exception:
+        logger.exception("Failed to post digest", channel=channel)
+
+
+def _digest_messages(emojis: Sequence[EmojiInfo]) -> Sequence[EmojiUpdateMessage | EmojiDigestMessage]:
+    if len(emojis) == 1:
+        # No point in a digest of one
+        return [EmojiUpdateMessage(emoji=emojis[0])]
+
+    return EmojiDigestMessage.chunked(emojis)
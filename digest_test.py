@@ -0,0 +1,119 @@
+import asyncio
+from datetime import timedelta
+import time
+from typing import Any
+
+import fakeredis
+import pytest
+
+import digest
+from digest import (
+    AsyncRedisDigestBuffer,
+    LocalDigestBuffer,
+    RedisDigestBuffer,
+    async_flush_overdue_digests,
+    flush_overdue_digests,
+)
+from emoji import EmojiInfo
+from messages import EmojiDigestMessage
+from outbound_test import response
+from worker_test import FlakyClient
+
+
+def emoji(name: str) -> EmojiInfo:
+    return EmojiInfo(name=name, image_url=f"https://example.com/{name}.png", author="U123")
+
+
+class FakeAsyncClient(FlakyClient):
+    def __init__(self) -> None:
+        super().__init__(failures=0)
+
+    async def chat_postMessage(self, *, channel: str, **_kwargs: Any) -> Any:  # type: ignore[override]  # noqa: ANN401, N802
+        self.posted.append(channel)
+        return response(200)
+
+
+WINDOW = timedelta(seconds=30)
+WORKSPACE = (None, "T123")
+
+
+def test_local_digest_buffer():
+    buffer = LocalDigestBuffer()
+
+    assert buffer.add(WORKSPACE, "#papertrail", emoji("one"), WINDOW) == WINDOW, "First add opens the window"
+    assert buffer.add(WORKSPACE, "#papertrail", emoji("two"), WINDOW) is None
+    assert buffer.add(WORKSPACE, "#other", emoji("three"), WINDOW) == WINDOW, "Windows are per channel"
+    assert buffer.add((None, "T456"), "#papertrail", emoji("four"), WINDOW) == WINDOW, "And per workspace"
+
+    assert [e.name for e in buffer.drain(WORKSPACE, "#papertrail")] == ["one", "two"]
+    assert buffer.drain(WORKSPACE, "#papertrail") == []
+    assert buffer.add(WORKSPACE, "#papertrail", emoji("five"), WINDOW) == WINDOW, "Draining closes the window"
+
+
+def test_redis_digest_buffer_is_shared():
+    redis_client = fakeredis.FakeRedis()
+    worker_a, worker_b = RedisDigestBuffer(redis_client), RedisDigestBuffer(redis_client)
+
+    assert worker_a.add(WORKSPACE, "#papertrail", emoji("one"), WINDOW) == WINDOW
+    assert worker_b.add(WORKSPACE, "#papertrail", emoji("two"), WINDOW) is None
+
+    assert [e.name for e in worker_a.drain(WORKSPACE, "#papertrail")] == ["one", "two"]
+    assert worker_b.add(WORKSPACE, "#papertrail", emoji("three"), WINDOW) == WINDOW
+
+
+def test_redis_digests_are_kept_apart_by_workspace():
+    buffer = RedisDigestBuffer(fakeredis.FakeRedis())
+
+    assert buffer.add(("E1", "T1"), "#emoji-papertrail", emoji("a-secret"), WINDOW) == WINDOW
+    assert buffer.add((None, "T2"), "#emoji-papertrail", emoji("b-secret"), WINDOW) == WINDOW
+
+    assert [e.name for e in buffer.drain(("E1", "T1"), "#emoji-papertrail")] == ["a-secret"]
+    assert [e.name for e in buffer.drain((None, "T2"), "#emoji-papertrail")] == ["b-secret"]
+
+
+def test_redis_digest_left_behind_is_flushed_once_overdue(monkeypatch: pytest.MonkeyPatch):
+    redis_client = fakeredis.FakeRedis()
+    died, survivor = RedisDigestBuffer(redis_client), RedisDigestBuffer(redis_client)
+    monkeypatch.setattr(digest, "OVERDUE_AFTER", timedelta(0))
+    window = timedelta(seconds=0.2)
+
+    assert died.add(("E123", "T123"), "#paper:trail", emoji("one"), window) == window
+    assert redis_client.ttl("emoji-papertrail:digest:E123:T123:#paper:trail:pending") > 0
+    assert survivor.add(("E123", "T123"), "#paper:trail", emoji("two"), window) is None, "Not overdue yet"
+    assert survivor.overdue() == []
+
+    time.sleep(window.total_seconds() * 1.5)
+    assert survivor.overdue() == [(("E123", "T123"), "#paper:trail")]
+    assert survivor.add(("E123", "T123"), "#paper:trail", emoji("three"), window) == timedelta(0), "Overdue"
+
+    client = FlakyClient(failures=0)
+    flush_overdue_digests(lambda *_workspace: client, survivor)  # type: ignore[arg-type, return-value]
+    assert client.posted == ["#paper:trail"]
+    assert survivor.overdue() == []
+
+
+def test_async_redis_digest_left_behind_is_flushed(monkeypatch: pytest.MonkeyPatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(digest, "OVERDUE_AFTER", timedelta(0))
+    RedisDigestBuffer(fakeredis.FakeRedis(server=server)).add(WORKSPACE, "#papertrail", emoji("one"), timedelta(0))
+    time.sleep(0.01)
+
+    client, flushed_for = FakeAsyncClient(), []
+
+    async def clients(*workspace: str | None) -> FakeAsyncClient:
+        flushed_for.append(workspace)
+        return client
+
+    buffer = AsyncRedisDigestBuffer(fakeredis.FakeAsyncRedis(server=server))
+    asyncio.run(async_flush_overdue_digests(clients, buffer))  # type: ignore[arg-type]
+    assert flushed_for == [WORKSPACE]
+    assert client.posted == ["#papertrail"]
+    assert asyncio.run(buffer.async_overdue()) == []
+
+
+def test_digest_message_fits_in_slack_limits():
+    messages = EmojiDigestMessage.chunked([emoji(f"emoji-{i}") for i in range(EmojiDigestMessage.MAX_EMOJI + 1)])
+
+    assert [len(m.emojis) for m in messages] == [EmojiDigestMessage.MAX_EMOJI, 1]
+    assert len(messages[0].blocks()) <= EmojiDigestMessage.MAX_BLOCKS
+    assert messages[0].message() == f"New {EmojiDigestMessage.MAX_EMOJI} emoji added by <@U123>!"
@@ -1,10 +1,20 @@
-from collections.abc import Iterable, Mapping
-from typing import Optional
+from array import array
+from collections.abc import Iterable, Iterator, Mapping, MutableMapping
+import sys
+from typing import TYPE_CHECKING, Any, Optional
 
 from pydantic import BaseModel
 from slack_sdk import WebClient
+from slack_sdk.web.async_slack_response import AsyncSlackResponse
+from slack_sdk.web.slack_response import SlackResponse
 import structlog
 
+from metrics import SLACK_API_CALLS
+
+if TYPE_CHECKING:
+    # Only for annotations, since importing it imports aiohttp, which sync mode has no use for
+    from slack_sdk.web.async_client import AsyncWebClient
+
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
 
@@ -58,24 +68,170 @@ def get_emoji(client: WebClient, name: str, url: str | None, *, is_enterprise_te
 
     log.info("Fetching emoji info")
 
+    emoji_list = find_admin_emoji(client, name, url) if is_enterprise_tenant else get_emoji_list(client)
+
+    return EmojiInfo.from_emoji_list(name, url, emoji_list)
+
+
+def get_emoji_list(client: WebClient, *, is_enterprise_tenant: bool = False) -> "CompactEmojiList":
     _get_emoji = _get_admin_emoji_list if is_enterprise_tenant else _get_emoji_list
 
-    emoji_list = _get_emoji(client)
+    return _get_emoji(client)
+
+
+async def async_get_emoji(
+    client: "AsyncWebClient",
+    name: str,
+    url: str | None,
+    *,
+    is_enterprise_tenant: bool = False,
+) -> EmojiInfo:
+    log = logger.bind(emoji_name=name, emoji_url=url)
+
+    log.info("Fetching emoji info")
+
+    if is_enterprise_tenant:
+        emoji_list = await async_find_admin_emoji(client, name, url)
+    else:
+        emoji_list = await async_get_emoji_list(client)
 
     return EmojiInfo.from_emoji_list(name, url, emoji_list)
 
 
+async def async_get_emoji_list(
+    client: "AsyncWebClient",
+    *,
+    is_enterprise_tenant: bool = False,
+) -> "CompactEmojiList":
+    _get_emoji = _async_get_admin_emoji_list if is_enterprise_tenant else _async_get_emoji_list
+
+    return await _get_emoji(client)
+
+
 class EmojiListEntry(BaseModel):
     name: str
     url: str
     uploaded_by: str | None = None
 
 
-def _get_emoji_list(client: WebClient) -> Mapping[str, EmojiListEntry]:
+class CompactEmojiList(MutableMapping[str, EmojiListEntry]):
+    """An emoji list stored as packed columns rather than as one EmojiListEntry per emoji.
+
+    Every worker keeps its own copy of the list and big workspaces have tens of thousands of emoji, so: names are
+    interned, URLs are split into a prefix shared with other emoji (e.g. `https://emoji.slack-edge.com/T0123/`) and the
+    rest packed into one buffer, and uploaders are indexes into a table of user IDs. EmojiListEntrys are only built when
+    looked up.
+
+    Replacing or removing an emoji leaves its old row behind, so lists that change a lot should be rebuilt now and
+    again, as EmojiCatalog does on every resync.
+    """
+
+    def __init__(self, entries: Iterable[tuple[str, str, str | None]] = ()) -> None:
+        self._rows: dict[str, int] = {}
+        self._prefixes: list[str] = []
+        self._prefix_ids: dict[str, int] = {}
+        self._users: list[str] = []
+        self._user_ids: dict[str, int] = {}
+
+        # One value per row
+        self._row_prefixes = array("I")
+        self._row_suffix_ends = array("Q")
+        self._row_users = array("I")  # 0 for no uploader, otherwise 1 + the index into _users
+        self._suffixes = bytearray()
+
+        for name, url, uploaded_by in entries:
+            self.add(name, url, uploaded_by)
+
+    def add(self, name: str, url: str, uploaded_by: str | None = None) -> None:
+        if not isinstance(name, str) or not isinstance(url, str) or not isinstance(uploaded_by, str | None):
+            msg = "Invalid emoji list entry"
+            raise TypeError(msg)
+
+        prefix, suffix = _split_url(url)
+        if (prefix_id := self._prefix_ids.get(prefix)) is None:
+            prefix_id = self._prefix_ids[prefix] = len(self._prefixes)
+            self._prefixes.append(sys.intern(prefix))
+
+        user_id = 0
+        if uploaded_by is not None and (user_id := self._user_ids.get(uploaded_by, 0)) == 0:
+            self._users.append(sys.intern(uploaded_by))
+            user_id = self._user_ids[uploaded_by] = len(self._users)
+
+        row = len(self._row_prefixes)
+        self._suffixes += suffix.encode()
+        self._row_suffix_ends.append(len(self._suffixes))
+        self._row_prefixes.append(prefix_id)
+        self._row_users.append(user_id)
+        # Last, so lookups never see a row that's only partly written
+        self._rows[sys.intern(name)] = row
+
+    def __getitem__(self, name: str) -> EmojiListEntry:
+        row = self._rows[name]
+        start = self._row_suffix_ends[row - 1] if row else 0
+        user_id = self._row_users[row]
+
+        # Already checked by add, so skip validating again
+        return EmojiListEntry.model_construct(
+            name=name,
+            url=self._prefixes[self._row_prefixes[row]] + self._suffixes[start : self._row_suffix_ends[row]].decode(),
+            uploaded_by=self._users[user_id - 1] if user_id else None,
+        )
+
+    def rows(self) -> Iterator[tuple[str, str, str | None]]:
+        """Every emoji as (name, url, uploaded_by), without building an EmojiListEntry for each."""
+        prefixes, users, suffixes = self._prefixes, self._users, self._suffixes
+        for name, row in self._rows.items():
+            start = self._row_suffix_ends[row - 1] if row else 0
+            user_id = self._row_users[row]
+            yield (
+                name,
+                prefixes[self._row_prefixes[row]] + suffixes[start : self._row_suffix_ends[row]].decode(),
+                users[user_id - 1] if user_id else None,
+            )
+
+    def __setitem__(self, name: str, entry: EmojiListEntry) -> None:
+        self.add(name, entry.url, entry.uploaded_by)
+
+    def __delitem__(self, name: str) -> None:
+        del self._rows[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def _split_url(url: str) -> tuple[str, str]:
+    """Split `url` into the part other emoji's URLs share and the rest, going by Slack's scheme://host/team/name/..."""
+    if url.startswith("alias:"):
+        return "alias:", url.removeprefix("alias:")
+
+    parts = url.split("/", 4)
+    if len(parts) < 5:  # noqa: PLR2004
+        return "", url
+
+    return url[: len(url) - len(parts[4])], parts[4]
+
+
+def _get_emoji_list(client: WebClient) -> CompactEmojiList:
+    logger.info("Fetching emoji list")
+
+    SLACK_API_CALLS.labels("emoji.list").inc()
+    return _parse_emoji_list(client.emoji_list())
+
+
+async def _async_get_emoji_list(client: "AsyncWebClient") -> CompactEmojiList:
     logger.info("Fetching emoji list")
 
-    resp = client.emoji_list()
+    SLACK_API_CALLS.labels("emoji.list").inc()
+    return _parse_emoji_list(await client.emoji_list())
+
 
+def _parse_emoji_list(resp: SlackResponse | AsyncSlackResponse) -> CompactEmojiList:
     if resp.status_code != 200:  # noqa: PLR2004
         msg = "Could not get emoji list"
         raise ValueError(msg)
@@ -90,18 +246,105 @@ def _get_emoji_list(client: WebClient) -> Mapping[str, EmojiListEntry]:
 
     # 🙏
 
-    return {name: EmojiListEntry(name=name, url=url) for name, url in resp.data["emoji"].items()}
+    return CompactEmojiList((name, url, None) for name, url in resp.data["emoji"].items())
 
 
 def _get_admin_emoji_list(
     client: WebClient,
-) -> Mapping[str, EmojiListEntry]:
-    def _pages() -> Iterable[tuple[str, EmojiListEntry]]:
+) -> CompactEmojiList:
+    emoji_list = CompactEmojiList()
+    for page in client.admin_emoji_list():
+        SLACK_API_CALLS.labels("admin.emoji.list").inc()
+        for emoji_name, emoji_info in page["emoji"].items():
+            emoji_list.add(emoji_name, emoji_info.get("url"), emoji_info.get("uploaded_by"))
+
+    return emoji_list
+
+
+async def _async_get_admin_emoji_list(
+    client: "AsyncWebClient",
+) -> CompactEmojiList:
+    emoji_list = CompactEmojiList()
+    async for page in await client.admin_emoji_list():
+        SLACK_API_CALLS.labels("admin.emoji.list").inc()
+        for emoji_name, emoji_info in page["emoji"].items():
+            emoji_list.add(emoji_name, emoji_info.get("url"), emoji_info.get("uploaded_by"))
+
+    return emoji_list
+
+
+def alias_target(url: str | None) -> str | None:
+    return url.removeprefix("alias:") if url is not None and url.startswith("alias:") else None
+
+
+class _AdminEmojiLookup:
+    """Picks `name` and whatever it's an alias of out of admin.emoji.list pages, ignoring everything else."""
+
+    def __init__(self, name: str, url: str | None) -> None:
+        self.found: dict[str, EmojiListEntry] = {}
+        self.wanted = {name}
+        # Names we only started looking for partway through the current pass, so might have already skipped over
+        self.learned: set[str] = set()
+        if (target := alias_target(url)) is not None:
+            self.wanted.add(target)
+
+    @property
+    def pending(self) -> set[str]:
+        return self.wanted - self.found.keys()
+
+    def needs_another_pass(self) -> bool:
+        """Whether anything still missing could have been on a page we already read past, resetting for the next pass."""
+        again = bool(self.pending & self.learned)
+        self.learned = set()
+        return again
+
+    def feed(self, page: Mapping[str, Mapping[str, Any]]) -> bool:
+        """Take what we need from a page of `emoji`, returning True once there's nothing left to look for."""
+        # Looping since an alias target we only just learned about might be on this same page
+        while matches := [name for name in self.pending if name in page]:
+            for name in matches:
+                entry = EmojiListEntry.model_validate({"name": name, **page[name]})
+                self.found[name] = entry
+                if (target := alias_target(entry.url)) is not None and target not in self.wanted:
+                    self.wanted.add(target)
+                    self.learned.add(target)
+
+        return not self.pending
+
+
+def find_admin_emoji(client: WebClient, name: str, url: str | None) -> Mapping[str, EmojiListEntry]:
+    """Just the entries needed to build `name`'s EmojiInfo, reading admin.emoji.list only as far as we have to.
+
+    Only matching entries are validated and each page is dropped once read, so this costs however far into the list
+    the emoji are rather than the size of the list. Returns whatever it did find if some aren't listed at all.
+    """
+    lookup = _AdminEmojiLookup(name, url)
+
+    while True:
         for page in client.admin_emoji_list():
-            for emoji_name, emoji_info in page["emoji"].items():
-                yield (
-                    emoji_name,
-                    EmojiListEntry.model_validate({"name": emoji_name, **emoji_info}),
-                )
+            SLACK_API_CALLS.labels("admin.emoji.list").inc()
+            if lookup.feed(page["emoji"]):
+                return lookup.found
+
+        if not lookup.needs_another_pass():
+            break
+
+    logger.info("Emoji missing from admin.emoji.list", emoji_name=name, missing=sorted(lookup.pending))
+    return lookup.found
+
+
+async def async_find_admin_emoji(client: "AsyncWebClient", name: str, url: str | None) -> Mapping[str, EmojiListEntry]:
+    """See find_admin_emoji."""
+    lookup = _AdminEmojiLookup(name, url)
+
+    while True:
+        async for page in await client.admin_emoji_list():
+            SLACK_API_CALLS.labels("admin.emoji.list").inc()
+            if lookup.feed(page["emoji"]):
+                return lookup.found
+
+        if not lookup.needs_another_pass():
+            break
 
-    return dict(_pages())
+    logger.info("Emoji missing from admin.emoji.list", emoji_name=name, missing=sorted(lookup.pending))
+    return lookup.found
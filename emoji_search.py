@@ -0,0 +1,141 @@
+"""Finding emoji by name, for /emoji-search, from an index kept in memory rather than by asking Slack.
+
+Names are kept sorted, so every name starting with the query is found by bisecting to it. That's all a prefix trie would
+give us, for a fraction of the memory. Every three character substring of a name (its trigrams) lists the names it's in,
+so names containing the query anywhere, or sharing most of its trigrams when nothing contains it, come from checking only
+the names under the query's rarest trigrams.
+"""
+
+from array import array
+import bisect
+from collections import Counter
+from collections.abc import Iterable
+from itertools import islice
+
+
+def normalize_query(query: str) -> str:
+    """`:Party-Parrot: ` as `party-parrot`, since that's how names are written and how people write them."""
+    return query.strip().strip(":").lower()
+
+
+def trigrams(name: str) -> set[str]:
+    return {name[i : i + 3] for i in range(len(name) - 2)}
+
+
+def _has(ids: "array[int]", name_id: int) -> bool:
+    # Names are only ever numbered upwards, so every list of them is sorted
+    i = bisect.bisect_left(ids, name_id)
+    return i < len(ids) and ids[i] == name_id
+
+
+class EmojiSearchIndex:
+    """The names of a workspace's emoji, indexed by prefix and by trigram.
+
+    Names are numbered as they're added, shortest first when building, and trigrams point at those numbers. So going
+    through the names under a trigram in order finds the shorter ones, which are usually what's wanted, first.
+
+    Removing a name leaves its number behind under its trigrams, skipped when searching, so an index that sees a lot of
+    removes should be rebuilt now and again, as the catalogs do on every resync.
+    """
+
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self._names: list[str | None] = []  # None once removed
+        self._ids: dict[str, int] = {}
+        self._sorted: list[str] = []
+        self._trigrams: dict[str, array[int]] = {}
+
+        for name in sorted(set(names), key=lambda name: (len(name), name)):
+            self._add(name)
+        self._sorted = sorted(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._ids
+
+    def _add(self, name: str) -> bool:
+        if name in self._ids:
+            return False
+
+        name_id = self._ids[name] = len(self._names)
+        self._names.append(name)
+        for trigram in trigrams(name):
+            if (ids := self._trigrams.get(trigram)) is None:
+                ids = self._trigrams[trigram] = array("I")
+            ids.append(name_id)
+        return True
+
+    def add(self, name: str) -> None:
+        if self._add(name):
+            bisect.insort(self._sorted, name)
+
+    def remove(self, name: str) -> None:
+        if (name_id := self._ids.pop(name, None)) is None:
+            return
+
+        self._names[name_id] = None
+        del self._sorted[bisect.bisect_left(self._sorted, name)]
+
+    def rename(self, old_name: str, new_name: str) -> None:
+        self.remove(old_name)
+        self.add(new_name)
+
+    def search(self, query: str, limit: int = 20) -> list[str]:
+        """Up to `limit` names matching `query`, best first: the name itself, names starting with it, names containing it
+        (shortest first). If there are none of those, names a typo or so away instead, by how many trigrams they share
+        with it (most alike first). Queries shorter than a trigram only match by prefix.
+        """
+        query = normalize_query(query)
+        if not query or limit <= 0:
+            return []
+
+        found: dict[str, None] = {}  # An ordered set
+        if query in self._ids:
+            found[query] = None
+        self._find_starting_with(query, found, limit)
+
+        query_trigrams = trigrams(query)
+        if len(found) < limit and query_trigrams:
+            postings = sorted((self._trigrams.get(trigram, array("I")) for trigram in query_trigrams), key=len)
+            self._find_containing(query, postings[0], found, limit)
+            if not found:
+                self._find_alike(postings, found, limit)
+
+        return list(found)
+
+    def _find_starting_with(self, query: str, found: dict[str, None], limit: int) -> None:
+        for name in islice(self._sorted, bisect.bisect_left(self._sorted, query), None):
+            if len(found) >= limit or not name.startswith(query):
+                return
+            found[name] = None
+
+    def _find_containing(self, query: str, rarest: "array[int]", found: dict[str, None], limit: int) -> None:
+        # Anything containing the query has all its trigrams, so is under the rarest of them
+        containing: list[str] = []
+        for name_id in rarest:
+            name = self._names[name_id]
+            if name is not None and query in name and name not in found:
+                containing.append(name)
+                if len(found) + len(containing) >= limit:
+                    break
+        found.update(dict.fromkeys(sorted(containing, key=lambda name: (len(name), name))))
+
+    def _find_alike(self, postings: list["array[int]"], found: dict[str, None], limit: int) -> None:
+        # At least half the query's trigrams, and all but the three a typo would change. Anything with that many has at
+        # least one of the rarest few of them, so only those need counting up.
+        needed = max((len(postings) + 1) // 2, len(postings) - 3)
+        rarest, others = postings[: len(postings) - needed + 1], postings[len(postings) - needed + 1 :]
+
+        # Nor can it have many more or fewer trigrams than the query
+        leeway = len(postings) - needed
+
+        alike = []
+        for name_id, count in Counter(name_id for ids in rarest for name_id in ids).items():
+            name = self._names[name_id]
+            if name is None or abs(len(name) - 2 - len(postings)) > leeway or name in found:
+                continue
+            if (shared := count + sum(_has(ids, name_id) for ids in others)) >= needed:
+                # Jaccard similarity, as near as the name's length tells us how many trigrams it has
+                alike.append((-shared / (len(postings) + len(name) - 2 - shared), name))
+        found.update((name, None) for _, name in sorted(alike)[: limit - len(found)])
@@ -0,0 +1,57 @@
+from emoji_search import EmojiSearchIndex, normalize_query
+
+NAMES = [
+    "party-parrot",
+    "partyparrot",
+    "parrot",
+    "sad-parrot",
+    "blob-party",
+    "thinking",
+    "thinking-face",
+    "face-palm",
+    "ship",
+    "shipit",
+]
+
+
+def test_search_ranks_exact_then_prefix_then_substring_matches():
+    index = EmojiSearchIndex(NAMES)
+
+    assert index.search("parrot") == ["parrot", "sad-parrot", "partyparrot", "party-parrot"]
+    assert index.search(":Party:") == ["party-parrot", "partyparrot", "blob-party"]
+    assert index.search("face") == ["face-palm", "thinking-face"]
+    assert index.search("parrot", limit=2) == ["parrot", "sad-parrot"]
+
+
+def test_search_falls_back_to_names_a_typo_away():
+    index = EmojiSearchIndex(NAMES)
+
+    assert index.search("thnking") == ["thinking"]
+    assert index.search("partyparot") == ["partyparrot", "party-parrot"]
+    assert index.search("zzz") == []
+
+
+def test_short_queries_only_match_by_prefix():
+    index = EmojiSearchIndex(NAMES)
+
+    assert index.search("sh") == ["ship", "shipit"]
+    assert index.search("it") == []
+    assert index.search("  ") == []
+
+
+def test_index_follows_adds_removes_and_renames():
+    index = EmojiSearchIndex(NAMES)
+
+    index.add("parrot-wave")
+    index.remove("sad-parrot")
+    index.rename("shipit", "ship-it")
+    index.add("parrot-wave")
+
+    assert index.search("parrot") == ["parrot", "parrot-wave", "partyparrot", "party-parrot"]
+    assert index.search("ship") == ["ship", "ship-it"]
+    assert "shipit" not in index
+    assert len(index) == len(NAMES)
+
+
+def test_normalize_query():
+    assert normalize_query("  :Party-Parrot: ") == "party-parrot"
@@ -0,0 +1,95 @@
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+
+from emoji import CompactEmojiList, EmojiInfo, EmojiListEntry, find_admin_emoji
+
+
+class FakeAdminClient:
+    """admin.emoji.list, one page per dict, counting how many pages get read."""
+
+    def __init__(self, *pages: dict[str, dict[str, Any]]) -> None:
+        self.pages = pages
+        self.pages_read = 0
+
+    def admin_emoji_list(self) -> Iterator[dict[str, Any]]:
+        for page in self.pages:
+            self.pages_read += 1
+            yield {"emoji": page}
+
+
+def entry(name: str, uploaded_by: str = "U123") -> dict[str, Any]:
+    return {"url": f"https://example.com/{name}.png", "uploaded_by": uploaded_by}
+
+
+# Would fail validation, so lookups can't be validating anything they don't need
+INVALID = {"url": None}
+
+
+def test_lookup_stops_at_the_page_with_the_emoji():
+    client = FakeAdminClient(
+        {"unrelated": INVALID},
+        {"party": entry("party")},
+        {"never-read": entry("never-read")},
+    )
+
+    found = find_admin_emoji(client, "party", "https://example.com/party.png")  # type: ignore[arg-type]
+
+    assert set(found) == {"party"}
+    assert client.pages_read == len(client.pages) - 1
+
+
+def test_lookup_follows_alias_targets():
+    client = FakeAdminClient(
+        {"party": entry("party"), "unrelated": INVALID},
+        {"partyy": {"url": "alias:party", "uploaded_by": "U456"}},
+        {"never-read": entry("never-read")},
+    )
+
+    # No url to go on, so we only learn partyy is an alias once we're past party and have to go back for it
+    found = find_admin_emoji(client, "partyy", None)  # type: ignore[arg-type]
+    emoji = EmojiInfo.from_emoji_list("partyy", None, found)
+
+    assert emoji.alias_of is not None
+    assert emoji.image_url == "https://example.com/party.png"
+    assert emoji.author == "U456"
+
+
+def test_lookup_of_a_missing_emoji_reads_the_list_once():
+    client = FakeAdminClient({"party": entry("party")}, {"parrot": entry("parrot")})
+
+    assert find_admin_emoji(client, "missing", None) == {}  # type: ignore[arg-type]
+    assert client.pages_read == len(client.pages)
+
+
+def test_compact_emoji_list_round_trips_entries():
+    entries = [
+        ("party", "https://emoji.slack-edge.com/T0123/party/abc123.png", "U123"),
+        ("parrot", "https://emoji.slack-edge.com/T0123/parrot/def456.gif", "U456"),
+        ("partyy", "alias:party", "U123"),
+        ("elsewhere", "https://example.com/elsewhere.png", None),
+        ("🎉", "https://emoji.slack-edge.com/T0123/%F0%9F%8E%89/ghi789.png", None),
+    ]
+
+    emoji_list = CompactEmojiList(entries)
+
+    assert list(emoji_list) == [name for name, _, _ in entries]
+    assert [(e.name, e.url, e.uploaded_by) for e in emoji_list.values()] == entries
+    assert "party" in emoji_list
+    assert "missing" not in emoji_list
+
+
+def test_compact_emoji_list_replaces_and_removes_entries():
+    emoji_list = CompactEmojiList([("party", "https://example.com/party.png", "U123")])
+
+    emoji_list["party"] = EmojiListEntry(name="party", url="https://example.com/party2.png")
+    emoji_list["parrot"] = EmojiListEntry(name="parrot", url="alias:party", uploaded_by="U456")
+    assert emoji_list.pop("parrot").uploaded_by == "U456"
+
+    assert dict(emoji_list) == {"party": EmojiListEntry(name="party", url="https://example.com/party2.png")}
+
+
+def test_compact_emoji_list_rejects_invalid_entries():
+    with pytest.raises(TypeError):
+        CompactEmojiList().add("party", INVALID["url"])  # type: ignore[arg-type]
@@ -0,0 +1,196 @@
+"""Durable queue of emoji_changed events, so we can ack Slack before doing any of the slow work.
+
+Built on a Redis Stream with a consumer group: the HTTP handler XADDs the event and returns, consumers (`worker.py` or
+in-process threads) XREADGROUP it, and only XACK once it has been handled. Anything left pending longer than
+`claim_idle` is reclaimed and retried, and after `max_attempts` deliveries it's moved to a dead-letter stream.
+"""
+
+from collections.abc import Callable, Mapping
+from datetime import timedelta
+import threading
+from typing import Any
+
+from pydantic import BaseModel
+import redis
+import redis.asyncio
+import redis.exceptions as redis_exceptions
+import structlog
+
+from config import app_config
+from redis_utils import async_redis_client, redis_client
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+STREAM = "emoji-papertrail:events"
+CONSUMER_GROUP = "emoji-papertrail"
+
+
+class EmojiEventJob(BaseModel):
+    event: dict[str, Any]
+
+    enterprise_id: str | None = None
+    team_id: str | None = None
+    is_enterprise_install: bool = False
+
+    @classmethod
+    def from_context(
+        cls: type["EmojiEventJob"],
+        event: Mapping[str, Any],
+        context: Mapping[str, Any],
+    ) -> "EmojiEventJob":
+        return cls(
+            event=dict(event),
+            enterprise_id=context.get("enterprise_id"),
+            team_id=context.get("team_id"),
+            is_enterprise_install=context.get("is_enterprise_install") or False,
+        )
+
+
+class EmojiEventQueue:
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        *,
+        stream: str = STREAM,
+        group: str = CONSUMER_GROUP,
+        max_attempts: int = 5,
+        claim_idle: timedelta = timedelta(minutes=1),
+    ) -> None:
+        self.redis_client = redis_client
+        self.stream = stream
+        self.dead_letter_stream = f"{stream}:dead-letter"
+        self.group = group
+        self.max_attempts = max_attempts
+        self.claim_idle = claim_idle
+
+    def ensure_group(self) -> None:
+        try:
+            self.redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis_exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def enqueue(self, job: EmojiEventJob) -> str:
+        message_id = self.redis_client.xadd(self.stream, {"job": job.model_dump_json()})
+        return _decode(message_id)
+
+    def consume(
+        self,
+        consumer: str,
+        handler: Callable[[EmojiEventJob], None],
+        *,
+        count: int = 10,
+        block: timedelta | None = timedelta(seconds=5),
+    ) -> int:
+        """Handle one batch of jobs, returning how many were handled successfully.
+
+        Retries (jobs another consumer gave up on or crashed holding) are picked up before new ones.
+        """
+        _, reclaimed, *_ = self.redis_client.xautoclaim(
+            self.stream,
+            self.group,
+            consumer,
+            min_idle_time=int(self.claim_idle.total_seconds() * 1000),
+            count=count,
+        )
+        messages = list(reclaimed)
+
+        if len(messages) < count:
+            for _, new in self.redis_client.xreadgroup(
+                self.group,
+                consumer,
+                {self.stream: ">"},
+                count=count - len(messages),
+                block=None if block is None else int(block.total_seconds() * 1000),
+            ):
+                messages.extend(new)
+
+        handled = 0
+        for message_id, fields in messages:
+            if fields is None:
+                # Trimmed or deleted out from under us
+                self.redis_client.xack(self.stream, self.group, message_id)
+                continue
+
+            log = logger.bind(message_id=_decode(message_id), consumer=consumer)
+            try:
+                handler(EmojiEventJob.model_validate_json(fields[b"job"]))
+            except Exception:
+                log.exception("Failed to handle queued event")
+                self._maybe_dead_letter(message_id, fields, log)
+                continue
+
+            self.redis_client.xack(self.stream, self.group, message_id)
+            handled += 1
+
+        return handled
+
+    def _maybe_dead_letter(
+        self,
+        message_id: bytes,
+        fields: Mapping[bytes, bytes],
+        log: structlog.stdlib.BoundLogger,
+    ) -> None:
+        pending = self.redis_client.xpending_range(self.stream, self.group, min=message_id, max=message_id, count=1)
+        attempts = pending[0]["times_delivered"] if pending else self.max_attempts
+
+        if attempts < self.max_attempts:
+            log.info("Will retry queued event", attempts=attempts)
+            return
+
+        log.error("Giving up on queued event, moving it to the dead-letter stream", attempts=attempts)
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.xadd(self.dead_letter_stream, {**fields, b"message_id": message_id})
+            pipe.xack(self.stream, self.group, message_id)
+            pipe.execute()
+
+
+def _decode(value: bytes | str) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+_queue_redis = redis_client(str(app_config.redis_host)) if app_config.queue_mode else None
+_async_queue_redis = async_redis_client(str(app_config.redis_host)) if app_config.queue_mode else None
+
+
+def event_queue() -> EmojiEventQueue:
+    if _queue_redis is None:
+        msg = "The event queue needs SLACK_APP_QUEUE_MODE and SLACK_APP_REDIS_HOST set"
+        raise RuntimeError(msg)
+
+    return EmojiEventQueue(_queue_redis, max_attempts=app_config.queue_max_attempts)
+
+
+def enqueue(job: EmojiEventJob) -> str:
+    return event_queue().enqueue(job)
+
+
+async def async_enqueue(job: EmojiEventJob, _redis: redis.asyncio.Redis | None = None) -> str:
+    if _redis is None:
+        _redis = _async_queue_redis
+    if _redis is None:
+        msg = "The event queue needs SLACK_APP_QUEUE_MODE and SLACK_APP_REDIS_HOST set"
+        raise RuntimeError(msg)
+
+    message_id = await _redis.xadd(STREAM, {"job": job.model_dump_json()})
+    return _decode(message_id)
+
+
+def run_consumer(
+    queue: EmojiEventQueue,
+    consumer: str,
+    handler: Callable[[EmojiEventJob], None],
+    stop: threading.Event,
+) -> None:
+    log = logger.bind(consumer=consumer)
+    log.info("Starting event queue consumer")
+
+    queue.ensure_group()
+    while not stop.is_set():
+        try:
+            queue.consume(consumer, handler)
+        except redis_exceptions.RedisError:
+            log.exception("Event queue consumer lost Redis, backing off")
+            stop.wait(5)
+
+    log.info("Stopped event queue consumer")
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+import fakeredis
+import pytest
+
+from event_queue import EmojiEventJob, EmojiEventQueue, enqueue
+
+
+def event_queue() -> EmojiEventQueue:
+    queue = EmojiEventQueue(fakeredis.FakeRedis(), max_attempts=2, claim_idle=timedelta(0))
+    queue.ensure_group()
+    return queue
+
+
+def job(name: str) -> EmojiEventJob:
+    return EmojiEventJob(
+        event={"type": "emoji_changed", "subtype": "add", "name": name, "value": "https://x", "event_ts": "1.0"},
+        team_id="T123",
+    )
+
+
+def test_consume_acks_handled_jobs():
+    queue = event_queue()
+    queue.enqueue(job("one"))
+    queue.enqueue(job("two"))
+
+    seen: list[EmojiEventJob] = []
+    assert queue.consume("consumer-1", seen.append, block=None) == len(seen)
+
+    assert [j.event["name"] for j in seen] == ["one", "two"]
+    assert seen[0].team_id == "T123"
+    assert queue.redis_client.xpending(queue.stream, queue.group)["pending"] == 0
+
+
+def test_failing_jobs_are_retried_then_dead_lettered():
+    queue = event_queue()
+    queue.enqueue(job("broken"))
+
+    attempts: list[str] = []
+
+    def handler(j: EmojiEventJob) -> None:
+        attempts.append(j.event["name"])
+        msg = "nope"
+        raise RuntimeError(msg)
+
+    for _ in range(queue.max_attempts):
+        assert queue.consume("consumer-1", handler, block=None) == 0
+
+    assert attempts == ["broken"] * queue.max_attempts
+    assert queue.redis_client.xpending(queue.stream, queue.group)["pending"] == 0
+    assert queue.redis_client.xlen(queue.dead_letter_stream) == 1
+
+    # Nothing left to retry
+    assert queue.consume("consumer-1", handler, block=None) == 0
+    assert len(attempts) == queue.max_attempts
+
+
+def test_enqueue_needs_queue_mode():
+    with pytest.raises(RuntimeError):
+        enqueue(job("nope"))
@@ -0,0 +1,14 @@
+"""Picked up automatically by gunicorn when it's started from this directory (see app.yaml)."""
+
+import os
+from typing import Any
+
+
+def child_exit(_server: Any, worker: Any) -> None:  # noqa: ANN401
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return
+
+    from prometheus_client import multiprocess
+
+    # Drop the dead worker's live gauges, its counters and histograms keep counting towards the totals
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,8 +1,21 @@
+import asyncio
 from datetime import timedelta
 
+import fakeredis
 import time_machine
 
-from idemptotency import has_handled
+from idemptotency import (
+    LocalIdempotencyStore,
+    async_has_handled,
+    async_has_handled_many,
+    claim_unhandled,
+    forget_handled,
+    has_handled,
+    has_handled_many,
+    has_seen_event,
+    mark_posted,
+    not_yet_posted,
+)
 
 
 def test_has_handled():
@@ -17,3 +30,108 @@ def test_has_handled():
         tm.shift(timedelta(days=14))
 
         assert has_handled("test", "12345") is False, "After advancing time, it should go back to being false"
+
+
+def test_local_store_evicts_expired_entries():
+    store = LocalIdempotencyStore(max_entries=100)
+
+    with time_machine.travel(0, tick=False) as tm:
+        for i in range(10):
+            store.set(f"key-{i}", "value", ex=timedelta(seconds=10))
+
+        tm.shift(timedelta(seconds=11))
+        assert store.set("fresh", "value", ex=timedelta(seconds=10), get=True) is None
+
+        assert len(store) == 1, "Expired keys should have been evicted on the next set"
+
+
+def test_local_store_evicts_least_recently_set_when_full():
+    store = LocalIdempotencyStore(max_entries=3)
+
+    for key in ("a", "b", "c"):
+        store.set(key, "value", ex=timedelta(days=7))
+    store.set("a", "value", ex=timedelta(days=7))
+    store.set("d", "value", ex=timedelta(days=7))
+
+    assert len(store) == store.max_entries
+    assert "b" not in store, "b was the least recently set"
+    assert store.set("a", "new", ex=timedelta(days=7), get=True) == "value"
+
+
+def test_local_store_memory_stays_bounded():
+    store = LocalIdempotencyStore(max_entries=10)
+
+    for i in range(1000):
+        store.set("same-key", str(i), ex=timedelta(days=7))
+        store.set(f"key-{i}", "value", ex=timedelta(days=7))
+
+    assert len(store) == store.max_entries
+    assert len(store._expiries) <= 2 * store.max_entries + 1  # noqa: SLF001
+
+
+def test_has_handled_with_redis():
+    redis_client = fakeredis.FakeRedis()
+
+    assert has_handled("test", "12345", redis_client) is False
+    assert has_handled("test", "12345", redis_client) is True, "Redis hands back bytes, which should still match"
+
+
+def test_not_yet_posted_leaves_out_channels_the_event_was_posted_to():
+    for store in (LocalIdempotencyStore(), fakeredis.FakeRedis()):
+        mark_posted("test", "12345", ["#a"], store)
+
+        assert not_yet_posted("test", "12345", ["#a", "#b"], store) == ["#b"]
+        assert not_yet_posted("test", "67890", ["#a", "#b"], store) == ["#a", "#b"], "A later event posts again"
+
+
+def test_has_seen_event():
+    store = LocalIdempotencyStore()
+
+    assert has_seen_event("Ev123", store) is False
+    assert has_seen_event("Ev123", store) is True, "Retries of the same event should be caught"
+    assert has_seen_event("Ev456", store) is False
+
+
+def test_claim_unhandled_skips_what_has_handled_recorded():
+    for store in (fakeredis.FakeRedis(), LocalIdempotencyStore()):
+        has_handled("seen", "12345", store)
+
+        assert claim_unhandled(["seen", "missed"], store) == ["missed"]
+        assert claim_unhandled(["missed"], store) == [], "Already claimed"
+        assert has_handled("seen", "12345", store) is True, "Claiming leaves what has_handled recorded alone"
+
+        forget_handled(["missed"], store)
+        assert claim_unhandled(["missed"], store) == ["missed"]
+
+
+def test_event_arriving_after_a_catch_up_is_handled():
+    for store in (fakeredis.FakeRedis(), LocalIdempotencyStore()):
+        assert claim_unhandled(["late", "later"], store) == ["late", "later"]
+
+        assert has_handled("late", "12345", store) is True, "The catch-up already posted it"
+        assert has_handled_many([("later", "12345")], store) == [True]
+
+    server = fakeredis.FakeServer()
+    claim_unhandled(["late"], fakeredis.FakeRedis(server=server))
+    assert asyncio.run(async_has_handled("late", "12345", fakeredis.FakeAsyncRedis(server=server))) is True
+
+
+def test_has_handled_many_matches_has_handled_one_at_a_time():
+    batch = [("a", "1"), ("b", "1"), ("a", "1"), ("a", "2"), ("c", "1"), ("b", "1")]
+
+    for make_store in (fakeredis.FakeRedis, LocalIdempotencyStore):
+        one_at_a_time = make_store()
+        has_handled("c", "1", one_at_a_time)
+        batched = make_store()
+        has_handled("c", "1", batched)
+
+        expected = [has_handled(name, event_ts, one_at_a_time) for name, event_ts in batch]
+        assert has_handled_many(batch, batched) == expected == [False, False, True, False, True, True]
+        assert has_handled_many([], batched) == []
+
+
+def test_async_has_handled_many():
+    redis_client = fakeredis.FakeAsyncRedis()
+
+    assert asyncio.run(async_has_handled_many([("a", "1"), ("a", "1")], redis_client)) == [False, True]
+    assert asyncio.run(async_has_handled_many([("a", "1")], LocalIdempotencyStore())) == [False]
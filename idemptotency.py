@@ -1,32 +1,120 @@
-from datetime import UTC, datetime, timedelta
+from collections import Counter, OrderedDict
+from collections.abc import Sequence
+from datetime import timedelta
+import heapq
+import threading
+import time
 from typing import TypedDict, Unpack
 
 import redis
+import redis.asyncio
 
 from config import app_config
-from redis_utils import redis_client
+from redis_utils import async_redis_client, redis_client
 
+IDEMPOTENCY_WINDOW = timedelta(days=7)
+# What claim_unhandled records in place of an event_ts, which has_handled takes as already handled
+BACKFILLED = "backfilled"
+# Slack gives up retrying an event well within this
+EVENT_DEDUP_WINDOW = timedelta(hours=2)
+
+# How many events we dropped before doing any work for them, by why ("retry" or "duplicate")
+skipped_events: Counter[str] = Counter()
+
+
+class LocalIdempotencyStore:
+    """In-process stand-in for the subset of Redis we use, for when there's no Redis configured.
+
+    Expired entries are evicted in expiry order (off a heap) as new ones come in, and if there are still more than
+    `max_entries` live ones, the least recently set go first. Either way memory stays bounded for the life of the
+    process.
+    """
 
-class LocalIdempotencyStore(dict[str, tuple[str, datetime]]):
     class SetKwargs(TypedDict, total=False):
         get: bool
+        nx: bool
+
+    def __init__(self, max_entries: int = 100_000) -> None:
+        self.max_entries = max_entries
+
+        # Ordered least to most recently set
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        # (expires_at, key), may hold stale entries for keys that have since been reset or evicted
+        self._expiries: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def set(self, key: str, value: str, ex: timedelta, **kwargs: Unpack[SetKwargs]) -> str | None:
+        return self.set_many([(key, value)], ex, **kwargs)[0]
+
+    def set_many(
+        self,
+        items: Sequence[tuple[str, str]],
+        ex: timedelta,
+        **kwargs: Unpack[SetKwargs],
+    ) -> list[str | None]:
+        """set each (key, value) in turn, under one hold of the lock."""
+        now = time.time()
+        expires_at = now + ex.total_seconds()
+
+        with self._lock:
+            self._evict_expired(now)
+            observed = [self._set(key, value, now, expires_at, nx=kwargs.get("nx", False)) for key, value in items]
+
+            if len(self._expiries) > 2 * self.max_entries:
+                self._compact()
+
+        return observed
+
+    def _set(self, key: str, value: str, now: float, expires_at: float, *, nx: bool) -> str | None:
+        if nx and (existing := self._entries.get(key)) is not None and existing[1] > now:
+            return existing[0]
+
+        before = self._entries.pop(key, None)
+        self._entries[key] = (value, expires_at)
+        heapq.heappush(self._expiries, (expires_at, key))
 
-    def set(self, key: str, value: str, ex: timedelta, **_kwargs: Unpack[SetKwargs]) -> str | None:
-        new_value = (value, datetime.now(UTC) + ex)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
 
-        # Atomic swap
-        self[key], before = new_value, self.get(key)
+        before_value, before_expires_at = before or (None, 0.0)
+        return before_value if before_expires_at > now else None
 
-        before_value, expires_at = before or (
-            None,
-            datetime.min.replace(tzinfo=UTC),
-        )
+    def mget(self, keys: Sequence[str]) -> list[str | None]:
+        now = time.time()
+        with self._lock:
+            entries = [self._entries.get(key) for key in keys]
+        return [entry[0] if entry is not None and entry[1] > now else None for entry in entries]
 
-        return before_value if expires_at > datetime.now(UTC) else None
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
 
+    def _evict_expired(self, now: float) -> None:
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiries)
 
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self._entries[key]
+
+    def _compact(self) -> None:
+        self._expiries = [(expires_at, key) for key, (_, expires_at) in self._entries.items()]
+        heapq.heapify(self._expiries)
+
+
+_local_idempotency_store = LocalIdempotencyStore(max_entries=app_config.local_idempotency_max_entries)
 _idempotency_redis = (
-    redis_client(str(app_config.redis_host)) if app_config.redis_host is not None else LocalIdempotencyStore()
+    redis_client(str(app_config.redis_host)) if app_config.redis_host is not None else _local_idempotency_store
+)
+_async_idempotency_redis = (
+    async_redis_client(str(app_config.redis_host)) if app_config.redis_host is not None else _local_idempotency_store
 )
 
 
@@ -39,10 +127,230 @@ def has_handled(
         _redis = _idempotency_redis
 
     observed_ts = _redis.set(
-        f"emoji-papertrail:idempotency:{emoji_name}",
+        _idempotency_key(emoji_name),
         event_ts,
-        ex=timedelta(days=7),
+        ex=IDEMPOTENCY_WINDOW,
         get=True,
     )
 
-    return observed_ts == event_ts
+    return _is_handled(observed_ts, event_ts)
+
+
+async def async_has_handled(
+    emoji_name: str,
+    event_ts: str,
+    _redis: redis.asyncio.Redis | LocalIdempotencyStore | None = None,
+) -> bool:
+    if _redis is None:
+        _redis = _async_idempotency_redis
+
+    if isinstance(_redis, LocalIdempotencyStore):
+        return has_handled(emoji_name, event_ts, _redis)
+
+    observed_ts = await _redis.set(
+        _idempotency_key(emoji_name),
+        event_ts,
+        ex=IDEMPOTENCY_WINDOW,
+        get=True,
+    )
+
+    return _is_handled(observed_ts, event_ts)
+
+
+def has_handled_many(
+    handled: Sequence[tuple[str, str]],
+    _redis: redis.Redis | LocalIdempotencyStore | None = None,
+) -> list[bool]:
+    """has_handled for many (emoji_name, event_ts) at once, in a single round trip to Redis.
+
+    Each is checked and marked in order, just as if has_handled was called on each in turn, so an emoji that's in the
+    batch twice with the same event_ts counts as handled the second time.
+    """
+    if _redis is None:
+        _redis = _idempotency_redis
+
+    observed = _set_many(
+        _redis,
+        [(_idempotency_key(emoji_name), event_ts) for emoji_name, event_ts in handled],
+        ex=IDEMPOTENCY_WINDOW,
+        get=True,
+    )
+
+    return [_is_handled(observed_ts, event_ts) for (_, event_ts), observed_ts in zip(handled, observed, strict=True)]
+
+
+async def async_has_handled_many(
+    handled: Sequence[tuple[str, str]],
+    _redis: redis.asyncio.Redis | LocalIdempotencyStore | None = None,
+) -> list[bool]:
+    if _redis is None:
+        _redis = _async_idempotency_redis
+
+    if isinstance(_redis, LocalIdempotencyStore):
+        return has_handled_many(handled, _redis)
+
+    async with _redis.pipeline(transaction=False) as pipe:
+        for emoji_name, event_ts in handled:
+            pipe.set(_idempotency_key(emoji_name), event_ts, ex=IDEMPOTENCY_WINDOW, get=True)
+        observed = await pipe.execute()
+
+    return [_is_handled(observed_ts, event_ts) for (_, event_ts), observed_ts in zip(handled, observed, strict=True)]
+
+
+def claim_unhandled(
+    emoji_names: Sequence[str],
+    _redis: redis.Redis | LocalIdempotencyStore | None = None,
+) -> list[str]:
+    """Mark emoji as handled without an event to go on (e.g. when backfilling), returning those that weren't already.
+
+    Anything has_handled has recorded in the last IDEMPOTENCY_WINDOW is left as it was, so a later retry of that event
+    is still recognized.
+    """
+    if _redis is None:
+        _redis = _idempotency_redis
+
+    observed = _set_many(
+        _redis,
+        [(_idempotency_key(name), BACKFILLED) for name in emoji_names],
+        ex=IDEMPOTENCY_WINDOW,
+        nx=True,
+        get=True,
+    )
+
+    return [name for name, observed_ts in zip(emoji_names, observed, strict=True) if observed_ts is None]
+
+
+def forget_handled(
+    emoji_names: Sequence[str],
+    _redis: redis.Redis | LocalIdempotencyStore | None = None,
+) -> None:
+    """Undo claim_unhandled (or has_handled), e.g. for emoji we then failed to post about."""
+    if _redis is None:
+        _redis = _idempotency_redis
+
+    if emoji_names:
+        _redis.delete(*(_idempotency_key(name) for name in emoji_names))
+
+
+def mark_posted(
+    emoji_name: str,
+    event_ts: str,
+    channels: Sequence[str],
+    _redis: redis.Redis | LocalIdempotencyStore | None = None,
+) -> None:
+    """Record that the post for an emoji's event went out to these channels, see not_yet_posted."""
+    if _redis is None:
+        _redis = _idempotency_redis
+
+    if channels:
+        _set_many(_redis, [(_posted_key(emoji_name, channel), event_ts) for channel in channels], ex=IDEMPOTENCY_WINDOW)
+
+
+def not_yet_posted(
+    emoji_name: str,
+    event_ts: str,
+    channels: Sequence[str],
+    _redis: redis.Redis | LocalIdempotencyStore | None = None,
+) -> list[str]:
+    """Those of the channels that mark_posted hasn't recorded this event's post going out to.
+
+    So when some of an event's posts failed and it's retried (after forget_handled), only those go out again.
+    """
+    if _redis is None:
+        _redis = _idempotency_redis
+
+    if not channels:
+        return []
+
+    observed = _redis.mget([_posted_key(emoji_name, channel) for channel in channels])
+    return [
+        channel for channel, observed_ts in zip(channels, observed, strict=True) if _decode(observed_ts) != event_ts
+    ]
+
+
+def has_seen_event(
+    event_id: str,
+    _redis: redis.Redis | LocalIdempotencyStore | None = None,
+) -> bool:
+    """Mark an event_id as seen, returning whether it already had been (e.g. this is one of Slack's retries)."""
+    if _redis is None:
+        _redis = _idempotency_redis
+
+    return _redis.set(_event_key(event_id), "1", ex=EVENT_DEDUP_WINDOW, get=True) is not None
+
+
+async def async_has_seen_event(
+    event_id: str,
+    _redis: redis.asyncio.Redis | LocalIdempotencyStore | None = None,
+) -> bool:
+    if _redis is None:
+        _redis = _async_idempotency_redis
+
+    if isinstance(_redis, LocalIdempotencyStore):
+        return has_seen_event(event_id, _redis)
+
+    return await _redis.set(_event_key(event_id), "1", ex=EVENT_DEDUP_WINDOW, get=True) is not None
+
+
+def forget_seen_event(
+    event_id: str,
+    _redis: redis.Redis | LocalIdempotencyStore | None = None,
+) -> None:
+    """Undo has_seen_event, e.g. for an event we then failed to handle, so Slack's retry of it gets through."""
+    if _redis is None:
+        _redis = _idempotency_redis
+
+    _redis.delete(_event_key(event_id))
+
+
+async def async_forget_seen_event(
+    event_id: str,
+    _redis: redis.asyncio.Redis | LocalIdempotencyStore | None = None,
+) -> None:
+    if _redis is None:
+        _redis = _async_idempotency_redis
+
+    if isinstance(_redis, LocalIdempotencyStore):
+        forget_seen_event(event_id, _redis)
+        return
+
+    await _redis.delete(_event_key(event_id))
+
+
+def _set_many(
+    store: redis.Redis | LocalIdempotencyStore,
+    items: Sequence[tuple[str, str]],
+    ex: timedelta,
+    **kwargs: Unpack[LocalIdempotencyStore.SetKwargs],
+) -> list[bytes | str | None]:
+    """SET each (key, value) in turn, pipelined so it's one round trip however many there are."""
+    if isinstance(store, LocalIdempotencyStore):
+        return list(store.set_many(items, ex, **kwargs))
+
+    # Not a transaction, just one write of every command and one read of every reply
+    with store.pipeline(transaction=False) as pipe:
+        for key, value in items:
+            pipe.set(key, value, ex=ex, **kwargs)
+        return pipe.execute()
+
+
+def _is_handled(observed_ts: bytes | str | None, event_ts: str) -> bool:
+    # Either this very event (a retry of it), or a catch-up that posted the emoji before its event got to us
+    return _decode(observed_ts) in (event_ts, BACKFILLED)
+
+
+def _idempotency_key(emoji_name: str) -> str:
+    return f"emoji-papertrail:idempotency:{emoji_name}"
+
+
+def _posted_key(emoji_name: str, channel: str) -> str:
+    return f"emoji-papertrail:posted:{emoji_name}:{channel}"
+
+
+def _event_key(event_id: str) -> str:
+    return f"emoji-papertrail:event:{event_id}"
+
+
+def _decode(value: bytes | str | None) -> str | None:
+    # redis-py hands back bytes unless the client was made with decode_responses
+    return value.decode() if isinstance(value, bytes) else value
@@ -0,0 +1,293 @@
+"""Where our log lines go: structlog, rendered as JSON with orjson, and written out from a background thread.
+
+All that happens on the thread doing the logging is cheap: filtering by level, sampling, merging in context vars, and
+noting the time and any exception. Bounding big values (Slack payloads, API responses), redacting secrets, formatting
+the timestamp and traceback, rendering and writing all happen later, on the writer thread. So don't change anything
+after logging it.
+
+Lines are dropped (and counted in emoji_papertrail_log_lines_dropped) rather than waiting if the writer falls
+EMOJI_PAPERTRAIL_LOG_QUEUE_MAX_SIZE behind. See config.ServerConfig for the rest of the EMOJI_PAPERTRAIL_LOG_* settings.
+"""
+
+import atexit
+from collections.abc import Callable, Collection, Mapping
+import contextlib
+from datetime import UTC, datetime
+from itertools import islice
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Any, BinaryIO
+
+import orjson
+import structlog
+from structlog.typing import EventDict, Processor, WrappedLogger
+
+from config import ServerConfig, server_config
+from metrics import LOG_LINES_DROPPED
+
+REDACTED = "[redacted]"
+
+# Most queued lines the writer renders before writing them out in one go
+_WRITE_BATCH_SIZE = 256
+
+
+class Sampler:
+    """Keeps only a fraction of the debug and info lines with each message, e.g. {"Request: Start": 0.01} keeps 1%."""
+
+    def __init__(self, rates: Mapping[str, float]) -> None:
+        self.rates = rates
+
+    def __call__(self, _logger: WrappedLogger, method_name: str, event_dict: EventDict) -> EventDict:
+        rate = self.rates.get(event_dict.get("event"))  # type: ignore[arg-type]
+        if rate is not None and method_name in ("debug", "info") and random.random() >= rate:  # noqa: S311
+            raise structlog.DropEvent
+        return event_dict
+
+
+class Trimmer:
+    """Bounds every value to something worth logging, and redacts secrets.
+
+    Strings (and the repr of anything that isn't a JSON type) are cut to `max_length`, mappings and sequences to their
+    first `max_items`, and anything nested deeper than `max_depth` is cut down to its repr. Values under any of
+    `redact_keys`, at any depth, are replaced with REDACTED.
+    """
+
+    # Left for format_exc_info, which needs them whole
+    UNTOUCHED = frozenset({"event", "exc_info"})
+
+    def __init__(
+        self,
+        *,
+        max_length: int = 1_000,
+        max_items: int = 50,
+        max_depth: int = 4,
+        redact_keys: Collection[str] = (),
+    ) -> None:
+        self.max_length = max_length
+        self.max_items = max_items
+        self.max_depth = max_depth
+        self.redact_keys = frozenset(key.lower() for key in redact_keys)
+
+    def __call__(self, _logger: WrappedLogger, _method_name: str, event_dict: EventDict) -> EventDict:
+        return {key: value if key in self.UNTOUCHED else self._trim(key, value, 0) for key, value in event_dict.items()}
+
+    def _trim(self, key: object, value: object, depth: int) -> object:
+        if isinstance(key, str) and key.lower() in self.redact_keys:
+            return REDACTED
+
+        match value:
+            case None | bool() | int() | float():
+                return value
+            case str():
+                return self._cut(value)
+            case Mapping() if depth < self.max_depth:
+                trimmed = {str(k): self._trim(k, v, depth + 1) for k, v in islice(value.items(), self.max_items)}
+                if len(value) > self.max_items:
+                    trimmed["..."] = f"{len(value) - self.max_items} more"
+                return trimmed
+            case list() | tuple() | set() | frozenset() if depth < self.max_depth:
+                trimmed_items: list[object] = [self._trim(None, v, depth + 1) for v in islice(value, self.max_items)]
+                if len(value) > self.max_items:
+                    trimmed_items.append(f"... {len(value) - self.max_items} more")
+                return trimmed_items
+            case _:
+                return self._cut(repr(value))
+
+    def _cut(self, value: str) -> str:
+        if len(value) <= self.max_length:
+            return value
+        return f"{value[: self.max_length]}... {len(value) - self.max_length} more characters"
+
+
+class LogWriter:
+    """Renders event dicts with `processors` and writes them to `file`, either on a background thread or as they come.
+
+    In the background, lines wait on a queue of at most `max_queue_size`, and are dropped if it's full.
+    """
+
+    def __init__(
+        self,
+        processors: list[Processor],
+        file: BinaryIO,
+        *,
+        background: bool = True,
+        max_queue_size: int = 10_000,
+    ) -> None:
+        self.processors = processors
+        self.file = file
+        self.background = background
+        self.max_queue_size = max_queue_size
+        self._reset()
+        # A thread doesn't survive being forked into a gunicorn worker, and might have held any of our locks when it
+        # was, so the child starts afresh
+        os.register_at_fork(after_in_child=self._reset)
+
+    def put(self, event_dict: EventDict) -> None:
+        if not self.background:
+            self._write([self._render(event_dict)])
+            return
+
+        self._start()
+        try:
+            self._queue.put_nowait(event_dict)
+        except queue.Full:
+            LOG_LINES_DROPPED.inc()
+
+    def flush(self, timeout: float = 5) -> None:
+        """Wait for everything logged so far to be written."""
+        if self._thread is None:
+            return
+
+        written = threading.Event()
+        with contextlib.suppress(queue.Full):
+            self._queue.put(written, timeout=timeout)
+            written.wait(timeout)
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _reset(self) -> None:
+        self._queue: queue.Queue[EventDict | threading.Event] = queue.Queue(maxsize=self.max_queue_size)
+        self._write_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._thread_lock = threading.Lock()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            with contextlib.suppress(queue.Empty):
+                while len(batch) < _WRITE_BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+
+            self._write([self._render(item) for item in batch if not isinstance(item, threading.Event)])
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _render(self, event_dict: EventDict) -> bytes:
+        try:
+            rendered: Any = event_dict
+            for processor in self.processors:
+                rendered = processor(None, event_dict.get("level", "info"), rendered)
+        except Exception as e:  # noqa: BLE001
+            # A line we can't render is still worth knowing about
+            rendered = orjson.dumps(
+                {"event": "Failed to render log line", "line": repr(event_dict)[:1_000], "error": repr(e)}
+            )
+
+        line = rendered if isinstance(rendered, bytes) else str(rendered).encode()
+        return line + b"\n"
+
+    def _write(self, lines: list[bytes]) -> None:
+        if not lines:
+            return
+        with self._write_lock, contextlib.suppress(ValueError, OSError):
+            self.file.write(b"".join(lines))
+            self.file.flush()
+
+
+class _WriterLogger:
+    """What structlog hands each processed event dict to, which we pass on to the writer."""
+
+    def __init__(self, writer: LogWriter, name: str | None) -> None:
+        self.writer = writer
+        self.name = name
+
+    def msg(self, event_dict: EventDict) -> None:
+        if self.name is not None:
+            event_dict.setdefault("logger", self.name)
+        self.writer.put(event_dict)
+
+    debug = info = warning = warn = error = critical = exception = fatal = log = msg
+
+
+def _add_timestamp(_logger: WrappedLogger, _method_name: str, event_dict: EventDict) -> EventDict:
+    event_dict["timestamp"] = time.time()
+    return event_dict
+
+
+def _capture_exc_info(_logger: WrappedLogger, _method_name: str, event_dict: EventDict) -> EventDict:
+    # exc_info=True means whatever's being handled now, which is only true here and now
+    if event_dict.get("exc_info") is True:
+        event_dict["exc_info"] = sys.exc_info()
+    return event_dict
+
+
+def _hand_off(_logger: WrappedLogger, _method_name: str, event_dict: EventDict) -> tuple[tuple[EventDict], dict]:
+    # Passed to _WriterLogger.msg as is, rather than rendered
+    return (event_dict,), {}
+
+
+def _format_timestamp(_logger: WrappedLogger, _method_name: str, event_dict: EventDict) -> EventDict:
+    if isinstance(timestamp := event_dict.get("timestamp"), float):
+        event_dict["timestamp"] = datetime.fromtimestamp(timestamp, UTC).isoformat()
+    return event_dict
+
+
+def _json_default(value: object) -> str:
+    return repr(value)
+
+
+def _render_json(_logger: WrappedLogger, _method_name: str, event_dict: EventDict) -> bytes:
+    return orjson.dumps(event_dict, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def configure_logging(config: ServerConfig = server_config, file: BinaryIO | None = None) -> LogWriter | None:
+    """Set structlog up to log the way the module docstring says, unless something's already set it up.
+
+    Benchmarks and the like configure structlog before importing main, and this leaves that alone.
+    """
+    if structlog.is_configured():
+        return None
+
+    log_format = config.log_format
+    if log_format == "auto":
+        log_format = "console" if sys.stdout.isatty() else "json"
+
+    trimmer = Trimmer(
+        max_length=config.log_max_field_length,
+        max_items=config.log_max_field_items,
+        redact_keys=config.log_redact_keys,
+    )
+    renderer: list[Processor] = (
+        [structlog.processors.format_exc_info, _render_json]
+        if log_format == "json"
+        # Which renders exceptions itself, prettier than format_exc_info does
+        else [structlog.dev.ConsoleRenderer()]
+    )
+    writer = LogWriter(
+        [trimmer, _format_timestamp, *renderer],
+        file or sys.stdout.buffer,
+        background=config.log_background,
+        max_queue_size=config.log_queue_max_size,
+    )
+    atexit.register(writer.flush)
+
+    caller_processors: list[Processor] = [
+        structlog.contextvars.merge_contextvars,
+        structlog.processors.add_log_level,
+        _add_timestamp,
+        _capture_exc_info,
+        _hand_off,
+    ]
+    if config.log_sample_rates:
+        caller_processors.insert(0, Sampler(config.log_sample_rates))
+
+    logger_factory: Callable[..., _WriterLogger] = lambda name=None, *_: _WriterLogger(writer, name)  # noqa: E731
+    structlog.configure(
+        processors=caller_processors,
+        wrapper_class=structlog.make_filtering_bound_logger(config.log_level),
+        logger_factory=logger_factory,
+        cache_logger_on_first_use=True,
+    )
+    return writer
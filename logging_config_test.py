@@ -0,0 +1,121 @@
+from collections.abc import Iterator
+import io
+import json
+import threading
+from typing import Any
+
+from prometheus_client import REGISTRY
+import pytest
+import structlog
+
+from config import ServerConfig
+from logging_config import REDACTED, LogWriter, Trimmer, configure_logging
+
+
+@pytest.fixture(autouse=True)
+def _unconfigured() -> Iterator[None]:
+    structlog.reset_defaults()
+    yield
+    structlog.reset_defaults()
+
+
+def log_lines(output: io.BytesIO) -> list[dict[str, Any]]:
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_trimmer_bounds_and_redacts_values():
+    trim = Trimmer(max_length=10, max_items=2, max_depth=2, redact_keys={"token"})
+
+    trimmed = trim(
+        None,
+        "info",
+        {
+            "event": "x" * 20,
+            "text": "y" * 20,
+            "data": {"Token": "xoxb-secret", "blocks": [1, 2, 3], "nested": {"deeper": {"deepest": 1}}},
+            "client": object(),
+        },
+    )
+
+    assert trimmed["event"] == "x" * 20
+    assert trimmed["text"] == "y" * 10 + "... 10 more characters"
+    assert trimmed["data"] == {"Token": REDACTED, "blocks": [1, 2, "... 1 more"], "...": "1 more"}
+    assert trimmed["client"].startswith("<object ob")
+
+
+def test_logs_json_from_the_background():
+    output = io.BytesIO()
+    writer = configure_logging(ServerConfig(log_format="json", log_max_field_length=100), file=output)
+    assert writer is not None
+
+    log = structlog.get_logger("test")
+    structlog.contextvars.bind_contextvars(request_id="req-1")
+    try:
+        log.info("Slack response", data={"ok": True, "bot_token": "xoxb-secret", "text": "a" * 1000})
+        try:
+            raise ValueError  # noqa: TRY301
+        except ValueError:
+            log.exception("Failed to post")
+        log.debug("Filtered out")
+    finally:
+        structlog.contextvars.clear_contextvars()
+    writer.flush()
+
+    response, failure = log_lines(output)
+    assert response["event"] == "Slack response"
+    assert response["request_id"] == "req-1"
+    assert response["logger"] == "test"
+    assert response["level"] == "info"
+    assert response["data"]["bot_token"] == REDACTED
+    assert len(response["data"]["text"]) < 200  # noqa: PLR2004
+    assert failure["level"] == "error"
+    assert "ValueError" in failure["exception"]
+
+
+def test_samples_info_lines_by_message():
+    output = io.BytesIO()
+    configure_logging(
+        ServerConfig(log_format="json", log_background=False, log_sample_rates={"Request: Start": 0}),
+        file=output,
+    )
+
+    log = structlog.get_logger()
+    log.info("Request: Start")
+    log.warning("Request: Start")
+    log.info("Request: Stop")
+
+    assert [(line["event"], line["level"]) for line in log_lines(output)] == [
+        ("Request: Start", "warning"),
+        ("Request: Stop", "info"),
+    ]
+
+
+def test_drops_lines_once_the_writer_falls_behind():
+    rendering = threading.Event()
+    unblock = threading.Event()
+
+    def block(_logger: object, _method_name: str, event_dict: dict[str, Any]) -> bytes:
+        rendering.set()
+        unblock.wait()
+        return event_dict["event"].encode()
+
+    output = io.BytesIO()
+    writer = LogWriter([block], output, max_queue_size=1)
+    dropped_before = REGISTRY.get_sample_value("emoji_papertrail_log_lines_dropped_total") or 0
+
+    writer.put({"event": "being written"})
+    assert rendering.wait(5)
+    writer.put({"event": "queued"})
+    writer.put({"event": "dropped"})
+    unblock.set()
+    writer.flush()
+
+    assert output.getvalue().splitlines() == [b"being written", b"queued"]
+    assert REGISTRY.get_sample_value("emoji_papertrail_log_lines_dropped_total") == dropped_before + 1
+
+
+def test_leaves_structlog_alone_if_already_configured():
+    structlog.configure(processors=[])
+
+    assert configure_logging(ServerConfig()) is None
+    assert structlog.get_config()["processors"] == []
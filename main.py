@@ -1,21 +1,155 @@
+import asyncio
+from collections.abc import AsyncIterator
+import contextlib
+import functools
+from http import HTTPStatus
+import sys
+import threading
+from typing import TYPE_CHECKING
+
 from fastapi import FastAPI, Request, Response
-from slack_bolt.adapter.fastapi import SlackRequestHandler
+from fastapi.concurrency import run_in_threadpool
 import structlog
 
+from config import app_config
+from logging_config import configure_logging
+from metrics import STAGE_SECONDS, render
 from middleware import middleware_stack
-from slack_app import slack_app
 
+if TYPE_CHECKING:
+    from slack_bolt.adapter.fastapi import SlackRequestHandler
+    from slack_bolt.adapter.fastapi.async_handler import AsyncSlackRequestHandler
+
+configure_logging()
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
 
-app = FastAPI(middleware=middleware_stack())
-slack_request_handler = SlackRequestHandler(slack_app)
+@contextlib.asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    async with contextlib.AsyncExitStack() as stack:
+        if app_config.async_mode:
+            stack.push_async_callback(_close_async_web_clients)
+
+        if app_config.queue_mode and app_config.queue_in_process_consumer:
+            from worker import start_consumers
+
+            stop = threading.Event()
+            start_consumers(stop)
+            stack.callback(stop.set)
+
+        if app_config.catch_up_on_startup:
+            from backfill import start_catch_up
+
+            stop_catch_up = threading.Event()
+            start_catch_up(stop_catch_up)
+            stack.callback(stop_catch_up.set)
+
+        if app_config.warm_up_on_startup:
+            # In the background, so we're taking requests (and answering health checks) meanwhile
+            warming_up = asyncio.create_task(warm_up())
+            warming_up.add_done_callback(_log_warm_up)
+            stack.callback(warming_up.cancel)
+        elif app_config.digest_window and app_config.redis_host is not None:
+            # Warming up does this too, but this part's needed either way: posting digests a process that died left
+            flushing = asyncio.create_task(flush_overdue_digests())
+            flushing.add_done_callback(_log_flush_overdue_digests)
+            stack.callback(flushing.cancel)
+
+        yield
+
+
+async def _close_async_web_clients() -> None:
+    # Only once something's used them, rather than importing it all at startup just to close nothing
+    if (async_slack_app := sys.modules.get("async_slack_app")) is not None:
+        await async_slack_app.async_web_clients.close()
+
+
+def _log_warm_up(warming_up: "asyncio.Task[None]") -> None:
+    if not warming_up.cancelled() and (e := warming_up.exception()) is not None:
+        # The first event will try again
+        logger.error("Failed to warm up", exc_info=e)
+
+
+def _log_flush_overdue_digests(flushing: "asyncio.Task[None]") -> None:
+    if not flushing.cancelled() and (e := flushing.exception()) is not None:
+        logger.error("Failed to flush overdue digests", exc_info=e)
+
+
+app = FastAPI(middleware=middleware_stack(), lifespan=lifespan)
+
+
+async def slack_request_handler() -> "SlackRequestHandler | AsyncSlackRequestHandler":
+    """Built on the first request (or warm-up), so the process can start taking requests before Bolt's loaded."""
+    if app_config.async_mode or _slack_request_handler.cache_info().currsize:
+        return _slack_request_handler()
+    # Building the sync app calls Slack, which mustn't hold up the event loop
+    return await run_in_threadpool(_slack_request_handler)
+
+
+@functools.cache
+def _slack_request_handler() -> "SlackRequestHandler | AsyncSlackRequestHandler":
+    if app_config.async_mode:
+        from slack_bolt.adapter.fastapi.async_handler import AsyncSlackRequestHandler
+
+        from async_slack_app import get_async_slack_app
+
+        return AsyncSlackRequestHandler(get_async_slack_app())
+
+    from slack_bolt.adapter.fastapi import SlackRequestHandler
+
+    from slack_app import get_slack_app
+
+    return SlackRequestHandler(get_slack_app())
+
+
+async def warm_up() -> None:
+    with STAGE_SECONDS.labels("warm_up").time():
+        if app_config.async_mode:
+            from async_slack_app import async_warm_up
+
+            await async_warm_up()
+        else:
+            from slack_app import warm_up as sync_warm_up
+
+            await run_in_threadpool(sync_warm_up)
+        await slack_request_handler()
+
+
+async def flush_overdue_digests() -> None:
+    if app_config.async_mode:
+        from async_slack_app import async_tenant_client
+        from digest import async_flush_overdue_digests
+
+        await async_flush_overdue_digests(async_tenant_client)
+    else:
+        from digest import flush_overdue_digests as sync_flush_overdue_digests
+        from slack_app import tenant_clients
+
+        await run_in_threadpool(
+            sync_flush_overdue_digests,
+            lambda enterprise_id, team_id: tenant_clients(enterprise_id, team_id)[0],
+        )
 
 
 @app.get("/slack/{path:path}")
 @app.post("/slack/events")
 async def handle_slack_event(request: Request) -> Response:
-    return await slack_request_handler.handle(
-        request,
-        addition_context_properties={"request_id": request.state.request_id},
-    )
+    with STAGE_SECONDS.labels("dispatch").time():
+        handler = await slack_request_handler()
+        return await handler.handle(
+            request,
+            addition_context_properties={"request_id": request.state.request_id},
+        )
+
+
+@app.get("/metrics")
+def metrics() -> Response:
+    content, content_type = render()
+    return Response(content=content, media_type=content_type)
+
+
+# App Engine sends this to each new instance before routing it any traffic, when app.yaml has the warmup inbound service
+@app.get("/_ah/warmup")
+async def handle_warm_up() -> Response:
+    await warm_up()
+    return Response(status_code=HTTPStatus.OK)
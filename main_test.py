@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+
+
+def test_import_leaves_slack_for_the_first_request() -> None:
+    # In a fresh interpreter, with Slack unreachable, since anything that's already imported here wouldn't show up
+    env = {
+        **os.environ,
+        "SLACK_BOT_TOKEN": "xoxb-test",
+        "SLACK_SIGNING_SECRET": "test",
+        "SLACK_APP_ASYNC_MODE": "false",
+        "SLACK_APP_SLACK_API_URL": "http://slack.invalid/api/",
+    }
+    checked = ["slack_bolt", "aiohttp", "slack_sdk.web.async_client", "slack_app"]
+    imported = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", f"import sys, main; print(*(m for m in {checked!r} if m in sys.modules))"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert imported.stdout.split() == []
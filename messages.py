@@ -0,0 +1,137 @@
+from collections.abc import Sequence
+from typing import ClassVar
+
+from pydantic import BaseModel
+from slack_sdk.models.blocks import Block, ContextBlock, SectionBlock
+
+from emoji import EmojiInfo
+
+
+class EmojiUpdateMessage(BaseModel):
+    emoji: EmojiInfo
+
+    def message(self) -> str:
+        emoji_or_alias = f"alias of `{self.emoji.alias_of}`" if self.emoji.is_alias else "emoji"
+
+        if self.emoji.author is not None:
+            return f"New {emoji_or_alias} added by <@{self.emoji.author}>!"
+        return f"New {emoji_or_alias} added!"
+
+    # TODO: Type this at some point
+    def blocks(self) -> list[Block]:
+        primary_block = SectionBlock(
+            text={
+                "text": self.message(),
+                "type": "mrkdwn",
+            },
+            fields=[
+                {"type": "mrkdwn", "text": "*Name*"},
+                {"type": "mrkdwn", "text": "*Emoji*"},
+                {"type": "mrkdwn", "text": f"`{self.emoji}`"},
+                {"type": "mrkdwn", "text": str(self.emoji)},
+            ],
+            accessory={
+                "type": "image",
+                "image_url": self.emoji.image_url,
+                "alt_text": str(self.emoji),
+            },
+        )
+
+        return [primary_block]
+
+
+class EmojiDigestMessage(BaseModel):
+    """A single post covering a burst of new emoji and aliases."""
+
+    # Slack caps a message at 50 blocks, and a context block at 10 elements
+    MAX_BLOCKS: ClassVar[int] = 50
+    EMOJI_PER_BLOCK: ClassVar[int] = 5
+    MAX_EMOJI: ClassVar[int] = (MAX_BLOCKS - 1) * EMOJI_PER_BLOCK
+
+    emojis: list[EmojiInfo]
+
+    @classmethod
+    def chunked(cls: type["EmojiDigestMessage"], emojis: Sequence[EmojiInfo]) -> list["EmojiDigestMessage"]:
+        return [cls(emojis=list(emojis[i : i + cls.MAX_EMOJI])) for i in range(0, len(emojis), cls.MAX_EMOJI)]
+
+    def message(self) -> str:
+        aliases = sum(emoji.is_alias for emoji in self.emojis)
+
+        counts = []
+        if len(self.emojis) > aliases:
+            counts.append(f"{len(self.emojis) - aliases} emoji")
+        if aliases:
+            counts.append(f"{aliases} alias" if aliases == 1 else f"{aliases} aliases")
+
+        authors = sorted({emoji.author for emoji in self.emojis if emoji.author is not None})
+        if authors:
+            return f"New {' and '.join(counts)} added by {', '.join(f'<@{a}>' for a in authors)}!"
+        return f"New {' and '.join(counts)} added!"
+
+    def blocks(self) -> list[Block]:
+        summary_block = SectionBlock(
+            text={
+                "text": self.message(),
+                "type": "mrkdwn",
+            },
+        )
+
+        emoji_blocks = [
+            ContextBlock(
+                elements=[
+                    element
+                    for emoji in self.emojis[i : i + self.EMOJI_PER_BLOCK]
+                    for element in (
+                        {"type": "image", "image_url": emoji.image_url, "alt_text": str(emoji)},
+                        {"type": "mrkdwn", "text": _digest_label(emoji)},
+                    )
+                ],
+            )
+            for i in range(0, len(self.emojis), self.EMOJI_PER_BLOCK)
+        ]
+
+        return [summary_block, *emoji_blocks]
+
+
+class EmojiSearchResultsMessage(BaseModel):
+    """The answer to /emoji-search, only shown to whoever asked."""
+
+    # Names are at most 100 characters, so this many always fit in a section's 3000
+    NAMES_PER_BLOCK: ClassVar[int] = 10
+
+    query: str
+    names: list[str]
+
+    def message(self) -> str:
+        if self.query in self.names:
+            return f":{self.query}: `:{self.query}:` already exists!"
+        if self.names:
+            return f"There's no `:{self.query}:` yet, but there's:"
+        return f"There's no `:{self.query}:`, or anything like it, yet."
+
+    def blocks(self) -> list[Block]:
+        summary_block = SectionBlock(
+            text={
+                "text": self.message(),
+                "type": "mrkdwn",
+            },
+        )
+
+        others = [name for name in self.names if name != self.query]
+        results_blocks = [
+            SectionBlock(
+                text={
+                    "text": "\n".join(f":{name}: `:{name}:`" for name in others[i : i + self.NAMES_PER_BLOCK]),
+                    "type": "mrkdwn",
+                },
+            )
+            for i in range(0, len(others), self.NAMES_PER_BLOCK)
+        ]
+
+        return [summary_block, *results_blocks]
+
+
+def _digest_label(emoji: EmojiInfo) -> str:
+    if emoji.is_alias:
+        return f"`{emoji}` → `{emoji.alias_of}`"
+    return f"`{emoji}`"
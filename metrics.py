@@ -0,0 +1,112 @@
+"""Prometheus metrics, served from /metrics.
+
+Under gunicorn each worker keeps its own values. Point PROMETHEUS_MULTIPROC_DIR at an empty directory (cleared on every
+start) and /metrics aggregates across all of them instead, see gunicorn.conf.py.
+"""
+
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
+from slack_sdk.http_retry.request import HttpRequest
+from slack_sdk.http_retry.response import HttpResponse
+from slack_sdk.http_retry.state import RetryState
+
+STAGE_SECONDS = Histogram(
+    "emoji_papertrail_stage_seconds",
+    "Time spent in each stage of handling an event: dispatch (signature verification and Bolt), get_emoji, "
+    "has_handled, and chat_postMessage",
+    ["stage"],
+)
+SLACK_API_CALLS = Counter(
+    "emoji_papertrail_slack_api_calls",
+    "Slack Web API calls we've made, not counting retries",
+    ["method"],
+)
+SLACK_RATE_LIMIT_RETRIES = Counter(
+    "emoji_papertrail_slack_rate_limit_retries",
+    "Slack Web API calls retried after a 429",
+    ["method"],
+)
+SKIPPED_EVENTS = Counter(
+    "emoji_papertrail_skipped_events",
+    "Events dropped before authorizing because we'd already seen them",
+    ["reason"],
+)
+ALIAS_SKIPS = Counter(
+    "emoji_papertrail_alias_skips",
+    "New aliases not posted because SLACK_APP_SHOULD_REPORT_ALIAS_CHANGES is off",
+)
+POSTS = Counter(
+    "emoji_papertrail_posts",
+    "Posts about new emoji, by destination channel and whether they went out",
+    ["channel", "result"],
+)
+OUTBOUND_QUEUE_DEPTH = Gauge(
+    "emoji_papertrail_outbound_queue_depth",
+    "Slack API calls waiting on the outbound scheduler, including any being sent",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+OUTBOUND_QUEUE_SECONDS = Histogram(
+    "emoji_papertrail_outbound_queue_seconds",
+    "How long Slack API calls waited on the outbound scheduler before being sent",
+    ["method"],
+)
+SOCKET_MODE_CONNECTS = Counter(
+    "emoji_papertrail_socket_mode_connects",
+    "Attempts to connect (or reconnect) to Slack over Socket Mode, by whether they worked",
+    ["result"],
+)
+LOG_LINES_DROPPED = Counter(
+    "emoji_papertrail_log_lines_dropped",
+    "Log lines thrown away because the log writer had fallen too far behind",
+)
+
+REDIS_COMMAND_SECONDS = Histogram(
+    "emoji_papertrail_redis_command_seconds",
+    "Redis round trips, by command (PIPELINE for a whole pipeline)",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+
+def serving_registry() -> CollectorRegistry:
+    """Where to serve metrics from: this process's own, or every process's with PROMETHEUS_MULTIPROC_DIR set."""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render() -> tuple[bytes, str]:
+    """The current metrics in the Prometheus text format, and their content type."""
+    return generate_latest(serving_registry()), CONTENT_TYPE_LATEST
+
+
+def api_method(request: HttpRequest) -> str:
+    return request.url.split("?", 1)[0].rsplit("/", 1)[-1]
+
+
+class CountingRateLimitErrorRetryHandler(RateLimitErrorRetryHandler):
+    def prepare_for_next_attempt(
+        self,
+        *,
+        state: RetryState,
+        request: HttpRequest,
+        response: HttpResponse | None = None,
+        error: Exception | None = None,
+    ) -> None:
+        SLACK_RATE_LIMIT_RETRIES.labels(api_method(request)).inc()
+        super().prepare_for_next_attempt(state=state, request=request, response=response, error=error)
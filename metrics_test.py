@@ -0,0 +1,70 @@
+from pathlib import Path
+
+import fakeredis
+from prometheus_client import REGISTRY
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+import pytest
+import redis
+from slack_sdk.http_retry.request import HttpRequest
+from slack_sdk.http_retry.response import HttpResponse
+from slack_sdk.http_retry.state import RetryState
+
+from metrics import CountingRateLimitErrorRetryHandler, render, serving_registry
+from redis_utils import _TimedRedis
+
+
+def sample(name: str, labels: dict[str, str]) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_render_includes_our_metrics() -> None:
+    content, content_type = render()
+
+    assert content_type.startswith("text/plain")
+    assert b"emoji_papertrail_stage_seconds" in content
+
+
+def test_serving_registry_aggregates_across_processes(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    assert serving_registry() is REGISTRY
+
+    # As another process's counter would have left it
+    values = MmapedDict(str(tmp_path / "counter_1234.db"))
+    values.write_value(mmap_key("other", "other_total", [], [], "Another process's"), 3.0, 0)
+    values.close()
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+    assert serving_registry().get_sample_value("other_total") == 3  # noqa: PLR2004
+
+
+def test_rate_limit_retries_are_counted_per_method(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("slack_sdk.http_retry.builtin_handlers.time.sleep", lambda _: None)
+    before = sample("emoji_papertrail_slack_rate_limit_retries_total", {"method": "emoji.list"})
+
+    CountingRateLimitErrorRetryHandler().prepare_for_next_attempt(
+        state=RetryState(),
+        request=HttpRequest(method="POST", url="https://slack.com/api/emoji.list", headers={}),
+        response=HttpResponse(status_code=429, headers={"Retry-After": ["1"]}),
+    )
+
+    assert sample("emoji_papertrail_slack_rate_limit_retries_total", {"method": "emoji.list"}) == before + 1
+
+
+def test_redis_commands_are_timed() -> None:
+    client = _TimedRedis(
+        connection_pool=redis.ConnectionPool(
+            connection_class=fakeredis.FakeRedisConnection, server=fakeredis.FakeServer()
+        ),
+    )
+    before = {
+        command: sample("emoji_papertrail_redis_command_seconds_count", {"command": command})
+        for command in ("GET", "PIPELINE")
+    }
+
+    client.get("key")
+    with client.pipeline() as pipe:
+        pipe.set("key", "value")
+        pipe.get("key")
+        pipe.execute()
+
+    for command in ("GET", "PIPELINE"):
+        assert sample("emoji_papertrail_redis_command_seconds_count", {"command": command}) == before[command] + 1
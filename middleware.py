@@ -1,10 +1,10 @@
-from collections.abc import Awaitable, Callable
 import secrets
 import time
 
-from fastapi import HTTPException, Request, Response
+from fastapi import Request
 from starlette.middleware import Middleware
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import structlog
 
 from config import server_config
@@ -13,75 +13,66 @@ logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
 
 def middleware_stack() -> list[Middleware]:
-    return [
-        Middleware(BaseHTTPMiddleware, dispatch=f)
-        for f in (
-            return_500_on_exception,
-            ready,
-            request_id,
-            log_requests,
+    return [Middleware(RequestMiddleware)]
+
+
+class RequestMiddleware:
+    """Readiness probes, request IDs, request logging, and turning exceptions into 500s, as one plain ASGI layer.
+
+    These used to be four BaseHTTPMiddleware layers, each of which added its own task and stream wrapping to every
+    request. `/ready` is answered before doing any of the rest.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if scope["path"] == "/ready":
+            await Response(status_code=200)(scope, receive, send)
+            return
+
+        request = Request(scope)
+        request_id = request.headers.get(
+            server_config.request_id_http_header,
+            f"local:{secrets.token_urlsafe()}",
         )
-    ]
-
-
-async def return_500_on_exception(
-    request: Request,
-    call_next: Callable[[Request], Awaitable[Response]],
-) -> Response:
-    try:
-        return await call_next(request)
-    except Exception as e:
-        log = logger.bind(request_id=getattr(request.state, "request_id", None))
-        log.exception("exception thrown during request handling")
-        raise HTTPException(status_code=500) from e
-
-
-async def ready(
-    request: Request,
-    call_next: Callable[[Request], Awaitable[Response]],
-) -> Response:
-    if request.url.path == "/ready":
-        return Response(status_code=200)
-
-    return await call_next(request)
-
-
-async def request_id(
-    request: Request,
-    call_next: Callable[[Request], Awaitable[Response]],
-) -> Response:
-    request_id = request.headers.get(
-        server_config.request_id_http_header,
-        f"local:{secrets.token_urlsafe()}",
-    )
-
-    request.state.request_id = request_id
-    return await call_next(request)
-
-
-async def log_requests(
-    request: Request,
-    call_next: Callable[[Request], Awaitable[Response]],
-) -> Response:
-    log = logger.bind(
-        request_id=request.state.request_id,
-        source=(f"{request.client.host}" if request.client else "unknown"),
-        host=request.url.hostname,
-        path=request.url.path,
-        method=request.method,
-    )
-
-    log.info("Request: Start")
-    start_time = time.monotonic()
-
-    response: Response = await call_next(request)
-
-    process_time = (time.monotonic() - start_time) * 1000
-
-    log.info(
-        "Request: Stop",
-        status_code=response.status_code,
-        process_time=f"{process_time:.2f}ms",
-    )
-
-    return response
+        request.state.request_id = request_id
+
+        log = logger.bind(
+            request_id=request_id,
+            source=(f"{request.client.host}" if request.client else "unknown"),
+            host=request.url.hostname,
+            path=request.url.path,
+            method=request.method,
+        )
+
+        log.info("Request: Start")
+        start_time = time.monotonic()
+        response_started = False
+
+        async def send_and_log(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                process_time = (time.monotonic() - start_time) * 1000
+                log.info(
+                    "Request: Stop",
+                    status_code=message["status"],
+                    process_time=f"{process_time:.2f}ms",
+                )
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_log)
+        except Exception:
+            log.exception("exception thrown during request handling")
+            if response_started:
+                # Too late to change the status, so let the server deal with it
+                raise
+
+            await PlainTextResponse("Internal Server Error", status_code=500)(scope, receive, send)
@@ -0,0 +1,42 @@
+from http import HTTPStatus
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from config import server_config
+from middleware import middleware_stack
+
+
+def app_with_routes() -> FastAPI:
+    app = FastAPI(middleware=middleware_stack())
+
+    @app.get("/request-id")
+    async def request_id(request: Request) -> str:
+        return request.state.request_id
+
+    @app.get("/boom")
+    async def boom() -> None:
+        msg = "boom"
+        raise RuntimeError(msg)
+
+    return app
+
+
+def test_ready_is_answered_by_the_middleware() -> None:
+    resp = TestClient(app_with_routes()).get("/ready")
+
+    assert resp.status_code == HTTPStatus.OK
+    assert resp.content == b""
+
+
+def test_request_id_comes_from_header_or_is_generated() -> None:
+    client = TestClient(app_with_routes())
+
+    assert client.get("/request-id", headers={server_config.request_id_http_header: "abc"}).json() == "abc"
+    assert client.get("/request-id").json().startswith("local:")
+
+
+def test_exceptions_become_500s() -> None:
+    resp = TestClient(app_with_routes(), raise_server_exceptions=False).get("/boom")
+
+    assert resp.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
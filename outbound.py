@@ -0,0 +1,332 @@
+"""Paces outbound Slack API calls to stay under Slack's rate limits, rather than finding out about them from 429s.
+
+Every call waits for a token from two buckets: one for its workspace, method and channel (Slack allows chat.postMessage
+about one message a second per channel, with short bursts), and one for its workspace and method across all channels.
+Calls to the same channel go out one at a time, in the order they were submitted. A 429 holds both buckets until its
+Retry-After has passed and leaves the call at the front of its queue, rather than sleeping in whichever thread made it.
+
+At most `max_in_flight` calls are out to Slack at once, across every channel, so fanning a post out to many channels
+can't tie up more than that; a slow channel only holds up its own queue. A call that's still rate limited after
+`max_attempts` tries fails with the last 429, rather than going round again.
+
+Submitting returns straight away with a future for the response.
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextlib
+import copy
+from dataclasses import dataclass, field
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
+from slack_sdk.web.async_slack_response import AsyncSlackResponse
+from slack_sdk.web.slack_response import SlackResponse
+import structlog
+
+from config import app_config
+from metrics import (
+    OUTBOUND_QUEUE_DEPTH,
+    OUTBOUND_QUEUE_SECONDS,
+    SLACK_API_CALLS,
+    SLACK_RATE_LIMIT_RETRIES,
+    STAGE_SECONDS,
+)
+
+if TYPE_CHECKING:
+    # See emoji.py
+    from slack_sdk.web.async_client import AsyncWebClient
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+# Workspace (by token), method, and channel, or None for the method's bucket across all channels
+type _Key = tuple[str | None, str, str | None]
+
+
+class TokenBucket:
+    """`rate` tokens a second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until there's a token to take."""
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+        return max(self.updated - now, 0.0) + max(1 - self.tokens, 0.0) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def hold(self, seconds: float, now: float) -> None:
+        """Have the next token come no sooner than `seconds` from `now`, e.g. for a Retry-After."""
+        self.tokens, self.updated = 1, max(self.updated, now + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        return self.wait_time(now) == 0 and self.tokens >= self.burst
+
+
+@dataclass
+class _Call[F: (Future[SlackResponse], asyncio.Future[AsyncSlackResponse])]:
+    client: "WebClient | AsyncWebClient"
+    method: str
+    kwargs: dict[str, Any]
+    future: F
+    queued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+def _retry_after(error: SlackApiError) -> float:
+    headers = error.response.headers
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return float(value) if value is not None else 1.0
+
+
+class _OutboundScheduler[F: (Future[SlackResponse], asyncio.Future[AsyncSlackResponse])]:
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        channel_rate: float = 1.0,
+        channel_burst: int = 3,
+        method_rate: float = 5.0,
+        method_burst: int = 10,
+        max_in_flight: int = 8,
+        max_attempts: int = 5,
+    ) -> None:
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.method_rate = method_rate
+        self.method_burst = method_burst
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+
+        self._queues: dict[_Key, deque[_Call[F]]] = {}
+        self._buckets: dict[_Key, TokenBucket] = {}
+        # Channels with a call out to Slack right now, which the next one has to wait for
+        self._sending: set[_Key] = set()
+        self._lock = threading.Lock()
+
+    def _enqueue(self, call: _Call[F]) -> None:
+        key = (call.client.token, call.method, call.kwargs.get("channel"))
+        with self._lock:
+            self._queues.setdefault(key, deque()).append(call)
+        OUTBOUND_QUEUE_DEPTH.labels(call.method).inc()
+
+    def _bucket(self, key: _Key) -> TokenBucket:
+        if (bucket := self._buckets.get(key)) is None:
+            rate, burst = (
+                (self.method_rate, self.method_burst) if key[2] is None else (self.channel_rate, self.channel_burst)
+            )
+            bucket = self._buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _take_ready(self) -> tuple[list[tuple[_Key, _Call[F]]], float | None]:
+        """The calls at the front of their queue that can go now, and how long until the next one could."""
+        ready: list[tuple[_Key, _Call[F]]] = []
+        next_wait: float | None = None
+        now = time.monotonic()
+
+        with self._lock:
+            for key, queue in list(self._queues.items()):
+                if len(self._sending) >= self.max_in_flight:
+                    # One finishing wakes the dispatcher back up
+                    break
+                if key in self._sending:
+                    continue
+
+                token, method, _channel = key
+                buckets = (self._bucket(key), self._bucket((token, method, None)))
+                if not queue:
+                    del self._queues[key]
+                    if buckets[0].is_idle(now):
+                        del self._buckets[key]
+                    continue
+
+                wait = max(bucket.wait_time(now) for bucket in buckets)
+                if wait > 0:
+                    next_wait = wait if next_wait is None else min(next_wait, wait)
+                    continue
+
+                for bucket in buckets:
+                    bucket.take()
+                self._sending.add(key)
+                ready.append((key, queue[0]))
+
+        return ready, next_wait
+
+    def _start(self, call: _Call[F]) -> None:
+        if call.attempts == 0:
+            SLACK_API_CALLS.labels(call.method).inc()
+            OUTBOUND_QUEUE_SECONDS.labels(call.method).observe(time.monotonic() - call.queued_at)
+        else:
+            SLACK_RATE_LIMIT_RETRIES.labels(call.method).inc()
+        call.attempts += 1
+
+    def _rate_limited(self, key: _Key, call: _Call[F], error: SlackApiError) -> bool:
+        """Hold the call's buckets for the Retry-After, leaving it at the front of its queue to try again unless it's
+        out of attempts. Returns whether it'll be tried again.
+        """
+        retry_after = _retry_after(error)
+        retrying = call.attempts < self.max_attempts
+        logger.info(
+            "Rate limited by Slack",
+            method=call.method,
+            channel=key[2],
+            retry_after=retry_after,
+            attempts=call.attempts,
+            retrying=retrying,
+        )
+
+        now = time.monotonic()
+        with self._lock:
+            self._bucket(key).hold(retry_after, now)
+            self._bucket((key[0], key[1], None)).hold(retry_after, now)
+            if retrying:
+                self._sending.discard(key)
+        return retrying
+
+    def _done(self, key: _Key) -> None:
+        with self._lock:
+            self._queues[key].popleft()
+            self._sending.discard(key)
+        OUTBOUND_QUEUE_DEPTH.labels(key[1]).dec()
+
+    def _without_rate_limit_retries[C: (WebClient, AsyncWebClient)](self, client: C, handler_type: type) -> C:
+        quick = copy.copy(client)
+        quick.retry_handlers = [handler for handler in client.retry_handlers if not isinstance(handler, handler_type)]
+        return quick
+
+
+class OutboundScheduler(_OutboundScheduler[Future[SlackResponse]]):
+    """Sends from a thread pool of `max_in_flight` threads, with one thread deciding what can go next."""
+
+    def __init__(self, **kwargs: Any) -> None:  # noqa: ANN401
+        super().__init__(**kwargs)
+
+        self._wakeup = threading.Event()
+        self._dispatcher: threading.Thread | None = None
+        self._pool: ThreadPoolExecutor | None = None
+
+    def submit(self, client: WebClient, method: str, **kwargs: Any) -> Future[SlackResponse]:  # noqa: ANN401
+        """Queue `client.<method>(**kwargs)`, e.g. submit(client, "chat.postMessage", channel=..., text=...)."""
+        call: _Call[Future[SlackResponse]] = _Call(client, method, kwargs, Future())
+        self._enqueue(call)
+
+        with self._lock:
+            if self._dispatcher is None:
+                self._pool = ThreadPoolExecutor(self.max_in_flight, thread_name_prefix="outbound")
+                self._dispatcher = threading.Thread(target=self._dispatch, name="outbound-dispatcher", daemon=True)
+                self._dispatcher.start()
+        self._wakeup.set()
+
+        return call.future
+
+    def _dispatch(self) -> None:
+        while True:
+            self._wakeup.clear()
+            ready, next_wait = self._take_ready()
+            for key, call in ready:
+                self._pool.submit(self._send, key, call)  # type: ignore[union-attr]
+            self._wakeup.wait(timeout=next_wait)
+
+    def _send(self, key: _Key, call: _Call[Future[SlackResponse]]) -> None:
+        self._start(call)
+        try:
+            with STAGE_SECONDS.labels(call.method.replace(".", "_")).time():
+                client = self._without_rate_limit_retries(call.client, RateLimitErrorRetryHandler)
+                resp = getattr(client, call.method.replace(".", "_"))(**call.kwargs)
+        except SlackApiError as e:
+            if e.response.status_code != 429 or not self._rate_limited(key, call, e):  # noqa: PLR2004
+                self._done(key)
+                call.future.set_exception(e)
+        except Exception as e:  # noqa: BLE001
+            self._done(key)
+            call.future.set_exception(e)
+        else:
+            self._done(key)
+            call.future.set_result(resp)
+        finally:
+            self._wakeup.set()
+
+
+class AsyncOutboundScheduler(_OutboundScheduler[asyncio.Future[AsyncSlackResponse]]):
+    """Sends as tasks, with one task per event loop deciding what can go next."""
+
+    def __init__(self, **kwargs: Any) -> None:  # noqa: ANN401
+        super().__init__(**kwargs)
+
+        self._wakeup: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task[None] | None = None
+        self._sends: set[asyncio.Task[None]] = set()
+
+    def submit(self, client: "AsyncWebClient", method: str, **kwargs: Any) -> asyncio.Future[AsyncSlackResponse]:  # noqa: ANN401
+        """See OutboundScheduler.submit."""
+        loop = asyncio.get_running_loop()
+        call = _Call(client, method, kwargs, loop.create_future())
+        self._enqueue(call)
+
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch(self._wakeup))
+        self._wakeup.set()  # type: ignore[union-attr]
+
+        return call.future
+
+    async def _dispatch(self, wakeup: asyncio.Event) -> None:
+        while True:
+            wakeup.clear()
+            ready, next_wait = self._take_ready()
+            for key, call in ready:
+                self._sends.add(task := asyncio.create_task(self._send(key, call)))
+                task.add_done_callback(self._sends.discard)
+
+            # Whichever comes first, a new call or the next one being allowed to go
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(wakeup.wait(), timeout=next_wait)
+
+    async def _send(self, key: _Key, call: _Call[asyncio.Future[AsyncSlackResponse]]) -> None:
+        from slack_sdk.http_retry.builtin_async_handlers import AsyncRateLimitErrorRetryHandler
+
+        self._start(call)
+        try:
+            with STAGE_SECONDS.labels(call.method.replace(".", "_")).time():
+                client = self._without_rate_limit_retries(call.client, AsyncRateLimitErrorRetryHandler)
+                resp = await getattr(client, call.method.replace(".", "_"))(**call.kwargs)
+        except SlackApiError as e:
+            if e.response.status_code != 429 or not self._rate_limited(key, call, e):  # noqa: PLR2004
+                self._done(key)
+                call.future.set_exception(e)
+        except Exception as e:  # noqa: BLE001
+            self._done(key)
+            call.future.set_exception(e)
+        else:
+            self._done(key)
+            call.future.set_result(resp)
+        finally:
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+
+_limits = {
+    "channel_rate": app_config.outbound_channel_rate,
+    "channel_burst": app_config.outbound_channel_burst,
+    "method_rate": app_config.outbound_method_rate,
+    "method_burst": app_config.outbound_method_burst,
+    "max_in_flight": app_config.outbound_max_in_flight,
+    "max_attempts": app_config.outbound_max_attempts,
+}
+outbound_scheduler = OutboundScheduler(**_limits)
+async_outbound_scheduler = AsyncOutboundScheduler(**_limits)
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+import pytest
+from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
+from slack_sdk.web.slack_response import SlackResponse
+
+from outbound import AsyncOutboundScheduler, OutboundScheduler, TokenBucket
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+
+def response(status_code: int, headers: dict[str, Any] | None = None) -> SlackResponse:
+    return SlackResponse(
+        client=None,
+        http_verb="POST",
+        api_url="https://slack.com/api/chat.postMessage",
+        req_args={},
+        data={"ok": status_code == 200},  # noqa: PLR2004
+        headers=headers or {},
+        status_code=status_code,
+    )
+
+
+class FakeClient:
+    """chat_postMessage, answering 429s for the first `rate_limited` calls and recording the rest.
+
+    State is all in containers, since the scheduler posts with (shallow) copies of the client.
+    """
+
+    def __init__(self, token: str = "xoxb-test", rate_limited: int = 0) -> None:  # noqa: S107
+        self.token = token
+        self.retry_handlers = [RateLimitErrorRetryHandler()]
+        self.rate_limited = [429] * rate_limited
+        self.posted: list[tuple[str, str, float]] = []
+        self.lock = threading.Lock()
+
+    def _post(self, channel: str, text: str) -> SlackResponse:
+        with self.lock:
+            if self.rate_limited:
+                msg = "ratelimited"
+                raise SlackApiError(msg, response(self.rate_limited.pop(), {"Retry-After": "0.2"}))
+            self.posted.append((channel, text, time.monotonic()))
+        return response(200)
+
+    def chat_postMessage(self, *, channel: str, text: str) -> SlackResponse:  # noqa: N802
+        assert not any(isinstance(h, RateLimitErrorRetryHandler) for h in self.retry_handlers), "Should never sleep"
+        return self._post(channel, text)
+
+
+class FakeAsyncClient(FakeClient):
+    async def chat_postMessage(self, *, channel: str, text: str) -> SlackResponse:  # type: ignore[override]  # noqa: N802
+        await asyncio.sleep(0)
+        return self._post(channel, text)
+
+
+def test_token_bucket_allows_a_burst_then_paces() -> None:
+    bucket = TokenBucket(rate=2, burst=3)
+    now = bucket.updated
+
+    for _ in range(3):
+        assert bucket.wait_time(now) == 0
+        bucket.take()
+    assert bucket.wait_time(now) == pytest.approx(0.5)
+    assert bucket.wait_time(now + 0.5) == 0
+
+    bucket.hold(10, now + 0.5)
+    assert bucket.wait_time(now + 1) == pytest.approx(9.5)
+    assert bucket.wait_time(now + 10.5) == 0
+
+
+def test_scheduler_paces_posts_to_a_channel_in_order() -> None:
+    client = FakeClient()
+    scheduler = OutboundScheduler(channel_rate=20, channel_burst=1)
+
+    start = time.monotonic()
+    posts = [scheduler.submit(client, "chat.postMessage", channel="#a", text=str(i)) for i in range(5)]  # type: ignore[arg-type]
+    for post in posts:
+        assert post.result(timeout=5).status_code == 200  # noqa: PLR2004
+
+    assert [text for _, text, _ in client.posted] == ["0", "1", "2", "3", "4"]
+    assert client.posted[-1][2] - start >= 4 / 20 * 0.9
+
+
+def test_scheduler_doesnt_hold_up_other_channels() -> None:
+    client = FakeClient()
+    scheduler = OutboundScheduler(channel_rate=1, channel_burst=1)
+
+    slow: list[Future[SlackResponse]] = [
+        scheduler.submit(client, "chat.postMessage", channel="#slow", text=str(i))  # type: ignore[arg-type]
+        for i in range(3)
+    ]
+    scheduler.submit(client, "chat.postMessage", channel="#other", text="other").result(timeout=0.5)  # type: ignore[arg-type]
+
+    assert not slow[-1].done()
+
+
+def test_scheduler_backs_off_on_429_without_losing_order() -> None:
+    client = FakeClient(rate_limited=1)
+    scheduler = OutboundScheduler(channel_rate=100, channel_burst=10)
+
+    start = time.monotonic()
+    posts = [scheduler.submit(client, "chat.postMessage", channel="#a", text=str(i)) for i in range(3)]  # type: ignore[arg-type]
+    for post in posts:
+        post.result(timeout=5)
+
+    assert [text for _, text, _ in client.posted] == ["0", "1", "2"]
+    assert client.posted[0][2] - start >= 0.2 * 0.9, "Should have waited out the Retry-After"
+
+
+def test_scheduler_gives_up_on_a_call_that_stays_rate_limited() -> None:
+    client = FakeClient(rate_limited=3)
+    scheduler = OutboundScheduler(channel_rate=100, channel_burst=10, max_attempts=2)
+
+    gave_up = scheduler.submit(client, "chat.postMessage", channel="#a", text="0")  # type: ignore[arg-type]
+    with pytest.raises(SlackApiError):
+        gave_up.result(timeout=5)
+
+    scheduler.submit(client, "chat.postMessage", channel="#a", text="1").result(timeout=5)  # type: ignore[arg-type]
+    assert [text for _, text, _ in client.posted] == ["1"], "The next call should go once the limit has passed"
+
+
+def test_async_scheduler_paces_posts_in_order() -> None:
+    client = FakeAsyncClient(rate_limited=1)
+    scheduler = AsyncOutboundScheduler(channel_rate=50, channel_burst=1)
+
+    async def post_all() -> None:
+        posts = [scheduler.submit(client, "chat.postMessage", channel="#a", text=str(i)) for i in range(5)]  # type: ignore[arg-type]
+        await asyncio.wait_for(asyncio.gather(*posts), timeout=5)
+
+    asyncio.run(post_all())
+    assert [text for _, text, _ in client.posted] == ["0", "1", "2", "3", "4"]
+
+
+class SlowClient(FakeClient):
+    """Takes a while to post, and keeps track of the most posts it's had at once."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.in_flight = [0]
+        self.max_in_flight = [0]
+
+    def chat_postMessage(self, *, channel: str, text: str) -> SlackResponse:  # noqa: N802
+        with self.lock:
+            self.in_flight[0] += 1
+            self.max_in_flight[0] = max(self.max_in_flight[0], self.in_flight[0])
+        time.sleep(0.05)
+        with self.lock:
+            self.in_flight[0] -= 1
+        return super().chat_postMessage(channel=channel, text=text)
+
+
+def test_scheduler_bounds_fan_out_across_channels() -> None:
+    client = SlowClient()
+    max_in_flight = 3
+    scheduler = OutboundScheduler(
+        channel_rate=100, channel_burst=10, method_rate=100, method_burst=100, max_in_flight=max_in_flight
+    )
+
+    posts = [scheduler.submit(client, "chat.postMessage", channel=f"#{i}", text=str(i)) for i in range(10)]  # type: ignore[arg-type]
+    for post in posts:
+        post.result(timeout=5)
+
+    assert client.max_in_flight[0] == max_in_flight
+    assert sorted(channel for channel, _, _ in client.posted) == sorted(f"#{i}" for i in range(10))
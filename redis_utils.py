@@ -1,17 +1,75 @@
+import functools
+from typing import Any
+
 import redis
+import redis.asyncio
+from redis.asyncio.retry import Retry as AsyncRetry
 from redis.backoff import ExponentialBackoff
 import redis.exceptions as redis_exceptions
 from redis.retry import Retry
 
+from metrics import REDIS_COMMAND_SECONDS
+
+_RETRY_ON_ERROR: list[type[Exception]] = [
+    # Retry errors where our network connections to redis are being wonky
+    redis_exceptions.BusyLoadingError,
+    redis_exceptions.ConnectionError,
+    redis_exceptions.TimeoutError,
+]
+
+
+def _command_name(command: str | bytes) -> str:
+    return (command.decode() if isinstance(command, bytes) else command).upper()
+
+
+class _TimedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error: bool = True) -> list[Any]:  # noqa: FBT001, FBT002
+        with REDIS_COMMAND_SECONDS.labels("PIPELINE").time():
+            return super().execute(raise_on_error)
+
+
+class _TimedRedis(redis.Redis):
+    """redis.Redis, recording how long each command (or whole pipeline) takes."""
+
+    def execute_command(self, *args: Any, **options: Any) -> Any:  # noqa: ANN401
+        with REDIS_COMMAND_SECONDS.labels(_command_name(args[0])).time():
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> redis.client.Pipeline:  # noqa: FBT001, FBT002
+        return _TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
 
+class _AsyncTimedPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error: bool = True) -> list[Any]:  # noqa: FBT001, FBT002
+        with REDIS_COMMAND_SECONDS.labels("PIPELINE").time():
+            return await super().execute(raise_on_error)
+
+
+class _AsyncTimedRedis(redis.asyncio.Redis):
+    """Same as _TimedRedis, for redis.asyncio."""
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:  # noqa: ANN401
+        with REDIS_COMMAND_SECONDS.labels(_command_name(args[0])).time():
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> redis.asyncio.client.Pipeline:  # noqa: FBT001, FBT002
+        return _AsyncTimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# Cached so every module talking to the same Redis shares one client, and so one connection pool
+@functools.cache
 def redis_client(url: str) -> redis.Redis:
-    return redis.Redis.from_url(
+    return _TimedRedis.from_url(
         url,
         retry=Retry(ExponentialBackoff(), 3),
-        retry_on_error=[
-            # Retry errors where our network connections to redis are being wonky
-            redis_exceptions.BusyLoadingError,
-            redis_exceptions.ConnectionError,
-            redis_exceptions.TimeoutError,
-        ],
+        retry_on_error=_RETRY_ON_ERROR,
+    )
+
+
+@functools.cache
+def async_redis_client(url: str) -> redis.asyncio.Redis:
+    return _AsyncTimedRedis.from_url(
+        url,
+        retry=AsyncRetry(ExponentialBackoff(), 3),
+        retry_on_error=_RETRY_ON_ERROR,
     )
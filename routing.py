@@ -0,0 +1,55 @@
+"""Which channels to post about an emoji in, from SLACK_APP_ROUTES.
+
+Routes are a JSON list of rules, each with the channels to post to and the conditions an emoji has to meet, e.g.
+
+    [
+        {"team_id": "T0FRONTEND", "channels": ["#frontend-emoji"]},
+        {"enterprise_id": "E0ORG", "alias": false, "channels": ["#org-emoji", "#emoji-papertrail"]},
+        {"name": "party*", "channels": ["#parties"]}
+    ]
+
+An emoji is posted to the channels of every rule it matches (each channel once), or to SLACK_APP_CHANNEL if it matches
+none.
+"""
+
+from collections.abc import Sequence
+from fnmatch import fnmatchcase
+from typing import TYPE_CHECKING
+
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    # config.py imports this module, and emoji's imports aren't needed just to read settings
+    from emoji import EmojiInfo
+
+
+class RouteRule(BaseModel, frozen=True):
+    channels: list[str]
+
+    # Conditions, any left unset match everything
+    enterprise_id: str | None = None
+    team_id: str | None = None
+    # True for only aliases, False for only new emoji
+    alias: bool | None = None
+    # A shell-style pattern (`party*`, `*-parrot`) the emoji's name has to match
+    name: str | None = None
+
+    def matches(self, enterprise_id: str | None, team_id: str | None, emoji: "EmojiInfo") -> bool:
+        return (
+            (self.enterprise_id is None or self.enterprise_id == enterprise_id)
+            and (self.team_id is None or self.team_id == team_id)
+            and (self.alias is None or self.alias == emoji.is_alias)
+            and (self.name is None or fnmatchcase(emoji.name, self.name))
+        )
+
+
+def channels_for(
+    routes: Sequence[RouteRule],
+    default_channel: str,
+    enterprise_id: str | None,
+    team_id: str | None,
+    emoji: "EmojiInfo",
+) -> list[str]:
+    channels = [channel for rule in routes if rule.matches(enterprise_id, team_id, emoji) for channel in rule.channels]
+    # In the order the rules list them, each just once
+    return list(dict.fromkeys(channels)) or [default_channel]
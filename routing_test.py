@@ -0,0 +1,33 @@
+import pytest
+
+from config import SlackAppConfig
+from emoji import EmojiInfo
+from routing import RouteRule, channels_for
+
+EMOJI = EmojiInfo(name="party-parrot", image_url="https://emoji.example.com/party-parrot.png")
+ALIAS = EmojiInfo(name="parrot", image_url=EMOJI.image_url, alias_of=EMOJI)
+
+ROUTES = [
+    RouteRule(team_id="T0FRONTEND", channels=["#frontend-emoji"]),
+    RouteRule(enterprise_id="E0ORG", alias=False, channels=["#org-emoji", "#emoji-papertrail"]),
+    RouteRule(name="party*", channels=["#parties", "#org-emoji"]),
+]
+
+
+@pytest.mark.parametrize(
+    ("enterprise_id", "team_id", "emoji", "expected"),
+    [
+        ("E0ORG", "T0FRONTEND", EMOJI, ["#frontend-emoji", "#org-emoji", "#emoji-papertrail", "#parties"]),
+        ("E0ORG", "T0BACKEND", ALIAS, ["#default"]),
+        (None, "T0FRONTEND", ALIAS, ["#frontend-emoji"]),
+        (None, None, EMOJI, ["#parties", "#org-emoji"]),
+    ],
+)
+def test_channels_for(enterprise_id: str | None, team_id: str | None, emoji: EmojiInfo, expected: list[str]):
+    assert channels_for(ROUTES, "#default", enterprise_id, team_id, emoji) == expected
+
+
+def test_routes_are_read_from_the_environment(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("SLACK_APP_ROUTES", '[{"team_id": "T0FRONTEND", "channels": ["#frontend-emoji"]}]')
+
+    assert SlackAppConfig().routes == [RouteRule(team_id="T0FRONTEND", channels=["#frontend-emoji"])]
@@ -1,65 +1,136 @@
-from collections.abc import Mapping
+from collections.abc import Callable, Mapping
+from concurrent.futures import Future
+import functools
+from http import HTTPStatus
+import os
+import threading
 from typing import Any
 
-from pydantic import BaseModel
-from slack_bolt import App as SlackApp
+from slack_bolt import (
+    Ack,
+    App as SlackApp,
+    BoltRequest,
+    BoltResponse,
+    Respond,
+)
 from slack_bolt.oauth.oauth_settings import OAuthSettings
 from slack_sdk import WebClient
-from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
-from slack_sdk.models.blocks import Block, SectionBlock
+from slack_sdk.web.slack_response import SlackResponse
 import structlog
 
+from catalog import EmojiCatalog, RedisEmojiCatalog, catalog_for
 from config import BotTokenConfig, SlackOAuthConfig, app_config, app_credentials
-from emoji import EmojiInfo, get_emoji
-from idemptotency import has_handled
+from digest import add_to_digest, flush_overdue_digests
+from emoji_search import normalize_query
+from event_queue import EmojiEventJob, enqueue
+from idemptotency import forget_seen_event, has_handled, has_seen_event, mark_posted, not_yet_posted, skipped_events
+from messages import EmojiSearchResultsMessage, EmojiUpdateMessage
+from metrics import ALIAS_SKIPS, POSTS, SKIPPED_EVENTS, STAGE_SECONDS, CountingRateLimitErrorRetryHandler
+from outbound import outbound_scheduler
 from redis_utils import redis_client
+from routing import channels_for
+from slack_clients import WebClientPool, install_keep_alive
+from slack_enterprise.installation_cache import InstallationCache
 from slack_enterprise.redis_installation_store import RedisInstallationStore
 from slack_enterprise.redis_oauth_state_store import RedisOAuthStateStore
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
 
-_slack_app_cfg = {}
+# Bolt only falls back to SLACK_BOT_TOKEN when it builds its own client, so we need to do that ourselves
+_slack_app_token = os.environ.get("SLACK_BOT_TOKEN")
 if isinstance(app_credentials, SlackOAuthConfig):
-    _oauth_redis = redis_client(str(app_config.redis_host))
+    _slack_app_token = None
+elif isinstance(app_credentials, BotTokenConfig):
+    _slack_app_token = app_credentials.token
+
+# Every WebClient's calls to Slack, ours and Bolt's, then go over connections kept open between them
+install_keep_alive(app_config.slack_api_url)
+_client = WebClient(token=_slack_app_token, base_url=app_config.slack_api_url)
+_client.retry_handlers.append(
+    # Ensure we follow the backoff instructions
+    CountingRateLimitErrorRetryHandler(
+        # But strong prefer not to drop these, lol
+        max_retry_count=5,
+    ),
+)
+# Bolt builds a fresh client for every event, so listeners swap it for one of these
+web_clients = WebClientPool(
+    _client,
+    max_size=app_config.web_client_pool_max_size,
+    idle_timeout=app_config.web_client_idle_timeout,
+)
+
 
-    _slack_app_cfg["oauth_settings"] = OAuthSettings(
-        client_id=app_credentials.client_id.get_secret_value(),
-        client_secret=app_credentials.client_secret.get_secret_value(),
-        scopes=app_credentials.bot_scopes,
-        user_scopes=app_credentials.user_scopes,
+def _oauth_settings(oauth: SlackOAuthConfig) -> OAuthSettings:
+    oauth_redis = redis_client(str(app_config.redis_host))
+    return OAuthSettings(
+        client_id=oauth.client_id.get_secret_value(),
+        client_secret=oauth.client_secret.get_secret_value(),
+        scopes=oauth.bot_scopes,
+        user_scopes=oauth.user_scopes,
         installation_store=RedisInstallationStore(
-            redis_client=_oauth_redis,
-            client_id=app_credentials.client_id.get_secret_value(),
+            redis_client=oauth_redis,
+            client_id=oauth.client_id.get_secret_value(),
+            history_max_entries=oauth.installation_history_max_entries,
+            cache=InstallationCache(
+                ttl=oauth.installation_cache_ttl,
+                max_entries=oauth.installation_cache_max_entries,
+            )
+            if oauth.installation_cache_ttl
+            else None,
         ),
         state_store=RedisOAuthStateStore(
-            redis_client=_oauth_redis,
+            redis_client=oauth_redis,
             expiration_seconds=600,
         ),
     )
-elif isinstance(app_credentials, BotTokenConfig):
-    _slack_app_cfg["token"] = app_credentials.token
 
 
-# Setup our Slack Webhook Handler
-slack_app = SlackApp(
-    **_slack_app_cfg,
-)
-slack_app.client.retry_handlers.append(
-    # Ensure we follow the backoff instructions
-    RateLimitErrorRetryHandler(
-        # But strong prefer not to drop these, lol
-        max_retry_count=5,
-    ),
-)
+def skip_seen_events(
+    body: Mapping[str, Any],
+    req: BoltRequest,
+    next_: Callable[[], BoltResponse],
+) -> BoltResponse:
+    """Ack Slack's retries and any other repeat deliveries of an event, before we authorize or look anything up."""
+    event_id = body.get("event_id")
+    if body.get("type") != "event_callback" or event_id is None:
+        return next_()
+    if not has_seen_event(event_id):
+        return _unless_failed(event_id, next_)
+
+    retry_num = next(iter(req.headers.get("x-slack-retry-num", ())), None)
+    reason = "retry" if retry_num is not None else "duplicate"
+    skipped_events[reason] += 1
+    SKIPPED_EVENTS.labels(reason).inc()
+
+    logger.info(
+        "Skipping already seen event",
+        event_id=event_id,
+        retry_num=retry_num,
+        retry_reason=next(iter(req.headers.get("x-slack-retry-reason", ())), None),
+        skipped_events=dict(skipped_events),
+    )
+    return BoltResponse(status=200, body="")
+
+
+def _unless_failed(event_id: str, next_: Callable[[], BoltResponse]) -> BoltResponse:
+    """next_(), forgetting we've seen the event if handling it fails, so we don't skip Slack's retry of it too."""
+    try:
+        response = next_()
+    except Exception:
+        forget_seen_event(event_id)
+        raise
+
+    if not HTTPStatus.OK <= response.status < HTTPStatus.MULTIPLE_CHOICES:
+        forget_seen_event(event_id)
+    return response
 
 
-@slack_app.event("emoji_changed")
 def emoji_changed(
     client: WebClient,
     event: Mapping[str, Any],
     context: Mapping[str, Any],
-    payload: Mapping[str, Any],
 ) -> Mapping[str, Any]:
     """{
         'event_ts': '1671070007.348400',
@@ -69,80 +140,235 @@ def emoji_changed(
         'value': 'https://emoji.slack-edge.com/EXAMPLE/test-emoji-pls-ignore-1/0da8457a872dfe8a.png',
     }
     """
-    log = logger.bind(
-        event=event,
-        payload=payload,
-        **{k: v for k, v in payload.items() if k in ("name", "subtype", "type", "value")},
+    if app_config.queue_mode:
+        message_id = enqueue(EmojiEventJob.from_context(event, context))
+        logger.info("Queued event", message_id=message_id, subtype=event.get("subtype"), name=event.get("name"))
+        return {"ok": True}
+
+    process_emoji_changed(
+        web_clients.get(client.token),
+        web_clients.get(context.get("user_token") or client.token),
+        event,
+        catalog_for(
+            context.get("enterprise_id"),
+            context.get("team_id"),
+            is_enterprise_tenant=context.get("is_enterprise_install", False),
+        ),
+        enterprise_id=context.get("enterprise_id"),
+        team_id=context.get("team_id"),
+    )
+
+    return {"ok": True}
+
+
+def emoji_search(
+    ack: Ack,
+    respond: Respond,
+    command: Mapping[str, Any],
+    client: WebClient,
+    context: Mapping[str, Any],
+) -> None:
+    """`/emoji-search parrot`: whether there's an emoji called that, and others like it, only shown to whoever asked.
+
+    Answered in the ack, from the catalog's search index, so Slack's only asked anything if the list needs a resync.
+    When it does, or the index isn't built yet, that can take longer than Slack waits for an ack, so we ack straight away
+    and respond once it's done instead.
+    """
+    query = normalize_query(command.get("text", ""))
+    if not query:
+        ack(text="Search for emoji by name, e.g. `/emoji-search parrot`")
+        return
+
+    catalog = catalog_for(
+        context.get("enterprise_id"),
+        context.get("team_id"),
+        is_enterprise_tenant=context.get("is_enterprise_install", False),
     )
+    names = catalog.search_if_ready(query, app_config.emoji_search_max_results)
+    if names is not None:
+        ack(**_emoji_search_results(query, names))
+        return
+
+    ack()
+    # In a thread of its own, as in queue mode Bolt only sends the ack once we return
+    threading.Thread(
+        target=_respond_to_emoji_search,
+        args=(respond, catalog, web_clients.get(context.get("user_token") or client.token), query),
+        name="emoji-search",
+        daemon=True,
+    ).start()
+
+
+def _respond_to_emoji_search(
+    respond: Respond,
+    catalog: EmojiCatalog | RedisEmojiCatalog,
+    client: WebClient,
+    query: str,
+) -> None:
+    try:
+        with STAGE_SECONDS.labels("emoji_search").time():
+            names = catalog.search(client, query, app_config.emoji_search_max_results)
+        respond(response_type="ephemeral", **_emoji_search_results(query, names))
+    except Exception:
+        logger.exception("Failed to search emoji", query=query)
+
+
+def _emoji_search_results(query: str, names: list[str]) -> dict[str, Any]:
+    logger.info("Searched emoji", query=query, results=len(names))
+    results = EmojiSearchResultsMessage(query=query, names=names)
+    return {"text": results.message(), "blocks": results.blocks()}
+
+
+_slack_app_lock = threading.Lock()
+
+
+def get_slack_app() -> SlackApp:
+    """Our Slack webhook handler, built on first use rather than at import.
+
+    Building it checks the bot token with Slack (auth.test), a network round trip that would otherwise hold up every
+    cold start before the process could even take a request. See warm_up for getting it out of the way early.
+    """
+    # Locked, so a warm-up and the first event arriving together don't both build one
+    with _slack_app_lock:
+        return _build_slack_app()
+
+
+@functools.cache
+def _build_slack_app() -> SlackApp:
+    slack_app = SlackApp(
+        client=_client,
+        # In queue mode the listener only enqueues, so we make sure that's durable before acking
+        process_before_response=app_config.queue_mode,
+        before_authorize=skip_seen_events,
+        oauth_settings=_oauth_settings(app_credentials) if isinstance(app_credentials, SlackOAuthConfig) else None,
+    )
+    slack_app.event("emoji_changed")(emoji_changed)
+    slack_app.command("/emoji-search")(emoji_search)
+    return slack_app
+
+
+def warm_up() -> None:
+    """Do the slow parts of handling the first event ahead of it: build the Bolt app, and fetch the emoji list (and build
+    its search index) and open a connection to Slack (and Redis) for the bot token's workspace. Also posts any digests a
+    process that died left behind.
+    """
+    slack_app = get_slack_app()
+    if app_config.redis_host is not None:
+        redis_client(str(app_config.redis_host)).ping()
+    if app_config.digest_window:
+        flush_overdue_digests(lambda enterprise_id, team_id: tenant_clients(enterprise_id, team_id)[0])
+
+    if slack_app.installation_store is not None:
+        # Installed in any number of workspaces, none of which are worth guessing at
+        return
+
+    client = web_clients.get(_client.token)
+    auth = client.auth_test()
+    catalog_for(auth.get("enterprise_id"), auth.get("team_id")).prepare_search(client)
+
+
+def process_emoji_changed(  # noqa: PLR0913
+    client: WebClient,
+    user_client: WebClient,
+    event: Mapping[str, Any],
+    catalog: EmojiCatalog | RedisEmojiCatalog,
+    *,
+    enterprise_id: str | None = None,
+    team_id: str | None = None,
+) -> list[Future[SlackResponse]]:
+    """Handle an emoji_changed event, returning its posts (one per channel) for callers that need to wait on them."""
+    log = logger.bind(**{k: v for k, v in event.items() if k in ("name", "subtype", "type", "value")})
+    catalog.apply(event)
+
     if event["subtype"] != "add":
         log.info("Ignoring non-add event")
-        return {"ok": True}
+        return []
 
     log.info("New Emoji Added!")
 
-    user_client = WebClient(token=context["user_token"])
-    emoji = get_emoji(
-        user_client,
-        payload["name"],
-        payload["value"],
-        is_enterprise_tenant=context.get("is_enterprise_install", False),
-    )
+    with STAGE_SECONDS.labels("get_emoji").time():
+        emoji = catalog.get_emoji(user_client, event["name"], event["value"])
 
-    # TODO: Figure out if we should do something more to special case alias,
-    # e.g. batch/debounce the alias posts within a certain time period.
     if emoji.is_alias and not app_config.should_report_alias_changes:
         log.info("Skipping alias post")
-        return {"ok": True}
+        ALIAS_SKIPS.inc()
+        return []
 
-    if has_handled(emoji.name, payload["event_ts"]):
+    with STAGE_SECONDS.labels("has_handled").time():
+        handled = has_handled(emoji.name, event["event_ts"])
+    if handled:
         log.info("Already handled, skipping")
-        return {"ok": True}
+        return []
+
+    channels = channels_for(app_config.routes, app_config.channel, enterprise_id, team_id, emoji)
 
+    if app_config.digest_window:
+        for channel in channels:
+            add_to_digest(client, channel, emoji, enterprise_id=enterprise_id, team_id=team_id)
+        return []
+
+    # Leaving out any a previous attempt at this event already got the post out to, before the rest failed
+    channels = not_yet_posted(emoji.name, event["event_ts"], channels)
     update = EmojiUpdateMessage(emoji=emoji)
 
-    resp = client.chat_postMessage(
-        channel=app_config.channel,
-        text=update.message(),
-        blocks=update.blocks(),
-    )
+    # All at once, each channel queued separately so a slow or failing one doesn't hold up the rest
+    posts = []
+    for channel in channels:
+        posted = outbound_scheduler.submit(
+            client,
+            "chat.postMessage",
+            channel=channel,
+            text=update.message(),
+            blocks=update.blocks(),
+        )
+        posted.add_done_callback(functools.partial(_log_post, log, channel))
+        posted.add_done_callback(functools.partial(_mark_posted, emoji.name, event["event_ts"], channel))
+        posts.append(posted)
+
+    return posts
+
+
+def _log_post(log: structlog.stdlib.BoundLogger, channel: str, posted: Future[SlackResponse]) -> None:
+    if (e := posted.exception()) is not None:
+        POSTS.labels(channel, "error").inc()
+        log.error("Failed to post to channel", channel=channel, exc_info=e)
+        return
+
+    POSTS.labels(channel, "ok").inc()
+    resp = posted.result()
     log.info(
         "Posted to channel",
-        channel=app_config.channel,
+        channel=channel,
         status_code=resp.status_code,
         data=resp.data,
     )
 
-    return {"ok": True}
+
+def _mark_posted(emoji_name: str, event_ts: str, channel: str, posted: Future[SlackResponse]) -> None:
+    if posted.exception() is None:
+        mark_posted(emoji_name, event_ts, [channel])
 
 
-class EmojiUpdateMessage(BaseModel):
-    emoji: EmojiInfo
-
-    def message(self) -> str:
-        emoji_or_alias = f"alias of `{self.emoji.alias_of}`" if self.emoji.is_alias else "emoji"
-
-        if self.emoji.author is not None:
-            return f"New {emoji_or_alias} added by <@{self.emoji.author}>!"
-        return f"New {emoji_or_alias} added!"
-
-    # TODO: Type this at some point
-    def blocks(self) -> list[Block]:
-        primary_block = SectionBlock(
-            text={
-                "text": self.message(),
-                "type": "mrkdwn",
-            },
-            fields=[
-                {"type": "mrkdwn", "text": "*Name*"},
-                {"type": "mrkdwn", "text": "*Emoji*"},
-                {"type": "mrkdwn", "text": f"`{self.emoji}`"},
-                {"type": "mrkdwn", "text": str(self.emoji)},
-            ],
-            accessory={
-                "type": "image",
-                "image_url": self.emoji.image_url,
-                "alt_text": str(self.emoji),
-            },
+def tenant_clients(
+    enterprise_id: str | None,
+    team_id: str | None,
+    *,
+    is_enterprise_install: bool = False,
+) -> tuple[WebClient, WebClient]:
+    """Bot and user clients for a tenant, for when we're handling an event outside of Bolt's request cycle."""
+    bot_token = user_token = _client.token
+
+    installation_store = get_slack_app().installation_store
+    if installation_store is not None:
+        installation = installation_store.find_installation(
+            enterprise_id=enterprise_id,
+            team_id=team_id,
+            is_enterprise_install=is_enterprise_install,
         )
+        if installation is None:
+            msg = f"No installation for {enterprise_id=} {team_id=}"
+            raise LookupError(msg)
+
+        bot_token, user_token = installation.bot_token, installation.user_token or installation.bot_token
 
-        return [primary_block]
+    return web_clients.get(bot_token), web_clients.get(user_token)
@@ -0,0 +1,91 @@
+import asyncio
+from datetime import timedelta
+from http import HTTPStatus
+import threading
+from typing import Any
+import uuid
+
+import pytest
+from slack_bolt import BoltRequest, BoltResponse
+from slack_bolt.async_app import AsyncBoltRequest
+
+import async_slack_app
+from catalog import EmojiCatalog
+from catalog_test import FakeClient
+import slack_app
+
+
+def event_callback(event_id: str) -> dict[str, str]:
+    return {"type": "event_callback", "event_id": event_id}
+
+
+def test_retry_of_a_failed_event_is_handled():
+    body, handled = event_callback(f"Ev{uuid.uuid4()}"), []
+
+    def fail() -> BoltResponse:
+        handled.append("first")
+        return BoltResponse(status=HTTPStatus.INTERNAL_SERVER_ERROR, body="")
+
+    def succeed() -> BoltResponse:
+        handled.append("retry")
+        return BoltResponse(status=HTTPStatus.OK, body="")
+
+    retry = BoltRequest(body="", headers={"x-slack-retry-num": "1"})
+    assert slack_app.skip_seen_events(body, BoltRequest(body=""), fail).status == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert slack_app.skip_seen_events(body, retry, succeed).status == HTTPStatus.OK
+    assert slack_app.skip_seen_events(body, retry, succeed).status == HTTPStatus.OK
+    assert handled == ["first", "retry"], "Only the retry of the failed delivery should get through"
+
+
+def test_retry_of_an_event_that_raised_is_handled():
+    body, handled = event_callback(f"Ev{uuid.uuid4()}"), []
+
+    async def fail() -> BoltResponse:
+        handled.append("first")
+        raise RuntimeError
+
+    async def succeed() -> BoltResponse:
+        handled.append("retry")
+        return BoltResponse(status=HTTPStatus.OK, body="")
+
+    async def deliver_twice() -> None:
+        with pytest.raises(RuntimeError):
+            await async_slack_app.skip_seen_events(body, AsyncBoltRequest(body=""), fail)
+        await async_slack_app.skip_seen_events(body, AsyncBoltRequest(body=""), succeed)
+
+    asyncio.run(deliver_twice())
+    assert handled == ["first", "retry"]
+
+
+def test_emoji_search_acks_straight_away_until_the_index_is_built(monkeypatch: pytest.MonkeyPatch):
+    client = FakeClient({"party": "https://example.com/party.png"})
+    catalog = EmojiCatalog(resync_interval=timedelta(hours=1))
+    monkeypatch.setattr(slack_app, "catalog_for", lambda *_args, **_kwargs: catalog)
+    monkeypatch.setattr(slack_app.web_clients, "get", lambda _token: client)
+
+    acks: list[dict[str, Any]] = []
+    responses: list[dict[str, Any]] = []
+    responded = threading.Event()
+
+    def respond(**kwargs: Any) -> None:  # noqa: ANN401
+        responses.append(kwargs)
+        responded.set()
+
+    def search() -> None:
+        slack_app.emoji_search(
+            lambda **kwargs: acks.append(kwargs),  # type: ignore[arg-type]
+            respond,  # type: ignore[arg-type]
+            {"text": "party"},
+            client,  # type: ignore[arg-type]
+            {"team_id": "T123", "user_token": "xoxp-test"},
+        )
+
+    search()
+    assert acks == [{}], "Slack gives up on an ack that takes too long, so it shouldn't wait on the search"
+    assert responded.wait(timeout=5)
+    assert "party" in responses[0]["text"]
+
+    search()
+    assert "party" in acks[1]["text"], "Answered in the ack once the index is built"
+    assert len(responses) == 1
+    assert client.calls == 1
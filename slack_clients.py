@@ -0,0 +1,264 @@
+"""Slack Web API clients that are reused across events, rather than built (and connected) from scratch for each one.
+
+WebClient opens a new connection, TLS handshake and all, for every call it makes, and AsyncWebClient does the same
+unless it's given an aiohttp session. The pools here hand out one client per token, built like the app's own client
+(same base URL and retry handlers). The sync ones keep their connections open between calls, once install_keep_alive
+has been called, and the async ones share one session.
+"""
+
+from abc import ABC, abstractmethod
+import asyncio
+from collections import OrderedDict, defaultdict
+from collections.abc import Iterable
+from datetime import timedelta
+import http.client
+import io
+import select
+import ssl
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+from urllib.parse import urlsplit
+import urllib.request
+from urllib.request import Request
+from urllib.response import addinfourl
+
+from slack_sdk import WebClient
+
+if TYPE_CHECKING:
+    import aiohttp
+    from slack_sdk.web.async_client import AsyncWebClient
+
+type _ConnectionKey = tuple[str, str, ssl.SSLContext | None]
+
+
+class ConnectionPool:
+    """Idle HTTP connections, by scheme, host and SSL context, for KeepAliveHandler to pick back up."""
+
+    def __init__(self, max_idle_per_host: int = 32) -> None:
+        self.max_idle_per_host = max_idle_per_host
+
+        self._idle: defaultdict[_ConnectionKey, list[http.client.HTTPConnection]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def take(self, key: _ConnectionKey, timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        """A connection for `key`, and whether it's been used before (so might have been closed on the other end)."""
+        with self._lock:
+            idle = self._idle[key]
+            conn = idle.pop() if idle else None
+
+        while conn is not None and self._is_dropped(conn):
+            conn.close()
+            with self._lock:
+                conn = idle.pop() if idle else None
+
+        if conn is None:
+            scheme, netloc, context = key
+            if scheme == "https":
+                return http.client.HTTPSConnection(netloc, timeout=timeout, context=context), False
+            return http.client.HTTPConnection(netloc, timeout=timeout), False
+
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _is_dropped(self, conn: http.client.HTTPConnection) -> bool:
+        # An idle connection has nothing to read, unless the other end has since closed it
+        if conn.sock is None:
+            return True
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+        return bool(readable)
+
+    def put(self, key: _ConnectionKey, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle[key]
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, defaultdict(list)
+
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+_connection_pool = ConnectionPool()
+
+
+class KeepAliveHandler(urllib.request.BaseHandler):
+    """urllib handler sending requests to `hosts` over connections kept open in a ConnectionPool, rather than one per
+    request. Requests anywhere else are left to the handlers after it.
+
+    A request is only sent again on another connection if sending it failed. Once it's gone out, Slack may well have
+    acted on it (and posted a message, say) however the response goes missing. Connections Slack has closed while they
+    sat idle are dropped by ConnectionPool.take before they get that far.
+    """
+
+    # Ahead of urllib's own HTTPHandler and HTTPSHandler
+    handler_order = 400
+
+    def __init__(self, hosts: Iterable[str], connection_pool: ConnectionPool | None = None) -> None:
+        self.hosts = frozenset(hosts)
+        self.connection_pool = connection_pool or _connection_pool
+
+    def http_open(self, req: Request) -> addinfourl | None:
+        return self._open(req)
+
+    def https_open(self, req: Request) -> addinfourl | None:
+        return self._open(req)
+
+    def _open(self, req: Request) -> addinfourl | None:
+        if req.host not in self.hosts:
+            return None
+
+        key: _ConnectionKey = (req.type, req.host, None)
+        timeout: float = req.timeout  # type: ignore[attr-defined]
+
+        while True:
+            conn, reused = self.connection_pool.take(key, timeout)
+            try:
+                conn.request(req.get_method(), req.selector, body=req.data, headers=dict(req.header_items()))
+            except (ConnectionResetError, BrokenPipeError):
+                conn.close()
+                # Slack closed it as we picked it back up, and can't have seen the request, so it's safe to send again
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            break
+
+        try:
+            resp = conn.getresponse()
+            body = resp.read()
+        except BaseException:
+            conn.close()
+            raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self.connection_pool.put(key, conn)
+
+        # Much as urllib's own handlers hand back, so HTTPErrorProcessor and WebClient handle it just the same
+        response = addinfourl(io.BytesIO(body), resp.headers, req.full_url, resp.status)
+        response.msg = resp.reason  # type: ignore[attr-defined]
+        return response
+
+
+def install_keep_alive(*urls: str, connection_pool: ConnectionPool | None = None) -> None:
+    """Have urlopen send requests to the hosts of `urls` with a KeepAliveHandler.
+
+    That's how WebClient sends its calls, unless it's been given an SSL context or proxy of its own.
+    """
+    handler = KeepAliveHandler((urlsplit(url).netloc for url in urls), connection_pool)
+    urllib.request.install_opener(urllib.request.build_opener(handler))
+
+
+class _WebClientPool[C: (WebClient, AsyncWebClient)](ABC):
+    """Clients by token, least recently used first, so idle ones (including for tokens since rotated) age out."""
+
+    def __init__(
+        self, base_client: C, *, max_size: int = 1_000, idle_timeout: timedelta = timedelta(minutes=10)
+    ) -> None:
+        self.base_client = base_client
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+
+        self._clients: OrderedDict[str | None, tuple[C, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def get(self, token: str | None) -> C:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            client = entry[0] if (entry := self._clients.pop(token, None)) is not None else self._new(token)
+            self._clients[token] = (client, now)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+
+        return client
+
+    def _evict_idle(self, now: float) -> None:
+        while self._clients:
+            _, last_used = next(iter(self._clients.values()))
+            if now - last_used < self.idle_timeout.total_seconds():
+                break
+            self._clients.popitem(last=False)
+
+    @abstractmethod
+    def _new(self, token: str | None) -> C: ...
+
+
+class WebClientPool(_WebClientPool[WebClient]):
+    def _new(self, token: str | None) -> WebClient:
+        base = self.base_client
+        return WebClient(
+            token=token,
+            base_url=base.base_url,
+            timeout=base.timeout,
+            ssl=base.ssl,
+            proxy=base.proxy,
+            headers=base.headers,
+            logger=base.logger,
+            retry_handlers=base.retry_handlers,
+        )
+
+
+class AsyncWebClientPool(_WebClientPool["AsyncWebClient"]):
+    """Clients all sharing one aiohttp session, and so its connection pool, per event loop.
+
+    aiohttp and AsyncWebClient are only imported once there's an event loop to use them on, so sync mode never does.
+    """
+
+    def __init__(self, base_client: "AsyncWebClient", **kwargs: Any) -> None:  # noqa: ANN401
+        super().__init__(base_client, **kwargs)
+        self._session: aiohttp.ClientSession | None = None
+        self._session_loop: asyncio.AbstractEventLoop | None = None
+
+    def get(self, token: str | None) -> "AsyncWebClient":
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            import aiohttp
+
+            with self._lock:
+                # The clients we have are tied to the old session
+                self._clients.clear()
+                self._session, self._session_loop = aiohttp.ClientSession(), loop
+
+        return super().get(token)
+
+    def _new(self, token: str | None) -> "AsyncWebClient":
+        from slack_sdk.web.async_client import AsyncWebClient
+
+        base = self.base_client
+        return AsyncWebClient(
+            token=token,
+            base_url=base.base_url,
+            timeout=base.timeout,
+            ssl=base.ssl,
+            proxy=base.proxy,
+            session=self._session,
+            trust_env_in_session=base.trust_env_in_session,
+            headers=base.headers,
+            logger=base.logger,
+            retry_handlers=base.retry_handlers,
+        )
+
+    async def close(self) -> None:
+        with self._lock:
+            session, self._session, self._session_loop = self._session, None, None
+            self._clients.clear()
+
+        if session is not None:
+            await session.close()
@@ -0,0 +1,187 @@
+import asyncio
+from collections.abc import Iterator
+from datetime import timedelta
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import urllib.request
+
+import pytest
+from slack_sdk import WebClient
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
+from slack_sdk.web.async_client import AsyncWebClient
+
+from slack_clients import AsyncWebClientPool, ConnectionPool, WebClientPool, install_keep_alive
+
+
+class FakeSlackAPI(ThreadingHTTPServer):
+    """Answers every call with ok, apart from a 429 for the first `rate_limited` calls, counting connections and calls."""
+
+    daemon_threads = True
+
+    def __init__(self, *, rate_limited: int = 0, keep_alive: bool = True) -> None:
+        self.connections = 0
+        self.calls = 0
+        # Which call (counting from 1) to hang up on once it's been read, rather than answer
+        self.hang_up_on_call: int | None = None
+        self.rate_limited = rate_limited
+        self.keep_alive = keep_alive
+        super().__init__(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}/api/"
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                server.connections += 1
+                super().setup()
+
+            def do_POST(self) -> None:
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                server.calls += 1
+                if server.calls == server.hang_up_on_call:
+                    self.close_connection = True
+                    return
+
+                status, body = (200, {"ok": True}) if server.rate_limited <= 0 else (429, {"ok": False})
+                server.rate_limited -= 1
+
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(data)
+                # Hang up without saying so, like a load balancer dropping an idle connection
+                self.close_connection = not server.keep_alive
+
+            def log_message(self, *_args: object) -> None:
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def fake_slack() -> Iterator[FakeSlackAPI]:
+    server = FakeSlackAPI()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def keep_alive(fake_slack: FakeSlackAPI) -> Iterator[None]:
+    install_keep_alive(fake_slack.url, connection_pool=ConnectionPool())
+    yield
+    urllib.request.install_opener(None)  # type: ignore[arg-type]
+
+
+@pytest.mark.usefixtures("keep_alive")
+def test_keep_alive_client_reuses_its_connection(fake_slack: FakeSlackAPI) -> None:
+    client = WebClient(token="xoxb-test", base_url=fake_slack.url)  # noqa: S106
+
+    for _ in range(3):
+        assert client.auth_test()["ok"]
+
+    assert fake_slack.connections == 1
+
+
+@pytest.mark.usefixtures("keep_alive")
+def test_keep_alive_client_reconnects_when_dropped(fake_slack: FakeSlackAPI) -> None:
+    fake_slack.keep_alive = False
+    client = WebClient(token="xoxb-test", base_url=fake_slack.url)  # noqa: S106
+
+    for _ in range(3):
+        assert client.auth_test()["ok"]
+        # Long enough for the server to have hung up by the next call
+        time.sleep(0.05)
+
+    assert fake_slack.connections == 3  # noqa: PLR2004
+
+
+@pytest.mark.usefixtures("keep_alive")
+def test_keep_alive_client_doesnt_resend_what_slack_might_have_acted_on(fake_slack: FakeSlackAPI) -> None:
+    fake_slack.hang_up_on_call = 2
+    client = WebClient(token="xoxb-test", base_url=fake_slack.url, retry_handlers=[])  # noqa: S106
+
+    assert client.auth_test()["ok"]
+    with pytest.raises(http.client.RemoteDisconnected):
+        client.chat_postMessage(channel="#emoji-papertrail", text="New emoji!")
+
+    assert fake_slack.calls == 2, "The post shouldn't be sent again"  # noqa: PLR2004
+
+
+@pytest.mark.usefixtures("keep_alive")
+def test_keep_alive_client_retries_rate_limits(fake_slack: FakeSlackAPI) -> None:
+    fake_slack.rate_limited = 2
+    client = WebClient(
+        token="xoxb-test",  # noqa: S106
+        base_url=fake_slack.url,
+        retry_handlers=[RateLimitErrorRetryHandler(max_retry_count=2)],
+    )
+
+    assert client.auth_test()["ok"]
+    assert fake_slack.connections == 1
+
+
+def test_keep_alive_leaves_other_hosts_alone(fake_slack: FakeSlackAPI) -> None:
+    install_keep_alive("https://slack.example.com/api/", connection_pool=ConnectionPool())
+    try:
+        client = WebClient(token="xoxb-test", base_url=fake_slack.url)  # noqa: S106
+        for _ in range(2):
+            assert client.auth_test()["ok"]
+    finally:
+        urllib.request.install_opener(None)  # type: ignore[arg-type]
+
+    assert fake_slack.connections == 2  # noqa: PLR2004
+
+
+def test_pool_hands_out_one_client_per_token() -> None:
+    base = WebClient(base_url="https://slack.example.com/api/", retry_handlers=[RateLimitErrorRetryHandler()])
+    pool = WebClientPool(base, max_size=2)
+
+    a = pool.get("xoxb-a")
+    assert pool.get("xoxb-a") is a
+    assert a.base_url == base.base_url
+    assert a.retry_handlers is base.retry_handlers
+
+    pool.get("xoxb-b")
+    pool.get("xoxb-a")
+    pool.get("xoxb-c")
+    assert len(pool) == pool.max_size
+    assert pool.get("xoxb-a") is a, "The least recently used token should have been the one dropped"
+
+
+def test_pool_drops_idle_clients() -> None:
+    pool = WebClientPool(WebClient(), idle_timeout=timedelta(0))
+
+    a = pool.get("xoxb-a")
+    assert pool.get("xoxb-a") is not a
+    assert len(pool) == 1
+
+
+def test_async_pool_shares_one_session() -> None:
+    pool = AsyncWebClientPool(AsyncWebClient())
+
+    async def sessions() -> list[object]:
+        try:
+            return [pool.get(token).session for token in ("xoxb-a", "xoxb-b")]
+        finally:
+            await pool.close()
+
+    first = asyncio.run(sessions())
+    assert first[0] is not None
+    assert first[0] is first[1]
+    assert asyncio.run(sessions())[0] is not first[0], "Each event loop needs its own session"
@@ -0,0 +1,174 @@
+import json
+import logging
+
+import redis.asyncio
+from slack_sdk.oauth.installation_store.async_installation_store import AsyncInstallationStore
+from slack_sdk.oauth.installation_store.models.bot import Bot
+from slack_sdk.oauth.installation_store.models.installation import Installation
+
+from .installation_cache import InstallationCache
+from .redis_installation_store import RedisInstallationKeys
+
+
+class AsyncRedisInstallationStore(RedisInstallationKeys, AsyncInstallationStore):
+    """Same storage layout as RedisInstallationStore, but on redis.asyncio so lookups don't block the event loop."""
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        redis_client: redis.asyncio.Redis,
+        client_id: str,
+        key_prefix: str = "slack_installation_store",
+        historical_data_enabled: bool = True,
+        history_max_entries: int | None = None,
+        cache: InstallationCache | None = None,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.redis_client: redis.asyncio.Redis = redis_client
+        self.client_id: str = client_id
+        self.key_prefix: str = key_prefix
+        self.historical_data_enabled: bool = historical_data_enabled
+        # How many past installations to keep per workspace, None keeps them all
+        self.history_max_entries: int | None = history_max_entries
+        # Optional read-through cache for async_find_installation/async_find_bot, see installation_cache.py
+        self.cache: InstallationCache | None = cache
+        self._logger = logger
+
+    @property
+    def logger(self) -> logging.Logger:
+        if self._logger is None:
+            self._logger = logging.getLogger(__name__)
+        return self._logger
+
+    async def async_save(self, installation: Installation) -> None:
+        workspace_key = self._workspace_key(installation.enterprise_id, installation.team_id)
+        history_key = f"{workspace_key}:installation"
+        history_version = str(installation.installed_at)
+        installation_data = json.dumps(installation.__dict__)
+        written_keys = (f"{workspace_key}:bot-latest", f"{workspace_key}:installer-latest")
+
+        async def _save(pipe: redis.asyncio.client.Pipeline) -> None:
+            stale_versions = []
+            if self.historical_data_enabled and self.history_max_entries is not None:
+                # Still in immediate mode here, since we're WATCHing the history
+                stale_versions = self._stale_history_versions(await pipe.hkeys(history_key), history_version)
+
+            # Everything from here on goes out as a single MULTI/EXEC, so readers never see half an installation
+            pipe.multi()
+            self._save_bot(pipe, installation.to_bot())
+            pipe.set(f"{workspace_key}:installer-latest", installation_data)
+
+            if self.historical_data_enabled:
+                pipe.hset(history_key, history_version, installation_data)
+                if stale_versions:
+                    pipe.hdel(history_key, *stale_versions)
+
+            self._publish_invalidation(pipe, *written_keys)
+
+        if self.historical_data_enabled and self.history_max_entries is not None:
+            await self.redis_client.transaction(_save, history_key)
+        else:
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                await _save(pipe)
+                await pipe.execute()
+
+        self._invalidate(*written_keys)
+
+    async def async_save_bot(self, bot: Bot) -> None:
+        key = f"{self._workspace_key(bot.enterprise_id, bot.team_id)}:bot-latest"
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            self._save_bot(pipe, bot)
+            self._publish_invalidation(pipe, key)
+            await pipe.execute()
+
+        self._invalidate(key)
+
+    def _save_bot(self, pipe: redis.asyncio.client.Pipeline, bot: Bot) -> None:
+        workspace_key = self._workspace_key(bot.enterprise_id, bot.team_id)
+        bot_data = json.dumps(bot.__dict__)
+        pipe.set(f"{workspace_key}:bot-latest", bot_data)
+
+    async def async_find_bot(
+        self,
+        *,
+        enterprise_id: str | None,
+        team_id: str | None,
+        is_enterprise_install: bool | None = False,
+    ) -> Bot | None:
+        if is_enterprise_install:
+            team_id = None
+
+        workspace_key = self._workspace_key(enterprise_id, team_id)
+        return await self._async_find(f"{workspace_key}:bot-latest", Bot)
+
+    async def async_find_installation(
+        self,
+        *,
+        enterprise_id: str | None,
+        team_id: str | None,
+        user_id: str | None = None,  # noqa: ARG002
+        is_enterprise_install: bool | None = False,
+    ) -> Installation | None:
+        if is_enterprise_install:
+            team_id = None
+
+        workspace_key = self._workspace_key(enterprise_id, team_id)
+        return await self._async_find(f"{workspace_key}:installer-latest", Installation)
+
+    async def _async_find[T: (Installation, Bot)](self, key: str, model: type[T]) -> T | None:
+        generation = 0
+        if self.cache is not None:
+            await self.cache.async_listen(self.redis_client)
+            cached = self.cache.get(key)
+            if isinstance(cached, model):
+                return cached
+            generation = self.cache.generation
+
+        data = await self.redis_client.get(key)
+        if data is None:
+            return None
+        if not isinstance(data, bytes):
+            msg = "Unexpected data type"
+            raise TypeError(msg)
+
+        found = model(**json.loads(data))
+        if self.cache is not None:
+            self.cache.put(key, found, generation)
+        return found
+
+    async def async_delete_bot(
+        self,
+        *,
+        enterprise_id: str | None,
+        team_id: str | None,
+    ) -> None:
+        workspace_key = self._workspace_key(enterprise_id, team_id)
+        await self._async_delete(f"{workspace_key}:bot-latest")
+
+    async def async_delete_installation(
+        self,
+        *,
+        enterprise_id: str | None,
+        team_id: str | None,
+        user_id: str | None = None,  # noqa: ARG002
+    ) -> None:
+        workspace_key = self._workspace_key(enterprise_id, team_id)
+        await self._async_delete(f"{workspace_key}:installer-latest")
+
+    async def async_delete_all(
+        self,
+        *,
+        enterprise_id: str | None,
+        team_id: str | None,
+    ) -> None:
+        workspace_key = self._workspace_key(enterprise_id, team_id)
+        # One DEL for both keys, so it's a single round trip and atomic
+        await self._async_delete(f"{workspace_key}:bot-latest", f"{workspace_key}:installer-latest")
+
+    async def _async_delete(self, *keys: str) -> None:
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(*keys)
+            self._publish_invalidation(pipe, *keys)
+            await pipe.execute()
+
+        self._invalidate(*keys)
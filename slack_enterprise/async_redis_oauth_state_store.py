@@ -0,0 +1,37 @@
+import logging
+from uuid import uuid4
+
+import redis.asyncio
+from slack_sdk.oauth.state_store.async_state_store import AsyncOAuthStateStore
+
+
+class AsyncRedisOAuthStateStore(AsyncOAuthStateStore):
+    def __init__(
+        self,
+        redis_client: redis.asyncio.Redis,
+        expiration_seconds: int,
+        key_prefix: str = "slack_oauth_state_store",
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.redis_client = redis_client
+        self.expiration_seconds = expiration_seconds
+        self.key_prefix = key_prefix
+        self._logger = logger
+
+    @property
+    def logger(self) -> logging.Logger:
+        if self._logger is None:
+            self._logger = logging.getLogger(__name__)
+        return self._logger
+
+    async def async_issue(self, *_args: ..., **_kwargs: ...) -> str:
+        state: str = str(uuid4())
+        await self.redis_client.set(self._state_key(state), "1", ex=self.expiration_seconds)
+        return state
+
+    async def async_consume(self, state: str) -> bool:
+        consumed = await self.redis_client.delete(self._state_key(state))
+        return consumed == 1
+
+    def _state_key(self, state: str) -> str:
+        return f"{self.key_prefix}:{state}"
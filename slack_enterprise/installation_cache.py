@@ -0,0 +1,133 @@
+"""In-process TTL/LRU cache in front of the Redis installation stores.
+
+Bolt looks up the installation (and bot) on every event it authorizes, which without this is a Redis GET, a
+`json.loads`, and building the model each time. Stores invalidate their own cache on every write and delete, and
+publish the keys they touched on `channel` so every other worker and instance drops them too. Anything missed while
+the subscription was down is bounded by `ttl`, and the whole cache is dropped when the subscription errors.
+"""
+
+import asyncio
+from collections import OrderedDict
+import copy
+from datetime import timedelta
+import logging
+import threading
+import time
+
+import redis
+import redis.asyncio
+from slack_sdk.oauth.installation_store.models.bot import Bot
+from slack_sdk.oauth.installation_store.models.installation import Installation
+
+INVALIDATION_CHANNEL = "slack_installation_store:invalidate"
+
+
+class InstallationCache:
+    def __init__(
+        self,
+        *,
+        ttl: timedelta = timedelta(minutes=5),
+        max_entries: int = 10_000,
+        channel: str = INVALIDATION_CHANNEL,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.channel = channel
+        self._logger = logger
+
+        # key -> (value, expires_at), in least to most recently used order
+        self._entries: OrderedDict[str, tuple[Installation | Bot, float]] = OrderedDict()
+        # Bumped on every invalidation, so a lookup racing a write can't cache what it read from before the write
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self._listener: redis.client.PubSubWorkerThread | None = None
+        self._async_listener: asyncio.Task[None] | None = None
+
+    @property
+    def logger(self) -> logging.Logger:
+        if self._logger is None:
+            self._logger = logging.getLogger(__name__)
+        return self._logger
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Installation | Bot | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            # Bolt clears fields on the installation it's handed, so every caller gets its own copy
+            return copy.copy(value)
+
+    def put(self, key: str, value: Installation | Bot, generation: int) -> None:
+        """Cache `value`, unless anything was invalidated since `generation` was read."""
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            self._entries[key] = (value, time.time() + self.ttl.total_seconds())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys: str) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def _on_message(self, message: dict) -> None:
+        data = message["data"]
+        self.invalidate(data.decode() if isinstance(data, bytes) else data)
+
+    def _on_error(self, e: BaseException, *_args: object) -> None:
+        # We've probably missed invalidations while disconnected, so start over
+        self.logger.warning("Lost installation cache invalidations, clearing the cache: %s", e)
+        self.clear()
+
+    def listen(self, redis_client: redis.Redis) -> None:
+        """Start a background thread applying invalidations from other processes, if one isn't already running."""
+        with self._lock:
+            if self._listener is not None:
+                return
+
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._on_message})
+            self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=self._on_error)
+
+    async def async_listen(self, redis_client: redis.asyncio.Redis) -> None:
+        """Same as listen, but as a task on the running event loop."""
+        if self._async_listener is None or self._async_listener.done():
+            self._async_listener = asyncio.create_task(self._async_run(redis_client))
+
+    async def _async_run(self, redis_client: redis.asyncio.Redis) -> None:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(**{self.channel: self._on_message})
+        await pubsub.run(exception_handler=self._on_error)
+
+    def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        if self._async_listener is not None:
+            self._async_listener.cancel()
+            self._async_listener = None
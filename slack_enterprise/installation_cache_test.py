@@ -0,0 +1,157 @@
+import asyncio
+from datetime import timedelta
+import json
+import time
+
+import fakeredis
+from slack_sdk.oauth.installation_store.models.installation import Installation
+import time_machine
+
+from .async_redis_installation_store import AsyncRedisInstallationStore
+from .installation_cache import InstallationCache
+from .redis_installation_store import RedisInstallationStore
+
+
+def installation(bot_token: str = "xoxb-123") -> Installation:  # noqa: S107
+    return Installation(
+        app_id="A123",
+        enterprise_id="E123",
+        team_id="T123",
+        user_id="U123",
+        installed_at=123456789.0,
+        bot_token=bot_token,
+        bot_id="B123",
+        bot_user_id="U456",
+    )
+
+
+def cached_store(server: fakeredis.FakeServer) -> RedisInstallationStore:
+    return RedisInstallationStore(
+        redis_client=fakeredis.FakeRedis(server=server),
+        client_id="test-client-id",
+        cache=InstallationCache(),
+    )
+
+
+def overwrite_behind_the_cache(store: RedisInstallationStore, bot_token: str) -> None:
+    data = json.dumps(installation(bot_token).__dict__)
+    store.redis_client.set(f"{store._workspace_key('E123', 'T123')}:installer-latest", data)  # noqa: SLF001
+
+
+def test_find_installation_is_served_from_cache() -> None:
+    store = cached_store(fakeredis.FakeServer())
+    store.save(installation())
+    assert store.find_installation(enterprise_id="E123", team_id="T123") is not None
+
+    overwrite_behind_the_cache(store, "xoxb-changed")
+    found = store.find_installation(enterprise_id="E123", team_id="T123")
+
+    assert found is not None
+    assert found.bot_token == "xoxb-123"  # noqa: S105
+
+
+def test_writes_invalidate_the_cache() -> None:
+    store = cached_store(fakeredis.FakeServer())
+    store.save(installation())
+    store.find_installation(enterprise_id="E123", team_id="T123")
+    store.find_bot(enterprise_id="E123", team_id="T123")
+
+    store.save(installation("xoxb-456"))
+    found = store.find_bot(enterprise_id="E123", team_id="T123")
+    assert found is not None
+    assert found.bot_token == "xoxb-456"  # noqa: S105
+
+    store.delete_all(enterprise_id="E123", team_id="T123")
+    assert store.find_installation(enterprise_id="E123", team_id="T123") is None
+    assert store.find_bot(enterprise_id="E123", team_id="T123") is None
+
+
+def test_writes_invalidate_other_processes_caches() -> None:
+    server = fakeredis.FakeServer()
+    writer, reader = cached_store(server), cached_store(server)
+    writer.save(installation())
+    reader.find_installation(enterprise_id="E123", team_id="T123")
+    assert reader.cache is not None
+
+    try:
+        writer.save(installation("xoxb-456"))
+
+        deadline = time.monotonic() + 5
+        while len(reader.cache) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        found = reader.find_installation(enterprise_id="E123", team_id="T123")
+        assert found is not None
+        assert found.bot_token == "xoxb-456"  # noqa: S105
+    finally:
+        reader.cache.stop()
+
+
+def test_cache_entries_expire() -> None:
+    cache = InstallationCache(ttl=timedelta(minutes=5))
+
+    with time_machine.travel(0, tick=False) as tm:
+        cache.put("key", installation(), cache.generation)
+        assert cache.get("key") is not None
+
+        tm.shift(timedelta(minutes=5))
+        assert cache.get("key") is None
+
+
+def test_cache_evicts_least_recently_used() -> None:
+    cache = InstallationCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, installation(), cache.generation)
+    cache.get("a")
+    cache.put("c", installation(), cache.generation)
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_lookups_racing_a_write_are_not_cached() -> None:
+    cache = InstallationCache()
+    generation = cache.generation
+    cache.invalidate("key")
+    cache.put("key", installation(), generation)
+
+    assert cache.get("key") is None
+
+
+def test_async_store_uses_cache() -> None:
+    server = fakeredis.FakeServer()
+    store = AsyncRedisInstallationStore(
+        redis_client=fakeredis.FakeAsyncRedis(server=server),
+        client_id="test-client-id",
+        cache=InstallationCache(),
+    )
+
+    async def run() -> tuple[str | None, str | None]:
+        await store.async_save(installation())
+        await store.async_find_installation(enterprise_id="E123", team_id="T123")
+        data = json.dumps(installation("xoxb-changed").__dict__)
+        await store.redis_client.set(f"{store._workspace_key('E123', 'T123')}:installer-latest", data)  # noqa: SLF001
+        cached = await store.async_find_installation(enterprise_id="E123", team_id="T123")
+
+        await store.async_save(installation("xoxb-456"))
+        saved = await store.async_find_installation(enterprise_id="E123", team_id="T123")
+
+        assert store.cache is not None
+        store.cache.stop()
+        return cached and cached.bot_token, saved and saved.bot_token
+
+    assert asyncio.run(run()) == ("xoxb-123", "xoxb-456")
+
+
+def test_cached_installations_are_not_shared() -> None:
+    cache = InstallationCache()
+    cache.put("key", installation(), cache.generation)
+
+    found = cache.get("key")
+    assert isinstance(found, Installation)
+    found.bot_token = None
+
+    again = cache.get("key")
+    assert isinstance(again, Installation)
+    assert again.bot_token == "xoxb-123"  # noqa: S105
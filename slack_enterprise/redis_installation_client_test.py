@@ -1,5 +1,8 @@
+import asyncio
+from collections.abc import Coroutine
 import datetime
 import string
+from typing import Any, TypeVar
 
 import fakeredis
 from hypothesis import (
@@ -16,8 +19,12 @@ from hypothesis.stateful import (
 from slack_sdk.oauth.installation_store.models.bot import Bot
 from slack_sdk.oauth.installation_store.models.installation import Installation
 
+from .async_redis_installation_store import AsyncRedisInstallationStore
+from .async_redis_oauth_state_store import AsyncRedisOAuthStateStore
 from .redis_installation_store import RedisInstallationStore
 
+T = TypeVar("T")
+
 
 def redis_client() -> fakeredis.FakeRedis:
     return fakeredis.FakeRedis()
@@ -159,16 +166,57 @@ s_bot = st.builds(
 )
 
 
+class SyncAsyncInstallationStore:
+    """Drives an AsyncRedisInstallationStore on its own event loop, so the state machine can run against either store."""
+
+    def __init__(self, store: AsyncRedisInstallationStore) -> None:
+        self.store = store
+        self.loop = asyncio.new_event_loop()
+
+    def _run(self, coro: Coroutine[Any, Any, T]) -> T:
+        return self.loop.run_until_complete(coro)
+
+    def save(self, installation: Installation) -> None:
+        self._run(self.store.async_save(installation))
+
+    def save_bot(self, bot: Bot) -> None:
+        self._run(self.store.async_save_bot(bot))
+
+    def find_installation(self, **kwargs: Any) -> Installation | None:  # noqa: ANN401
+        return self._run(self.store.async_find_installation(**kwargs))
+
+    def find_bot(self, **kwargs: Any) -> Bot | None:  # noqa: ANN401
+        return self._run(self.store.async_find_bot(**kwargs))
+
+    def delete_installation(self, **kwargs: Any) -> None:  # noqa: ANN401
+        self._run(self.store.async_delete_installation(**kwargs))
+
+    def delete_bot(self, **kwargs: Any) -> None:  # noqa: ANN401
+        self._run(self.store.async_delete_bot(**kwargs))
+
+    def delete_all(self, **kwargs: Any) -> None:  # noqa: ANN401
+        self._run(self.store.async_delete_all(**kwargs))
+
+    def close(self) -> None:
+        self._run(self.store.redis_client.aclose())
+        self.loop.close()
+
+
 class InstallationStoreStateMachine(RuleBasedStateMachine):
     def __init__(self) -> None:
         super().__init__()
         self.redis_client = fakeredis.FakeRedis()
-        self.store = RedisInstallationStore(
+        self.store: RedisInstallationStore | SyncAsyncInstallationStore = RedisInstallationStore(
             redis_client=self.redis_client,
             client_id="test-client-id",
             historical_data_enabled=True,
         )
 
+        # What we expect the store to return for each (enterprise_id, team_id), since saves to the same workspace
+        # replace each other and saving an installation replaces its bot too
+        self.installations: dict[tuple[str | None, str | None], Installation] = {}
+        self.bots: dict[tuple[str | None, str | None], Bot] = {}
+
     installations_bundle = Bundle("installations")
     bots_bundle = Bundle("bots")
 
@@ -182,6 +230,8 @@ class InstallationStoreStateMachine(RuleBasedStateMachine):
     )
     def save_installation(self, installation: Installation) -> Installation:
         self.store.save(installation)
+        self.installations[installation.enterprise_id, installation.team_id] = installation
+        self.bots[installation.enterprise_id, installation.team_id] = installation.to_bot()
         return installation
 
     @rule(
@@ -190,33 +240,65 @@ class InstallationStoreStateMachine(RuleBasedStateMachine):
     )
     def save_bot(self, bot: Bot) -> Bot:
         self.store.save_bot(bot)
+        self.bots[bot.enterprise_id, bot.team_id] = bot
         return bot
 
     @rule(install=installations_bundle)
     def check_installation(self, install: Installation) -> None:
         retrieved = self.store.find_installation(enterprise_id=install.enterprise_id, team_id=install.team_id)
-        assert retrieved is not None
-        assert retrieved.to_dict() == install.to_dict()
+        expected = self.installations.get((install.enterprise_id, install.team_id))
+
+        if expected is None:
+            assert retrieved is None
+        else:
+            assert retrieved is not None
+            assert retrieved.to_dict() == expected.to_dict()
 
     @rule(bot=bots_bundle)
     def check_bot(self, bot: Bot) -> None:
         retrieved = self.store.find_bot(enterprise_id=bot.enterprise_id, team_id=bot.team_id)
+        expected = self.bots.get((bot.enterprise_id, bot.team_id))
 
-        assert retrieved is not None
-        assert retrieved.to_dict() == bot.to_dict()
+        if expected is None:
+            assert retrieved is None
+        else:
+            assert retrieved is not None
+            assert retrieved.to_dict() == expected.to_dict()
 
     @rule(install=consumes(installations_bundle))
     def delete_installation(self, install: Installation) -> None:
         self.store.delete_installation(enterprise_id=install.enterprise_id, team_id=install.team_id)
+        self.installations.pop((install.enterprise_id, install.team_id), None)
 
     @rule(bot=consumes(bots_bundle))
     def delete_bot(self, bot: Bot) -> None:
         self.store.delete_bot(enterprise_id=bot.enterprise_id, team_id=bot.team_id)
+        self.bots.pop((bot.enterprise_id, bot.team_id), None)
 
 
 TestInstallationStoreStateMachine = InstallationStoreStateMachine.TestCase
 
 
+class AsyncInstallationStoreStateMachine(InstallationStoreStateMachine):
+    def __init__(self) -> None:
+        super().__init__()
+        server = fakeredis.FakeServer()
+        self.redis_client = fakeredis.FakeRedis(server=server)
+        self.store = SyncAsyncInstallationStore(
+            AsyncRedisInstallationStore(
+                redis_client=fakeredis.FakeAsyncRedis(server=server),
+                client_id="test-client-id",
+                historical_data_enabled=True,
+            ),
+        )
+
+    def teardown(self) -> None:
+        self.store.close()
+
+
+TestAsyncInstallationStoreStateMachine = AsyncInstallationStoreStateMachine.TestCase
+
+
 @given(installations=st.lists(s_installation, min_size=1, max_size=10))
 def test_installation_returns_latest(installations: list[Installation]) -> None:
     """Test that when multiple installations are saved, the latest one is returned."""
@@ -238,3 +320,96 @@ def test_installation_returns_latest(installations: list[Installation]) -> None:
     assert retrieved is not None
     assert retrieved.installed_at == last_installation.installed_at
     assert retrieved.to_dict() == last_installation.to_dict()
+
+
+def test_save_trims_installation_history() -> None:
+    client = redis_client()
+    store = RedisInstallationStore(
+        redis_client=client,
+        client_id="test-client-id",
+        history_max_entries=3,
+    )
+
+    for installed_at in (5.0, 1.0, 4.0, 2.0, 3.0):
+        store.save(
+            Installation(
+                app_id="A123",
+                enterprise_id="E123",
+                team_id="T123",
+                user_id="U123",
+                installed_at=installed_at,
+                bot_token="xoxb-123",  # noqa: S106
+                bot_id="B123",
+                bot_user_id="U456",
+            ),
+        )
+
+    history = client.hkeys(f"{store._workspace_key('E123', 'T123')}:installation")  # noqa: SLF001
+    assert sorted(float(v) for v in history) == [3.0, 4.0, 5.0]
+
+
+def test_delete_all() -> None:
+    store = installation_store(redis_client())
+    installation = Installation(
+        app_id="A123",
+        enterprise_id="E123",
+        team_id="T123",
+        user_id="U123",
+        installed_at=123456789.0,
+        bot_token="xoxb-123",  # noqa: S106
+        bot_id="B123",
+        bot_user_id="U456",
+    )
+
+    store.save(installation)
+    store.delete_all(enterprise_id="E123", team_id="T123")
+
+    assert store.find_installation(enterprise_id="E123", team_id="T123") is None
+    assert store.find_bot(enterprise_id="E123", team_id="T123") is None
+
+
+def test_async_save_trims_installation_history() -> None:
+    server = fakeredis.FakeServer()
+    store = AsyncRedisInstallationStore(
+        redis_client=fakeredis.FakeAsyncRedis(server=server),
+        client_id="test-client-id",
+        history_max_entries=3,
+    )
+
+    async def save_all() -> None:
+        for installed_at in (5.0, 1.0, 4.0, 2.0, 3.0):
+            await store.async_save(
+                Installation(
+                    app_id="A123",
+                    enterprise_id="E123",
+                    team_id="T123",
+                    user_id="U123",
+                    installed_at=installed_at,
+                    bot_token="xoxb-123",  # noqa: S106
+                    bot_id="B123",
+                    bot_user_id="U456",
+                ),
+            )
+
+    asyncio.run(save_all())
+
+    history = fakeredis.FakeRedis(server=server).hkeys(f"{store._workspace_key('E123', 'T123')}:installation")  # noqa: SLF001
+    assert sorted(float(v) for v in history) == [3.0, 4.0, 5.0]
+
+
+def test_async_oauth_state_is_consumed_once() -> None:
+    store = AsyncRedisOAuthStateStore(redis_client=fakeredis.FakeAsyncRedis(), expiration_seconds=600)
+
+    async def issue_and_consume() -> list[bool]:
+        state = await store.async_issue()
+        return [await store.async_consume(state), await store.async_consume(state)]
+
+    assert asyncio.run(issue_and_consume()) == [True, False]
+
+
+def test_installations_lists_every_workspace() -> None:
+    store = installation_store(redis_client())
+    for team_id in ("T1", "T2"):
+        store.save(Installation(app_id="A123", team_id=team_id, user_id="U123", bot_token=f"xoxb-{team_id}"))
+
+    assert sorted(i.team_id for i in store.installations()) == ["T1", "T2"]  # type: ignore[type-var]
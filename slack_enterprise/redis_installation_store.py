@@ -1,29 +1,70 @@
+from collections.abc import Iterable, Iterator
 import json
 import logging
 
 import redis
-from slack_sdk.oauth.installation_store.async_installation_store import (
-    AsyncInstallationStore,
-)
+import redis.asyncio
 from slack_sdk.oauth.installation_store.installation_store import InstallationStore
 from slack_sdk.oauth.installation_store.models.bot import Bot
 from slack_sdk.oauth.installation_store.models.installation import Installation
 
+from .installation_cache import InstallationCache
 
-class RedisInstallationStore(InstallationStore, AsyncInstallationStore):
-    def __init__(
+
+class RedisInstallationKeys:
+    """Key layout shared by the sync and async Redis installation stores."""
+
+    client_id: str
+    key_prefix: str
+    history_max_entries: int | None
+    cache: InstallationCache | None
+
+    def _workspace_key(self, enterprise_id: str | None, team_id: str | None) -> str:
+        none = "none"
+        e_id = enterprise_id or none
+        t_id = team_id or none
+        return f"{self.key_prefix}:{self.client_id}:{e_id}-{t_id}"
+
+    def _stale_history_versions(self, versions: Iterable[bytes], new_version: str) -> list[str]:
+        if self.history_max_entries is None:
+            return []
+
+        all_versions = {v.decode() for v in versions} | {new_version}
+        return sorted(all_versions, key=float)[: max(len(all_versions) - self.history_max_entries, 0)]
+
+    def _publish_invalidation(self, pipe: redis.client.Pipeline | redis.asyncio.client.Pipeline, *keys: str) -> None:
+        """Queue telling every other process's cache to drop `keys` as part of the write."""
+        if self.cache is None:
+            return
+
+        for key in keys:
+            pipe.publish(self.cache.channel, key)
+
+    def _invalidate(self, *keys: str) -> None:
+        if self.cache is not None:
+            self.cache.invalidate(*keys)
+
+
+class RedisInstallationStore(RedisInstallationKeys, InstallationStore):
+    def __init__(  # noqa: PLR0913
         self,
         *,
         redis_client: redis.Redis,
         client_id: str,
         key_prefix: str = "slack_installation_store",
         historical_data_enabled: bool = True,
+        history_max_entries: int | None = None,
+        cache: InstallationCache | None = None,
         logger: logging.Logger | None = None,
     ) -> None:
         self.redis_client: redis.Redis = redis_client
         self.client_id: str = client_id
         self.key_prefix: str = key_prefix
         self.historical_data_enabled: bool = historical_data_enabled
+        # How many past installations to keep per workspace, None keeps them all
+        self.history_max_entries: int | None = history_max_entries
+        # Optional read-through cache for find_installation/find_bot, see installation_cache.py
+        self.cache: InstallationCache | None = cache
         self._logger = logger
 
     @property
@@ -32,30 +73,53 @@ class RedisInstallationStore(InstallationStore, AsyncInstallationStore):
             self._logger = logging.getLogger(__name__)
         return self._logger
 
-    async def async_save(self, installation: Installation) -> None:
-        self.save(installation)
-
-    async def async_save_bot(self, bot: Bot) -> None:
-        self.save_bot(bot)
-
     def save(self, installation: Installation) -> None:
         workspace_key = self._workspace_key(installation.enterprise_id, installation.team_id)
-        self.save_bot(installation.to_bot())
+        history_key = f"{workspace_key}:installation"
+        history_version = str(installation.installed_at)
         installation_data = json.dumps(installation.__dict__)
-        self.redis_client.set(f"{workspace_key}:installer-latest", installation_data)
+        written_keys = (f"{workspace_key}:bot-latest", f"{workspace_key}:installer-latest")
+
+        def _save(pipe: redis.client.Pipeline) -> None:
+            stale_versions = []
+            if self.historical_data_enabled and self.history_max_entries is not None:
+                # Still in immediate mode here, since we're WATCHing the history
+                stale_versions = self._stale_history_versions(pipe.hkeys(history_key), history_version)
+
+            # Everything from here on goes out as a single MULTI/EXEC, so readers never see half an installation
+            pipe.multi()
+            self._save_bot(pipe, installation.to_bot())
+            pipe.set(f"{workspace_key}:installer-latest", installation_data)
 
-        if self.historical_data_enabled:
-            history_version = str(installation.installed_at)
-            self.redis_client.hset(
-                f"{workspace_key}:installation",
-                history_version,
-                installation_data,
-            )
+            if self.historical_data_enabled:
+                pipe.hset(history_key, history_version, installation_data)
+                if stale_versions:
+                    pipe.hdel(history_key, *stale_versions)
+
+            self._publish_invalidation(pipe, *written_keys)
+
+        if self.historical_data_enabled and self.history_max_entries is not None:
+            self.redis_client.transaction(_save, history_key)
+        else:
+            with self.redis_client.pipeline(transaction=True) as pipe:
+                _save(pipe)
+                pipe.execute()
+
+        self._invalidate(*written_keys)
 
     def save_bot(self, bot: Bot) -> None:
+        key = f"{self._workspace_key(bot.enterprise_id, bot.team_id)}:bot-latest"
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            self._save_bot(pipe, bot)
+            self._publish_invalidation(pipe, key)
+            pipe.execute()
+
+        self._invalidate(key)
+
+    def _save_bot(self, pipe: redis.client.Pipeline, bot: Bot) -> None:
         workspace_key = self._workspace_key(bot.enterprise_id, bot.team_id)
         bot_data = json.dumps(bot.__dict__)
-        self.redis_client.set(f"{workspace_key}:bot-latest", bot_data)
+        pipe.set(f"{workspace_key}:bot-latest", bot_data)
 
     def find_bot(
         self,
@@ -68,14 +132,7 @@ class RedisInstallationStore(InstallationStore, AsyncInstallationStore):
             team_id = None
 
         workspace_key = self._workspace_key(enterprise_id, team_id)
-        data = self.redis_client.get(f"{workspace_key}:bot-latest")
-        if data is None:
-            return None
-        if not isinstance(data, bytes):
-            msg = "Unexpected data type"
-            raise TypeError(msg)
-
-        return Bot(**json.loads(data))
+        return self._find(f"{workspace_key}:bot-latest", Bot)
 
     def find_installation(
         self,
@@ -89,14 +146,35 @@ class RedisInstallationStore(InstallationStore, AsyncInstallationStore):
             team_id = None
 
         workspace_key = self._workspace_key(enterprise_id, team_id)
-        data = self.redis_client.get(f"{workspace_key}:installer-latest")
+        return self._find(f"{workspace_key}:installer-latest", Installation)
+
+    def installations(self) -> Iterator[Installation]:
+        """The latest installation for every workspace, for jobs that run outside of any one event."""
+        for key in self.redis_client.scan_iter(match=f"{self.key_prefix}:{self.client_id}:*:installer-latest"):
+            data = self.redis_client.get(key)
+            if isinstance(data, bytes):
+                yield Installation(**json.loads(data))
+
+    def _find[T: (Installation, Bot)](self, key: str, model: type[T]) -> T | None:
+        generation = 0
+        if self.cache is not None:
+            self.cache.listen(self.redis_client)
+            cached = self.cache.get(key)
+            if isinstance(cached, model):
+                return cached
+            generation = self.cache.generation
+
+        data = self.redis_client.get(key)
         if data is None:
             return None
         if not isinstance(data, bytes):
             msg = "Unexpected data type"
             raise TypeError(msg)
 
-        return Installation(**json.loads(data))
+        found = model(**json.loads(data))
+        if self.cache is not None:
+            self.cache.put(key, found, generation)
+        return found
 
     def delete_bot(
         self,
@@ -105,7 +183,7 @@ class RedisInstallationStore(InstallationStore, AsyncInstallationStore):
         team_id: str | None,
     ) -> None:
         workspace_key = self._workspace_key(enterprise_id, team_id)
-        self.redis_client.delete(f"{workspace_key}:bot-latest")
+        self._delete(f"{workspace_key}:bot-latest")
 
     def delete_installation(
         self,
@@ -115,7 +193,7 @@ class RedisInstallationStore(InstallationStore, AsyncInstallationStore):
         user_id: str | None = None,  # noqa: ARG002
     ) -> None:
         workspace_key = self._workspace_key(enterprise_id, team_id)
-        self.redis_client.delete(f"{workspace_key}:installer-latest")
+        self._delete(f"{workspace_key}:installer-latest")
 
     def delete_all(
         self,
@@ -123,11 +201,14 @@ class RedisInstallationStore(InstallationStore, AsyncInstallationStore):
         enterprise_id: str | None,
         team_id: str | None,
     ) -> None:
-        self.delete_bot(enterprise_id=enterprise_id, team_id=team_id)
-        self.delete_installation(enterprise_id=enterprise_id, team_id=team_id)
+        workspace_key = self._workspace_key(enterprise_id, team_id)
+        # One DEL for both keys, so it's a single round trip and atomic
+        self._delete(f"{workspace_key}:bot-latest", f"{workspace_key}:installer-latest")
 
-    def _workspace_key(self, enterprise_id: str | None, team_id: str | None) -> str:
-        none = "none"
-        e_id = enterprise_id or none
-        t_id = team_id or none
-        return f"{self.key_prefix}:{self.client_id}:{e_id}-{t_id}"
+    def _delete(self, *keys: str) -> None:
+        with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(*keys)
+            self._publish_invalidation(pipe, *keys)
+            pipe.execute()
+
+        self._invalidate(*keys)
@@ -0,0 +1,167 @@
+"""Takes events from Slack over Socket Mode, a websocket we open to Slack, rather than as requests to main.py's webhook.
+
+SLACK_APP_TOKEN=xapp-... python socket_mode.py [--metrics-port 9090]
+
+Events go through the same Bolt app and listeners as the webhook, just without the per-request TLS handshake and
+signature check, and with nothing needing to be reachable from the internet. It needs Socket Mode turned on for the
+Slack app, and an app-level token with connections:write. Envelopes are handled SLACK_APP_SOCKET_MODE_CONCURRENCY at a
+time. Whenever the connection drops (or Slack asks us to move to a new one), we reconnect, backing off between failed
+attempts for up to SLACK_APP_SOCKET_MODE_RECONNECT_MAX_DELAY.
+
+This always runs the sync Bolt app, whatever SLACK_APP_ASYNC_MODE says. Queue mode, catching up and warming up work the
+same as in the web process.
+"""
+
+import argparse
+import os
+import random
+import signal
+import threading
+import time
+from typing import Any
+
+from prometheus_client import start_http_server
+from slack_bolt.adapter.socket_mode.internals import run_bolt_app, send_response
+from slack_sdk import WebClient
+from slack_sdk.socket_mode.builtin import SocketModeClient
+from slack_sdk.socket_mode.client import BaseSocketModeClient
+from slack_sdk.socket_mode.request import SocketModeRequest
+import structlog
+
+from config import app_config
+from logging_config import configure_logging
+from metrics import SOCKET_MODE_CONNECTS, STAGE_SECONDS, serving_registry
+from slack_app import get_slack_app, warm_up
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+
+class Backoff:
+    """Exponential backoff with full jitter: a random delay of up to `initial`, then up to twice that, and so on, but never
+    more than `maximum`.
+    """
+
+    def __init__(self, initial: float = 1.0, maximum: float = 60.0) -> None:
+        self.initial = initial
+        self.maximum = maximum
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        limit = min(self.maximum, self.initial * 2**self.attempts)
+        self.attempts += 1
+        return random.uniform(0, limit)  # noqa: S311
+
+    def reset(self) -> None:
+        self.attempts = 0
+
+
+class ReconnectingSocketModeClient(SocketModeClient):
+    """SocketModeClient, retrying with backoff until it's connected again.
+
+    The SDK's client reconnects as soon as the connection closes, but if that fails it only tries again at its next ping,
+    forever, and a failed handshake only gets logged.
+    """
+
+    def __init__(self, *args: Any, backoff: Backoff, **kwargs: Any) -> None:  # noqa: ANN401
+        self.backoff = backoff
+        self._reconnecting = threading.Lock()
+        self._closing = threading.Event()
+        super().__init__(*args, **kwargs)
+
+    def connect_to_new_endpoint(self, force: bool = False) -> None:  # noqa: FBT001, FBT002
+        # Both the dropped connection and the client's monitor ask for this, and one of them's enough
+        if not self._reconnecting.acquire(blocking=False):
+            return
+
+        try:
+            while not self._closing.is_set():
+                error = None
+                try:
+                    super().connect_to_new_endpoint(force=force)
+                except Exception as e:  # noqa: BLE001
+                    error = e
+
+                if error is None and self.is_connected():
+                    SOCKET_MODE_CONNECTS.labels("ok").inc()
+                    self.backoff.reset()
+                    return
+
+                SOCKET_MODE_CONNECTS.labels("error").inc()
+                delay = self.backoff.next_delay()
+                logger.warning("Failed to connect to Slack, retrying", retry_in=round(delay, 3), exc_info=error)
+                self._closing.wait(delay)
+        finally:
+            self._reconnecting.release()
+
+    def close(self) -> None:
+        self._closing.set()
+        super().close()
+
+
+def dispatch(client: BaseSocketModeClient, req: SocketModeRequest) -> None:
+    """Hand an envelope to Bolt, and ack it with whatever Bolt answers (Slack redelivers it if we don't)."""
+    start = time.time()
+    with STAGE_SECONDS.labels("dispatch").time():
+        response = run_bolt_app(get_slack_app(), req)
+    send_response(client, req, response, start)
+
+
+def connect(app_token: str, *, backoff: Backoff | None = None) -> ReconnectingSocketModeClient:
+    """Connect to Slack, and keep connected until closed, handing every envelope to Bolt."""
+    # Built now, so a bad bot token fails before we take any events
+    get_slack_app()
+
+    client = ReconnectingSocketModeClient(
+        app_token=app_token,
+        web_client=WebClient(base_url=app_config.slack_api_url),
+        concurrency=app_config.socket_mode_concurrency,
+        ping_interval=app_config.socket_mode_ping_interval.total_seconds(),
+        backoff=backoff or Backoff(maximum=app_config.socket_mode_reconnect_max_delay.total_seconds()),
+    )
+    client.socket_mode_request_listeners.append(dispatch)
+    client.connect_to_new_endpoint()
+    return client
+
+
+def run(app_token: str, stop: threading.Event) -> None:
+    """Take events over Socket Mode, along with everything the web process runs alongside them, until `stop` is set."""
+    if app_config.queue_mode and app_config.queue_in_process_consumer:
+        from worker import start_consumers
+
+        start_consumers(stop)
+
+    if app_config.catch_up_on_startup:
+        from backfill import start_catch_up
+
+        start_catch_up(stop)
+
+    if app_config.warm_up_on_startup:
+        try:
+            warm_up()
+        except Exception:
+            # The first event will try again
+            logger.exception("Failed to warm up")
+
+    client = connect(app_token)
+    try:
+        stop.wait()
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve /metrics on this port")
+    args = parser.parse_args()
+
+    configure_logging()
+
+    if args.metrics_port is not None:
+        # The same as main.py's /metrics, so it aggregates across processes under PROMETHEUS_MULTIPROC_DIR too
+        start_http_server(args.metrics_port, registry=serving_registry())
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    run(os.environ["SLACK_APP_TOKEN"], stop)
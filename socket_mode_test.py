@@ -0,0 +1,202 @@
+import asyncio
+from collections.abc import Callable, Iterator
+import contextlib
+from datetime import timedelta
+import json
+import threading
+import time
+from typing import Any
+import uuid
+
+from aiohttp import WSMsgType, web
+import pytest
+from slack_bolt import App
+from slack_sdk import WebClient
+
+from config import app_config
+import socket_mode
+from socket_mode import Backoff, connect
+
+
+class FakeSocketMode:
+    """Slack's side of Socket Mode: apps.connections.open hands out a websocket, which says hello and then sends whatever
+    envelopes we're given, collecting the acks that come back.
+    """
+
+    def __init__(self, *, open_failures: int = 0) -> None:
+        # How many apps.connections.open calls fail before any work
+        self.open_failures = open_failures
+        self.opened = 0
+        self.acked: set[str] = set()
+        self._changed = threading.Condition()
+        self._socket: web.WebSocketResponse | None = None
+        self._sockets: set[web.WebSocketResponse] = set()
+        self._loop = asyncio.new_event_loop()
+        self._port = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._port}/api/"
+
+    @contextlib.contextmanager
+    def running(self) -> Iterator["FakeSocketMode"]:
+        thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        thread.start()
+        runner = asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        try:
+            yield self
+        finally:
+            asyncio.run_coroutine_threadsafe(self._stop(runner), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            thread.join()
+
+    def send_event(self, event: dict[str, Any]) -> str:
+        envelope_id = str(uuid.uuid4())
+        self._send(
+            {
+                "envelope_id": envelope_id,
+                "type": "events_api",
+                "accepts_response_payload": False,
+                "payload": {
+                    "type": "event_callback",
+                    "team_id": "T0TEST",
+                    "api_app_id": "A0TEST",
+                    "event_id": f"Ev{envelope_id}",
+                    "event": event,
+                },
+            },
+        )
+        return envelope_id
+
+    def ask_to_reconnect(self) -> None:
+        self._send({"type": "disconnect", "reason": "refresh_requested"})
+
+    def drop(self) -> None:
+        socket = self._socket
+        assert socket is not None
+        asyncio.run_coroutine_threadsafe(socket.close(), self._loop).result()
+
+    def wait_for(self, condition: Callable[[], bool], timeout: float = 10) -> None:
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            # Polling too, since the client's side changes without telling us
+            while not condition():
+                assert time.monotonic() < deadline
+                self._changed.wait(0.01)
+
+    def _send(self, message: dict[str, Any]) -> None:
+        self.wait_for(lambda: self._socket is not None and not self._socket.closed)
+        asyncio.run_coroutine_threadsafe(self._socket.send_str(json.dumps(message)), self._loop).result()  # type: ignore[union-attr]
+
+    async def _start(self) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_route("*", "/api/{method}", self._api)
+        app.router.add_get("/link", self._link)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        self._port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]  # noqa: SLF001
+        return runner
+
+    async def _stop(self, runner: web.AppRunner) -> None:
+        # Anything the client left open would otherwise hold up the shutdown
+        for socket in list(self._sockets):
+            await socket.close()
+        await runner.cleanup()
+
+    async def _api(self, request: web.Request) -> web.Response:
+        match request.match_info["method"]:
+            case "apps.connections.open":
+                if self.open_failures:
+                    self.open_failures -= 1
+                    return web.json_response({"ok": False, "error": "internal_error"})
+                return web.json_response({"ok": True, "url": f"ws://127.0.0.1:{self._port}/link"})
+            case "auth.test":
+                return web.json_response({"ok": True, "team_id": "T0TEST", "user_id": "U0TEST", "bot_id": "B0TEST"})
+            case _:
+                return web.json_response({"ok": False, "error": "unknown_method"})
+
+    async def _link(self, request: web.Request) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        with self._changed:
+            self.opened += 1
+            self._socket = socket
+            self._sockets.add(socket)
+            self._changed.notify_all()
+        await socket.send_str(json.dumps({"type": "hello", "num_connections": 1}))
+
+        async for message in socket:
+            if message.type == WSMsgType.TEXT and (envelope_id := json.loads(message.data).get("envelope_id")):
+                with self._changed:
+                    self.acked.add(envelope_id)
+                    self._changed.notify_all()
+
+        self._sockets.discard(socket)
+        return socket
+
+
+@pytest.fixture
+def fake(monkeypatch: pytest.MonkeyPatch) -> Iterator[tuple[FakeSocketMode, list[str]]]:
+    """The stand-in, with a Bolt app pointed at it that records the names of emoji_changed events."""
+    # Each client's first connection only works on the third try
+    with FakeSocketMode(open_failures=2).running() as fake:
+        monkeypatch.setattr(app_config, "slack_api_url", fake.url)
+        # So a dropped connection is noticed quickly
+        monkeypatch.setattr(app_config, "socket_mode_ping_interval", timedelta(seconds=0.1))
+
+        seen: list[str] = []
+        app = App(client=WebClient(token="xoxb-test", base_url=fake.url), signing_secret="test")  # noqa: S106
+        app.event("emoji_changed")(lambda event: seen.append(event["name"]))
+        monkeypatch.setattr(socket_mode, "get_slack_app", lambda: app)
+
+        yield fake, seen
+
+
+def emoji_changed(name: str) -> dict[str, Any]:
+    return {"type": "emoji_changed", "subtype": "add", "name": name, "value": f"https://emoji.example.com/{name}.png"}
+
+
+def test_envelopes_are_handled_and_acked(fake: tuple[FakeSocketMode, list[str]]):
+    server, seen = fake
+    client = connect("xapp-test", backoff=Backoff(initial=0.01))
+    try:
+        envelopes = [server.send_event(emoji_changed(f"emoji-{i}")) for i in range(20)]
+
+        server.wait_for(lambda: server.acked.issuperset(envelopes))
+        server.wait_for(lambda: len(seen) == len(envelopes))
+        assert sorted(seen) == sorted(f"emoji-{i}" for i in range(20))
+    finally:
+        client.close()
+
+
+def test_reconnects_with_backoff(fake: tuple[FakeSocketMode, list[str]]):
+    server, seen = fake
+    client = connect("xapp-test", backoff=Backoff(initial=0.01))
+    try:
+        assert server.opened == 1
+
+        server.open_failures = 3
+        server.drop()
+        server.wait_for(lambda: server.opened == 2)  # noqa: PLR2004
+        server.wait_for(client.is_connected)
+
+        server.ask_to_reconnect()
+        server.wait_for(lambda: server.opened == 3)  # noqa: PLR2004
+
+        envelope = server.send_event(emoji_changed("after-reconnecting"))
+        server.wait_for(lambda: envelope in server.acked)
+        server.wait_for(lambda: seen == ["after-reconnecting"])
+    finally:
+        client.close()
+
+
+def test_backoff_doubles_up_to_the_maximum_and_resets():
+    backoff = Backoff(initial=1, maximum=4)
+
+    delays = [backoff.next_delay() for _ in range(5)]
+    assert all(0 <= delay <= limit for delay, limit in zip(delays, [1, 2, 4, 4, 4], strict=True))
+
+    backoff.reset()
+    assert backoff.next_delay() <= 1
@@ -0,0 +1,85 @@
+"""Consumes the queue of emoji_changed events that the web process fills in queue mode, see event_queue.py.
+
+SLACK_APP_QUEUE_MODE=true python worker.py
+"""
+
+from concurrent.futures import wait
+import os
+import signal
+import socket
+import threading
+
+import structlog
+
+from catalog import catalog_for
+from config import app_config
+from digest import flush_overdue_digests
+from event_queue import EmojiEventJob, event_queue, run_consumer
+from idemptotency import forget_handled
+from logging_config import configure_logging
+from slack_app import process_emoji_changed, tenant_clients
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+
+def handle_job(job: EmojiEventJob) -> None:
+    client, user_client = tenant_clients(
+        job.enterprise_id,
+        job.team_id,
+        is_enterprise_install=job.is_enterprise_install,
+    )
+
+    posts = process_emoji_changed(
+        client,
+        user_client,
+        job.event,
+        catalog_for(job.enterprise_id, job.team_id, is_enterprise_tenant=job.is_enterprise_install),
+        enterprise_id=job.enterprise_id,
+        team_id=job.team_id,
+    )
+    # Only ack the job once every post has gone out (or failed), so one channel failing doesn't cut the others short
+    done, not_done = wait(posts, timeout=app_config.queue_post_timeout.total_seconds())
+    if any(posted.exception() is not None for posted in done):
+        # has_handled marked the emoji before anything was posted, so the retry would otherwise skip it. It only posts
+        # to the channels that failed, as those that succeeded were recorded by mark_posted
+        forget_handled([job.event["name"]])
+    if not_done:
+        # Those may still go out, so aren't forgotten, but the consumer needn't wait on them any longer
+        msg = f"{len(not_done)} of {len(posts)} posts still going out after {app_config.queue_post_timeout}"
+        raise TimeoutError(msg)
+    for posted in posts:
+        posted.result()
+
+
+def start_consumers(stop: threading.Event, concurrency: int | None = None) -> list[threading.Thread]:
+    queue = event_queue()
+    consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+    threads = [
+        threading.Thread(
+            target=run_consumer,
+            args=(queue, f"{consumer_prefix}-{i}", handle_job, stop),
+            name=f"event-queue-consumer-{i}",
+            daemon=True,
+        )
+        for i in range(concurrency or app_config.queue_concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+
+    return threads
+
+
+if __name__ == "__main__":
+    configure_logging()
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    if app_config.digest_window:
+        # Any a consumer that died left behind
+        flush_overdue_digests(lambda enterprise_id, team_id: tenant_clients(enterprise_id, team_id)[0])
+
+    for thread in start_consumers(stop):
+        thread.join()
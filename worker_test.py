@@ -0,0 +1,115 @@
+from concurrent.futures import Future
+from datetime import timedelta
+from typing import Any
+import uuid
+
+import fakeredis
+import pytest
+from slack_sdk.errors import SlackApiError
+
+from catalog import EmojiCatalog
+from catalog_test import FakeClient
+from config import app_config
+from event_queue import EmojiEventJob, EmojiEventQueue
+from outbound_test import response
+from routing import RouteRule
+import worker
+
+
+class FlakyClient:
+    """chat_postMessage, failing the first `failures` calls and recording the rest."""
+
+    def __init__(self, failures: int) -> None:
+        self.token = "xoxb-test"  # noqa: S105
+        self.retry_handlers: list[Any] = []
+        self.failures = [500] * failures
+        self.posted: list[str] = []
+
+    def chat_postMessage(self, *, channel: str, **_kwargs: Any) -> Any:  # noqa: ANN401, N802
+        if self.failures:
+            msg = "internal_error"
+            raise SlackApiError(msg, response(self.failures.pop()))
+        self.posted.append(channel)
+        return response(200)
+
+
+def test_failed_post_is_posted_by_the_redelivery(monkeypatch: pytest.MonkeyPatch):
+    name = f"party-{uuid.uuid4()}"
+    url = f"https://example.com/{name}.png"
+    catalog_client = FakeClient({name: url})
+    catalog = EmojiCatalog(resync_interval=timedelta(hours=1))
+    catalog.refresh(catalog_client)  # type: ignore[arg-type]
+
+    client = FlakyClient(failures=1)
+    monkeypatch.setattr(worker, "tenant_clients", lambda *_args, **_kwargs: (client, catalog_client))
+    monkeypatch.setattr(worker, "catalog_for", lambda *_args, **_kwargs: catalog)
+
+    queue = EmojiEventQueue(fakeredis.FakeRedis(), max_attempts=3, claim_idle=timedelta(0))
+    queue.ensure_group()
+    queue.enqueue(
+        EmojiEventJob(
+            event={"type": "emoji_changed", "subtype": "add", "name": name, "value": url, "event_ts": "1.0"},
+            team_id="T123",
+        ),
+    )
+
+    assert queue.consume("consumer-1", worker.handle_job, block=None) == 0
+    assert client.posted == []
+
+    assert queue.consume("consumer-1", worker.handle_job, block=None) == 1
+    assert client.posted == ["#emoji-papertrail"]
+    assert queue.redis_client.xpending(queue.stream, queue.group)["pending"] == 0
+
+
+def test_redelivery_only_posts_to_the_channels_that_failed(monkeypatch: pytest.MonkeyPatch):
+    name = f"party-{uuid.uuid4()}"
+    url = f"https://example.com/{name}.png"
+    catalog_client = FakeClient({name: url})
+    catalog = EmojiCatalog(resync_interval=timedelta(hours=1))
+    catalog.refresh(catalog_client)  # type: ignore[arg-type]
+
+    client = FlakyClient(failures=0)
+    failing = {"#backend-emoji"}
+
+    def chat_postMessage(*, channel: str, **kwargs: Any) -> Any:  # noqa: ANN401, N802
+        if channel in failing:
+            failing.remove(channel)
+            msg = "internal_error"
+            raise SlackApiError(msg, response(500))
+        return FlakyClient.chat_postMessage(client, channel=channel, **kwargs)
+
+    monkeypatch.setattr(client, "chat_postMessage", chat_postMessage)
+    monkeypatch.setattr(worker, "tenant_clients", lambda *_args, **_kwargs: (client, catalog_client))
+    monkeypatch.setattr(worker, "catalog_for", lambda *_args, **_kwargs: catalog)
+    monkeypatch.setattr(app_config, "routes", [RouteRule(channels=["#frontend-emoji", "#backend-emoji"])])
+
+    queue = EmojiEventQueue(fakeredis.FakeRedis(), max_attempts=3, claim_idle=timedelta(0))
+    queue.ensure_group()
+    queue.enqueue(
+        EmojiEventJob(
+            event={"type": "emoji_changed", "subtype": "add", "name": name, "value": url, "event_ts": "1.0"},
+            team_id="T123",
+        ),
+    )
+
+    assert queue.consume("consumer-1", worker.handle_job, block=None) == 0
+    assert client.posted == ["#frontend-emoji"]
+
+    assert queue.consume("consumer-1", worker.handle_job, block=None) == 1
+    assert client.posted == ["#frontend-emoji", "#backend-emoji"]
+
+
+def test_posts_that_never_finish_fail_the_delivery(monkeypatch: pytest.MonkeyPatch):
+    name = f"party-{uuid.uuid4()}"
+    url = f"https://example.com/{name}.png"
+    catalog = EmojiCatalog(resync_interval=timedelta(hours=1))
+    catalog.refresh(FakeClient({name: url}))  # type: ignore[arg-type]
+
+    monkeypatch.setattr(worker, "tenant_clients", lambda *_args, **_kwargs: (None, None))
+    monkeypatch.setattr(worker, "catalog_for", lambda *_args, **_kwargs: catalog)
+    monkeypatch.setattr(worker, "process_emoji_changed", lambda *_args, **_kwargs: [Future()])
+    monkeypatch.setattr(app_config, "queue_post_timeout", timedelta(seconds=0.1))
+
+    event = {"type": "emoji_changed", "subtype": "add", "name": name, "value": url, "event_ts": "1.0"}
+    with pytest.raises(TimeoutError):
+        worker.handle_job(EmojiEventJob(event=event, team_id="T123"))